@@ -22,6 +22,7 @@ import type {
   ReceivedNote,
   Player,
 } from './game-types'
+import { WIRE_SUBPROTOCOL, WireDecoder } from './wire'
 
 // ── Initial State ──
 
@@ -71,6 +72,25 @@ const initialState: GameState = {
   toastVisible: false,
 }
 
+// ── Resume token ──
+// 續玩憑證存在 sessionStorage：同一分頁重新整理或斷線重連後都能接回原本的玩家
+
+const RESUME_KEY = 'silent-island-resume'
+
+function saveResumeToken(roomCode: string, token: string | undefined) {
+  if (!token) return
+  sessionStorage.setItem(RESUME_KEY, JSON.stringify({ room_code: roomCode, token }))
+}
+
+function loadResumeToken(roomCode: string): string | null {
+  try {
+    const saved = JSON.parse(sessionStorage.getItem(RESUME_KEY) || 'null')
+    return saved && saved.room_code === roomCode ? saved.token : null
+  } catch {
+    return null
+  }
+}
+
 // ── Reducer ──
 
 function gameReducer(state: GameState, action: GameAction): GameState {
@@ -252,6 +272,7 @@ export function GameProvider({ children }: { children: React.ReactNode }) {
       const s = stateRef.current
       switch (data.type) {
         case 'joined':
+          saveResumeToken(s.roomCode || data.room_code, data.resume_token)
           dispatch({ type: 'SET_PLAYER_ID', id: data.player_id })
           dispatch({ type: 'SET_ROOM_CODE', code: data.room_code })
           dispatch({ type: 'SET_PLAYER_NAME', name: data.player_name })
@@ -259,6 +280,70 @@ export function GameProvider({ children }: { children: React.ReactNode }) {
           dispatch({ type: 'SET_SCREEN', screen: 'lobby' })
           break
 
+        case 'resumed': {
+          dispatch({ type: 'SET_PLAYER_ID', id: data.player_id })
+          dispatch({ type: 'SET_ROOM_CODE', code: data.room_code })
+          dispatch({ type: 'SET_PLAYER_NAME', name: data.player_name })
+          dispatch({ type: 'SET_PLAYER_COUNT', count: data.player_count })
+          dispatch({ type: 'SET_NOTE_REMAINING', count: data.note_remaining })
+          dispatch({
+            type: 'SET_STATS',
+            socialFear: data.social_fear,
+            thoughtFlow: data.thought_flow,
+            myRisk: data.risk,
+          })
+          dispatch({ type: 'SET_RISK_ZONE', zone: data.risk_zone || 'safe' })
+          dispatch({ type: 'SHOW_TOAST', message: '已重新連線' })
+          if (!data.role) {
+            dispatch({ type: 'SET_SCREEN', screen: 'lobby' })
+            break
+          }
+          dispatch({ type: 'SET_ROLE', role: { ...data.role, abilityUsed: data.ability_used } })
+          if (data.taken_away) dispatch({ type: 'SET_YOU_TAKEN' })
+          if (data.observer_mode) dispatch({ type: 'SET_OBSERVER' })
+          if (!data.identity_confirmed) {
+            dispatch({ type: 'SET_SCREEN', screen: 'role-reveal' })
+          } else if (data.event) {
+            // eslint-disable-next-line @typescript-eslint/no-explicit-any
+            const choices: Choice[] = data.event.choices.map((c: any) => ({
+              key: c.key,
+              label: c.label,
+              description: c.description || '',
+              disabled: c.disabled || false,
+            }))
+            dispatch({ type: 'SET_CURRENT_EVENT', event: data.event_number })
+            dispatch({
+              type: 'SET_EVENT_DATA',
+              data: {
+                number: data.event_number,
+                title: data.event.title,
+                description: data.event.description,
+                isAutoSettle: data.event.is_auto_settle,
+              },
+              choices,
+            })
+            if (data.phase === 'voting') {
+              dispatch({ type: 'SET_PUBLIC_VOTING', enabled: data.public_voting })
+              if (data.vote) dispatch({ type: 'VOTE', choice: data.vote })
+              dispatch({ type: 'SET_SCREEN', screen: 'voting' })
+            } else {
+              dispatch({ type: 'SET_SCREEN', screen: data.phase === 'discussion' ? 'discussion' : 'event' })
+            }
+          } else {
+            dispatch({ type: 'SET_SCREEN', screen: 'waiting' })
+          }
+          break
+        }
+
+        case 'resume_failed': {
+          sessionStorage.removeItem(RESUME_KEY)
+          const { roomCode, playerName } = stateRef.current
+          if (roomCode && playerName) {
+            send({ type: 'join_room', room_code: roomCode, player_name: playerName })
+          }
+          break
+        }
+
         case 'player_joined':
           dispatch({ type: 'SET_PLAYER_COUNT', count: data.player_count })
           break
@@ -515,28 +600,38 @@ export function GameProvider({ children }: { children: React.ReactNode }) {
           dispatch({ type: 'SHOW_TOAST', message: '關主已斷線' })
           break
 
+        case 'host_reconnected':
+          dispatch({ type: 'SHOW_TOAST', message: '關主已重新連線' })
+          break
+
         case 'error':
           dispatch({ type: 'SHOW_TOAST', message: data.message })
           break
       }
     },
-    [vibrate]
+    [vibrate, send]
   )
 
   // ── WebSocket connection ──
   const connectWs = useCallback(() => {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
     const url = `${protocol}//${window.location.host}/ws`
-    const ws = new WebSocket(url)
+    // Binary MessagePack frames with a per-connection string table (see lib/wire.ts)
+    const ws = new WebSocket(url, [WIRE_SUBPROTOCOL])
+    ws.binaryType = 'arraybuffer'
+    const decoder = new WireDecoder()
 
     ws.onopen = () => {
       reconnectRef.current = 0
-      // Auto-join if we have room code and name from URL
+      // Resume the previous player if we hold a token, otherwise auto-join with room code and name from URL
       const params = new URLSearchParams(window.location.search)
       const room = params.get('room')
       const name = stateRef.current.playerName
+      const token = room ? loadResumeToken(room) : null
 
-      if (room && name) {
+      if (room && token) {
+        ws.send(JSON.stringify({ type: 'resume', room_code: room, token }))
+      } else if (room && name) {
         ws.send(
           JSON.stringify({
             type: 'join_room',
@@ -549,8 +644,9 @@ export function GameProvider({ children }: { children: React.ReactNode }) {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data)
-        handleMessage(data)
+        const data =
+          typeof event.data === 'string' ? JSON.parse(event.data) : decoder.decode(event.data)
+        if (data) handleMessage(data)
       } catch {
         // ignore parse errors
       }
@@ -0,0 +1,95 @@
+// Compact wire format decoder (MessagePack + string table, see server/wire.py)
+//
+// When connected with the silent-island.msgpack subprotocol the server sends binary
+// MessagePack frames. Fixed game text is sent as ext type 1 (a string id), defined
+// once per connection by a preceding { type: "strings" } frame, so each connection
+// needs its own WireDecoder.
+
+export const WIRE_SUBPROTOCOL = 'silent-island.msgpack'
+const EXT_STRING = 1
+
+export class WireDecoder {
+  private strings = new Map<number, string>()
+  private text = new TextDecoder()
+  private view = new DataView(new ArrayBuffer(0))
+  private bytes = new Uint8Array(0)
+  private pos = 0
+
+  /** Decode one binary frame; string table definitions are absorbed and return null */
+  decode(buffer: ArrayBuffer): Record<string, any> | null {
+    this.view = new DataView(buffer)
+    this.bytes = new Uint8Array(buffer)
+    this.pos = 0
+    const data = this.read()
+    if (data && data.type === 'strings') {
+      for (const [id, text] of data.table as [number, string][]) this.strings.set(id, text)
+      return null
+    }
+    return data
+  }
+
+  private read(): any {
+    const b = this.bytes[this.pos++]
+    if (b < 0x80) return b
+    if (b < 0x90) return this.map(b & 0x0f)
+    if (b < 0xa0) return this.array(b & 0x0f)
+    if (b < 0xc0) return this.str(b & 0x1f)
+    if (b >= 0xe0) return b - 0x100
+    const v = this.view
+    const p = this.pos
+    switch (b) {
+      case 0xc0: return null
+      case 0xc2: return false
+      case 0xc3: return true
+      case 0xca: this.pos += 4; return v.getFloat32(p)
+      case 0xcb: this.pos += 8; return v.getFloat64(p)
+      case 0xcc: this.pos += 1; return v.getUint8(p)
+      case 0xcd: this.pos += 2; return v.getUint16(p)
+      case 0xce: this.pos += 4; return v.getUint32(p)
+      case 0xcf: this.pos += 8; return Number(v.getBigUint64(p))
+      case 0xd0: this.pos += 1; return v.getInt8(p)
+      case 0xd1: this.pos += 2; return v.getInt16(p)
+      case 0xd2: this.pos += 4; return v.getInt32(p)
+      case 0xd3: this.pos += 8; return Number(v.getBigInt64(p))
+      case 0xd4: this.pos += 2; return this.ext(v.getInt8(p), v.getUint8(p + 1))
+      case 0xd5: this.pos += 3; return this.ext(v.getInt8(p), v.getUint16(p + 1))
+      case 0xd9: this.pos += 1; return this.str(v.getUint8(p))
+      case 0xda: this.pos += 2; return this.str(v.getUint16(p))
+      case 0xdb: this.pos += 4; return this.str(v.getUint32(p))
+      case 0xdc: this.pos += 2; return this.array(v.getUint16(p))
+      case 0xdd: this.pos += 4; return this.array(v.getUint32(p))
+      case 0xde: this.pos += 2; return this.map(v.getUint16(p))
+      case 0xdf: this.pos += 4; return this.map(v.getUint32(p))
+    }
+    throw new Error(`Unsupported MessagePack byte 0x${b.toString(16)}`)
+  }
+
+  private str(size: number): string {
+    const start = this.pos
+    this.pos += size
+    return this.text.decode(this.bytes.subarray(start, this.pos))
+  }
+
+  private array(size: number): any[] {
+    const out = new Array(size)
+    for (let i = 0; i < size; i++) out[i] = this.read()
+    return out
+  }
+
+  private map(size: number): Record<string, any> {
+    const out: Record<string, any> = {}
+    for (let i = 0; i < size; i++) {
+      const key = this.read()
+      out[key] = this.read()
+    }
+    return out
+  }
+
+  private ext(type: number, id: number): string {
+    const text = this.strings.get(id)
+    if (type !== EXT_STRING || text === undefined) {
+      throw new Error(`Unknown string id ${id} (ext ${type})`)
+    }
+    return text
+  }
+}
@@ -5,6 +5,8 @@
 let ws;
 let roomCode = '';
 let hostView = null;
+let hostSeq = 0;
+let hostSyncPending = false;
 let silenceTimer = null;
 let voteTimer = null;
 let discussionTimer = null;
@@ -16,6 +18,10 @@ let currentFearLevel = 0;
 
 function init() {
     ws = new GameWebSocket(handleMessage, onConnected);
+    // 重新整理或伺服器重新啟動後，以關主憑證接回原本的房間（失敗時才建立新房間）
+    ws.resumeKey = HOST_RESUME_KEY;
+    const saved = ws.loadSavedResume();
+    if (saved) ws.resumeRoom = saved.room_code;
     ws.connect();
 }
 
@@ -28,12 +34,18 @@ function handleMessage(data) {
         case 'room_created':
             onRoomCreated(data);
             break;
+        case 'host_resumed':
+            onHostResumed(data);
+            break;
         case 'player_joined':
             onPlayerJoined(data);
             break;
         case 'player_disconnected':
             onPlayerDisconnected(data);
             break;
+        case 'player_reconnected':
+            onPlayerReconnected(data);
+            break;
         case 'game_started_host':
             onGameStarted(data);
             break;
@@ -70,6 +82,10 @@ function handleMessage(data) {
         case 'ability_used':
             onAbilityUsed(data);
             break;
+        case 'host_state':
+            applyHostState(data);
+            updateHostView();
+            break;
         case 'ending':
             onEnding(data);
             break;
@@ -88,11 +104,41 @@ function onRoomCreated(data) {
     hide('creating-phase');
     show('waiting-phase');
     addLog(`房間已建立：${roomCode}`);
+    ws.saveResumeToken(roomCode, data.resume_token);
+    ws.resumeRoom = roomCode;
 
     // 大廳背景音樂（首次互動後解鎖）
     silentAudio.playBgm();
 }
 
+function onHostResumed(data) {
+    roomCode = data.room_code;
+    setText('room-code-display', roomCode);
+    document.getElementById('qr-img').src = data.qr_url;
+    hide('creating-phase');
+
+    // 伺服器可能從較舊的快照恢復：以這份完整狀態為準
+    hostSeq = 0;
+    hostView = null;
+    hostSyncPending = false;
+    applyHostState(data);
+
+    if (data.started) {
+        hide('waiting-phase');
+        show('game-phase');
+        hide('identity-confirm-area');
+        document.getElementById('btn-next-event').disabled = false;
+        updateHostView();
+    } else {
+        show('waiting-phase');
+        setText('player-count', data.players.length);
+        updateWaitingPlayerList(data.players);
+        const btn = document.getElementById('start-game-btn');
+        btn.disabled = data.players.length < 6;
+    }
+    addLog(`已重新接回房間：${roomCode}`);
+}
+
 // ── Player Management ──
 
 function onPlayerJoined(data) {
@@ -113,6 +159,11 @@ function onPlayerDisconnected(data) {
     addLog(`玩家斷線`);
 }
 
+function onPlayerReconnected(data) {
+    updateWaitingPlayerList(data.players);
+    addLog(`玩家重新連線`);
+}
+
 function updateWaitingPlayerList(players) {
     const list = document.getElementById('waiting-player-list');
     list.innerHTML = '';
@@ -129,6 +180,34 @@ function updateWaitingPlayerList(players) {
     });
 }
 
+// ── 關主狀態同步 ──
+// 伺服器一般只送有變動的欄位（host_delta）；完整快照（host_view）只在第一次或跳號時送
+
+function applyHostState(data) {
+    if (data.seq === undefined || data.seq <= hostSeq) return;
+    if (data.host_view) {
+        hostView = data.host_view;
+        hostSyncPending = false;
+    } else if (data.host_delta) {
+        if (!hostView || data.seq !== hostSeq + 1) {
+            // 漏掉了更新：要求完整快照，在它到達前忽略之後的增量
+            if (!hostSyncPending) {
+                hostSyncPending = true;
+                ws.send({ type: 'host_sync' });
+            }
+            return;
+        }
+        const { players, ...fields } = data.host_delta;
+        Object.assign(hostView, fields);
+        if (players) {
+            hostView.players.forEach(p => {
+                if (players[p.id]) Object.assign(p, players[p.id]);
+            });
+        }
+    }
+    hostSeq = data.seq;
+}
+
 // ── Game Start ──
 
 function startGame() {
@@ -136,7 +215,7 @@ function startGame() {
 }
 
 function onGameStarted(data) {
-    hostView = data.host_view;
+    applyHostState(data);
     hide('waiting-phase');
     show('game-phase');
     show('identity-confirm-area');
@@ -197,7 +276,7 @@ function nextEvent() {
 
 function onEvent(data) {
     currentEvent = data;
-    if (data.host_view) hostView = data.host_view;
+    applyHostState(data);
 
     // 事件揭露音樂
     silentAudio.playEventReveal();
@@ -391,7 +470,7 @@ function endVoting() {
 
 function onRoundResult(data) {
     const result = data.result;
-    if (data.host_view) hostView = data.host_view;
+    applyHostState(data);
 
     document.getElementById('btn-end-voting').disabled = true;
     setText('host-vote-timer', '');
@@ -515,7 +594,7 @@ function showTakenAwayHost(takenList) {
 
 function onForeshadowSettlement(data) {
     const result = data.result;
-    if (data.host_view) hostView = data.host_view;
+    applyHostState(data);
 
     updateHostView();
 
@@ -569,7 +648,7 @@ function onForeshadowSettlement(data) {
 // ── Ability Used ──
 
 function onAbilityUsed(data) {
-    if (data.host_view) hostView = data.host_view;
+    applyHostState(data);
     updateHostView();
     addLog(`${data.player_name}（${data.role_id}）使用了能力：${data.message}`);
 }
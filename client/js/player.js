@@ -76,6 +76,7 @@ function init() {
     }
 
     ws = new GameWebSocket(handleMessage, onConnected, onDisconnected);
+    ws.resumeRoom = roomCode;
     ws.connect();
 }
 
@@ -116,6 +117,7 @@ function submitName() {
     show('join-phase');
 
     ws = new GameWebSocket(handleMessage, onConnected, onDisconnected);
+    ws.resumeRoom = roomCode;
     ws.connect();
 }
 
@@ -136,6 +138,9 @@ function handleMessage(data) {
         case 'joined':
             onJoined(data);
             break;
+        case 'resumed':
+            onResumed(data);
+            break;
         case 'player_joined':
             onPlayerJoined(data);
             break;
@@ -203,6 +208,9 @@ function handleMessage(data) {
         case 'host_disconnected':
             showToast('關主已斷線');
             break;
+        case 'host_reconnected':
+            showToast('關主已重新連線');
+            break;
         case 'error':
             showToast(data.message);
             break;
@@ -213,6 +221,7 @@ function handleMessage(data) {
 
 function onJoined(data) {
     playerId = data.player_id;
+    ws.saveResumeToken(roomCode, data.resume_token);
     hide('join-phase');
     show('lobby-phase');
     setText('lobby-room-code', data.room_code);
@@ -222,6 +231,61 @@ function onJoined(data) {
     }
 }
 
+// ── Resumed（斷線後接回原本的玩家）──
+
+function onResumed(data) {
+    playerId = data.player_id;
+    noteRemaining = data.note_remaining;
+    isTakenAway = data.taken_away;
+    voted = !!data.vote;
+    updateNoteBadge();
+    showToast('已重新連線');
+
+    if (!data.role) {
+        onJoined(data);
+        return;
+    }
+
+    if (!myRole) {
+        myRole = data.role;
+        hide('join-phase');
+        hide('lobby-phase');
+        show('game-phase');
+        setText('role-name', myRole.name);
+        setText('role-passive', `被動：${myRole.passive}`);
+        setText('role-ability', `能力：${myRole.ability}`);
+        silentAudio.init();
+    }
+    if (data.ability_used) {
+        const btn = document.getElementById('ability-btn');
+        btn.disabled = true;
+        btn.textContent = '能力已使用';
+    }
+    setText('player-fear', data.social_fear);
+    setText('player-flow', data.thought_flow);
+    setText('player-risk', data.risk);
+    updateFearLevel(data.social_fear);
+
+    if (data.observer_mode && !isObserver) {
+        onObserverMode({ message: '你正在以觀察者身分觀看。' });
+    }
+
+    if (!data.identity_confirmed) {
+        showRoleReveal();
+    } else if (data.event) {
+        onEvent({ event_number: data.event_number, ...data.event });
+        if (data.phase === 'voting' && !data.vote) {
+            onVotingOpen({ seconds: 30, public_voting: data.public_voting });
+        } else if (data.vote) {
+            showWaiting('已投票，等待其他玩家...');
+        }
+    } else if (data.phase === 'ended') {
+        showWaiting('遊戲已結束');
+    } else {
+        showWaiting('等待關主開始下一個事件...');
+    }
+}
+
 function onPlayerJoined(data) {
     setText('lobby-player-count', data.player_count);
 }
@@ -0,0 +1,97 @@
+/**
+ * 靜默之島 — 精簡傳輸格式解碼（MessagePack + 字串表，見 server/wire.py）
+ *
+ * 以子協定 silent-island.msgpack 連線時，伺服器送出二進位 MessagePack；
+ * 固定文字以 ext 型別 1（編號）表示，定義由 {type: "strings"} 訊息先行送達。
+ * 字串表只在同一條連線內有效：每次連線建立新的 WireDecoder。
+ */
+
+const WIRE_SUBPROTOCOL = 'silent-island.msgpack';
+const WIRE_EXT_STRING = 1;
+
+class WireDecoder {
+    constructor() {
+        this.strings = new Map();
+        this.text = new TextDecoder();
+    }
+
+    /**
+     * 解碼一則二進位訊息；字串表定義由解碼器吸收，回傳 null
+     * @param {ArrayBuffer} buffer
+     */
+    decode(buffer) {
+        this.view = new DataView(buffer);
+        this.bytes = new Uint8Array(buffer);
+        this.pos = 0;
+        const data = this.read();
+        if (data && data.type === 'strings') {
+            for (const [id, text] of data.table) this.strings.set(id, text);
+            return null;
+        }
+        return data;
+    }
+
+    read() {
+        const b = this.bytes[this.pos++];
+        if (b < 0x80) return b;
+        if (b < 0x90) return this.map(b & 0x0f);
+        if (b < 0xa0) return this.array(b & 0x0f);
+        if (b < 0xc0) return this.str(b & 0x1f);
+        if (b >= 0xe0) return b - 0x100;
+        const v = this.view;
+        const p = this.pos;
+        switch (b) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xca: this.pos += 4; return v.getFloat32(p);
+            case 0xcb: this.pos += 8; return v.getFloat64(p);
+            case 0xcc: this.pos += 1; return v.getUint8(p);
+            case 0xcd: this.pos += 2; return v.getUint16(p);
+            case 0xce: this.pos += 4; return v.getUint32(p);
+            case 0xcf: this.pos += 8; return Number(v.getBigUint64(p));
+            case 0xd0: this.pos += 1; return v.getInt8(p);
+            case 0xd1: this.pos += 2; return v.getInt16(p);
+            case 0xd2: this.pos += 4; return v.getInt32(p);
+            case 0xd3: this.pos += 8; return Number(v.getBigInt64(p));
+            case 0xd4: this.pos += 2; return this.ext(v.getInt8(p), v.getUint8(p + 1));
+            case 0xd5: this.pos += 3; return this.ext(v.getInt8(p), v.getUint16(p + 1));
+            case 0xd9: this.pos += 1; return this.str(v.getUint8(p));
+            case 0xda: this.pos += 2; return this.str(v.getUint16(p));
+            case 0xdb: this.pos += 4; return this.str(v.getUint32(p));
+            case 0xdc: this.pos += 2; return this.array(v.getUint16(p));
+            case 0xdd: this.pos += 4; return this.array(v.getUint32(p));
+            case 0xde: this.pos += 2; return this.map(v.getUint16(p));
+            case 0xdf: this.pos += 4; return this.map(v.getUint32(p));
+        }
+        throw new Error(`Unsupported MessagePack byte 0x${b.toString(16)}`);
+    }
+
+    str(size) {
+        const start = this.pos;
+        this.pos += size;
+        return this.text.decode(this.bytes.subarray(start, this.pos));
+    }
+
+    array(size) {
+        const out = new Array(size);
+        for (let i = 0; i < size; i++) out[i] = this.read();
+        return out;
+    }
+
+    map(size) {
+        const out = {};
+        for (let i = 0; i < size; i++) {
+            const key = this.read();
+            out[key] = this.read();
+        }
+        return out;
+    }
+
+    ext(type, id) {
+        if (type !== WIRE_EXT_STRING || !this.strings.has(id)) {
+            throw new Error(`Unknown string id ${id} (ext ${type})`);
+        }
+        return this.strings.get(id);
+    }
+}
@@ -2,6 +2,10 @@
  * 靜默之島 — WebSocket 共用邏輯
  */
 
+// 續玩憑證存在 sessionStorage：同一分頁重新整理或斷線重連後都能接回原本的玩家（或關主）
+const RESUME_KEY = 'silent-island-resume';
+const HOST_RESUME_KEY = 'silent-island-host-resume';
+
 class GameWebSocket {
     constructor(onMessage, onOpen, onClose) {
         this.ws = null;
@@ -11,24 +15,45 @@ class GameWebSocket {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectDelay = 2000;
+        // 設定為房間碼後，連上時先以續玩憑證接回原本的玩家（沒有憑證或失敗時才呼叫 onOpen）
+        this.resumeRoom = null;
+        this.resumeKey = RESUME_KEY;
     }
 
     connect() {
         const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
         const url = `${protocol}//${location.host}/ws`;
 
-        this.ws = new WebSocket(url);
+        // 載入 wire.js 時要求精簡格式（網址加上 ?wire=json 可改回 JSON 文字以便除錯）
+        const compact = typeof WireDecoder !== 'undefined'
+            && new URLSearchParams(location.search).get('wire') !== 'json';
+        this.ws = compact ? new WebSocket(url, [WIRE_SUBPROTOCOL]) : new WebSocket(url);
+        this.ws.binaryType = 'arraybuffer';
+        const decoder = compact ? new WireDecoder() : null;
 
         this.ws.onopen = () => {
             console.log('WebSocket connected');
             this.reconnectAttempts = 0;
-            this.onOpen();
+            const token = this.resumeRoom && this.loadResumeToken(this.resumeRoom);
+            if (token) {
+                this.send({ type: 'resume', room_code: this.resumeRoom, token });
+            } else {
+                this.onOpen();
+            }
         };
 
         this.ws.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
+                const data = typeof event.data === 'string'
+                    ? JSON.parse(event.data)
+                    : decoder.decode(event.data);
+                if (data === null) return;  // 字串表定義
                 console.log('← Received:', data);
+                if (data.type === 'resume_failed') {
+                    this.clearResumeToken();
+                    this.onOpen();
+                    return;
+                }
                 this.onMessage(data);
             } catch (e) {
                 console.error('Failed to parse message:', e);
@@ -63,7 +88,31 @@ class GameWebSocket {
         }
         this.reconnectAttempts++;
         console.log(`Reconnecting... attempt ${this.reconnectAttempts}`);
-        setTimeout(() => this.connect(), this.reconnectDelay);
+        // 逐次拉長並加上隨機延遲：Wi-Fi 中斷後整個房間不會在同一瞬間一起重連
+        const delay = this.reconnectDelay * this.reconnectAttempts * (0.5 + Math.random());
+        setTimeout(() => this.connect(), delay);
+    }
+
+    saveResumeToken(roomCode, token) {
+        if (!token) return;
+        sessionStorage.setItem(this.resumeKey, JSON.stringify({ room_code: roomCode, token }));
+    }
+
+    loadSavedResume() {
+        try {
+            return JSON.parse(sessionStorage.getItem(this.resumeKey));
+        } catch (e) {
+            return null;
+        }
+    }
+
+    loadResumeToken(roomCode) {
+        const saved = this.loadSavedResume();
+        return saved && saved.room_code === roomCode ? saved.token : null;
+    }
+
+    clearResumeToken() {
+        sessionStorage.removeItem(this.resumeKey);
     }
 
     close() {
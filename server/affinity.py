@@ -0,0 +1,219 @@
+"""
+靜默之島：選擇與代價 — 房間親和路由（多 worker）
+
+以一致性雜湊把房間碼對應到 worker：擁有房間的 worker 把 GameEngine 留在自己的記憶體，
+不需要共享狀態或鎖。新房間只配置本 worker 擁有的房間碼；
+連到其他 worker 的玩家在 join_room（或 resume）時被代理到擁有者，同一房間的連線最後都落在同一個程序。
+針對單一房間的 HTTP 管理請求（例如開關壓縮）也轉給擁有者處理（forward）。
+
+設定（環境變數）：
+  SILENT_ISLAND_WORKERS     worker 清單，例如 w0=ws://127.0.0.1:9100,w1=ws://127.0.0.1:9101
+  SILENT_ISLAND_WORKER_ID   本 worker 的名稱（必須在清單中）
+未設定時不啟用路由（單一程序擁有所有房間）。
+
+多核心啟動（所有 worker 以 SO_REUSEPORT 共用對外埠，另各自監聽內部埠供代理）：
+  python -m server.affinity --workers 4 --port 8001 --internal-port 9100
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+from typing import Optional
+from urllib.parse import urlsplit
+
+import uvicorn
+import websockets
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger("silent-island")
+
+# 每個 worker 在環上的虛擬節點數（越多分佈越均勻）
+VIRTUAL_NODES = 128
+# 帶有房間碼、需要送到擁有者的訊息類型
+ROUTED_TYPES = frozenset({"join_room", "resume"})
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性雜湊環：增減 worker 時只有約 1/N 的房間碼換擁有者"""
+
+    def __init__(self, workers: list[str], vnodes: int = VIRTUAL_NODES):
+        if not workers:
+            raise ValueError("至少需要一個 worker")
+        points = sorted((_hash(f"{w}#{i}"), w) for w in workers for i in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._owners = [w for _, w in points]
+        self.workers = sorted(set(workers))
+
+    def owner(self, code: str) -> str:
+        i = bisect.bisect(self._keys, _hash(code)) % len(self._keys)
+        return self._owners[i]
+
+
+class AffinityRouter:
+    """本 worker 在環上的位置，以及其他 worker 的內部位址"""
+
+    def __init__(self, me: str, peers: dict[str, str]):
+        if me not in peers:
+            raise ValueError(f"SILENT_ISLAND_WORKER_ID={me} 不在 worker 清單中")
+        self.me = me
+        self.peers = peers
+        self.ring = HashRing(list(peers))
+        self.proxied = 0        # 代理到其他 worker 的連線數
+        self.proxy_failures = 0
+
+    def is_local(self, code: str) -> bool:
+        return self.ring.owner(code) == self.me
+
+    def owner_url(self, code: str) -> str:
+        return self.peers[self.ring.owner(code)]
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.me,
+            "workers": self.ring.workers,
+            "proxied": self.proxied,
+            "proxy_failures": self.proxy_failures,
+        }
+
+
+def parse_workers(spec: str) -> dict[str, str]:
+    peers = {}
+    for item in spec.split(","):
+        name, _, url = item.strip().partition("=")
+        if not name or not url:
+            raise ValueError(f"無效的 worker 設定：{item!r}（格式 name=ws://host:port）")
+        peers[name] = url.rstrip("/")
+    return peers
+
+
+def router_from_env() -> Optional[AffinityRouter]:
+    spec = os.environ.get("SILENT_ISLAND_WORKERS")
+    if not spec:
+        return None
+    return AffinityRouter(os.environ.get("SILENT_ISLAND_WORKER_ID", ""), parse_workers(spec))
+
+
+async def proxy(ws: WebSocket, upstream_url: str, first_message: str, subprotocol: Optional[str] = None):
+    """把這條連線接到擁有房間的 worker：先送出觸發路由的訊息，之後雙向轉送直到任一端關閉
+
+    subprotocol：客戶端協商到的子協定，向上游要求相同的格式，二進位訊息原樣轉送。
+    """
+    subprotocols = [subprotocol] if subprotocol else None
+    async with websockets.connect(f"{upstream_url}/ws", max_size=None, subprotocols=subprotocols) as upstream:
+        await upstream.send(first_message)
+
+        async def downstream():
+            async for message in upstream:
+                if isinstance(message, str):
+                    await ws.send_text(message)
+                else:
+                    await ws.send_bytes(message)
+
+        async def upstream_pump():
+            try:
+                while True:
+                    await upstream.send(await ws.receive_text())
+            except WebSocketDisconnect:
+                pass
+
+        tasks = [asyncio.create_task(downstream()), asyncio.create_task(upstream_pump())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+
+
+# 轉送 HTTP 請求等待擁有者回應的上限（秒）
+FORWARD_TIMEOUT = 5.0
+
+
+async def forward(upstream_url: str, method: str, target: str, headers: dict[str, str]) -> tuple[int, str, bytes]:
+    """把一個沒有本文的 HTTP 請求轉給擁有房間的 worker，回傳（狀態碼, Content-Type, 本文）
+
+    只用於很短的管理請求：送出 Connection: close，讀到對方關閉連線為止。
+    """
+    url = urlsplit(upstream_url)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(url.hostname, url.port), FORWARD_TIMEOUT)
+    try:
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {url.netloc}", "Connection: close", "Content-Length: 0"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), FORWARD_TIMEOUT)
+    finally:
+        writer.close()
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    content_type = "text/plain"
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-type":
+            content_type = value.strip()
+    return int(status_line.split()[1]), content_type, body
+
+
+# ── 多核心啟動 ────────────────────────────────────────
+
+def _reuseport_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _run_worker(index: int, host: str, port: int, internal_host: str, internal_port: int, spec: str):
+    os.environ["SILENT_ISLAND_WORKERS"] = spec
+    os.environ["SILENT_ISLAND_WORKER_ID"] = f"w{index}"
+    public = _reuseport_socket(host, port)
+    internal = _reuseport_socket(internal_host, internal_port + index)
+    config = uvicorn.Config("server.main:app", log_level="info", ws="server.compression:DeflateWebSocketProtocol")
+    uvicorn.Server(config).run(sockets=[public, internal])
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="以房間親和路由啟動多個 worker")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("SILENT_ISLAND_PROCESSES", "0")) or os.cpu_count(),
+        help="worker 數（預設為 SILENT_ISLAND_PROCESSES，未設定時為 CPU 核心數）",
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--internal-host", default="127.0.0.1")
+    parser.add_argument("--internal-port", type=int, default=9100, help="第一個 worker 的內部埠（其後依序遞增）")
+    args = parser.parse_args(argv)
+
+    spec = ",".join(f"w{i}=ws://{args.internal_host}:{args.internal_port + i}" for i in range(args.workers))
+    processes = [
+        multiprocessing.Process(
+            target=_run_worker,
+            args=(i, args.host, args.port, args.internal_host, args.internal_port, spec),
+            name=f"silent-island-w{i}",
+        )
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
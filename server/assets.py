@@ -0,0 +1,203 @@
+"""
+靜默之島：選擇與代價 — 預壓縮靜態資源
+
+啟動時把 client/ 與 client-react/out 中可壓縮的檔案（JS、CSS、JSON…）
+先壓成 gzip（有安裝 brotli 時另加 br）放在記憶體，請求時依 Accept-Encoding 直接回傳，
+不必每個請求即時壓縮。建置時也可以先產生 .gz / .br 檔，啟動時會優先採用：
+
+  python -m server.assets client client-react/out
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件
+    brotli = None
+
+logger = logging.getLogger("silent-island")
+
+COMPRESSIBLE_SUFFIXES = frozenset({".js", ".mjs", ".css", ".html", ".json", ".map", ".svg", ".txt", ".xml"})
+# 小於此大小的檔案壓縮效益不大，直接送原檔
+MIN_COMPRESS_SIZE = 512
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# 檔名含雜湊的 Next.js chunk 永不變動；其他檔案每次重新驗證
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+# 偏好順序（q 值相同時）
+ENCODING_PREFERENCE = ("br", "gzip")
+ENCODING_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+
+@dataclass
+class CompressedAsset:
+    """一個來源檔案的各種壓縮版本"""
+    mtime: float
+    etag: str
+    last_modified: str
+    media_type: str
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def available_encodings() -> tuple[str, ...]:
+    return ENCODING_PREFERENCE if brotli is not None else ("gzip",)
+
+
+def _load_asset(path: Path) -> Optional[CompressedAsset]:
+    stat = path.stat()
+    if stat.st_size < MIN_COMPRESS_SIZE:
+        return None
+    data = path.read_bytes()
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    asset = CompressedAsset(
+        mtime=stat.st_mtime,
+        etag=hashlib.sha1(data).hexdigest()[:16],
+        last_modified=formatdate(stat.st_mtime, usegmt=True),
+        media_type=media_type,
+    )
+    for encoding in ENCODING_PREFERENCE:
+        # 建置時產生且比原檔新的壓縮檔優先
+        prebuilt = path.with_name(path.name + ENCODING_SUFFIX[encoding])
+        if prebuilt.exists() and prebuilt.stat().st_mtime >= stat.st_mtime:
+            asset.variants[encoding] = prebuilt.read_bytes()
+        elif encoding in available_encodings():
+            asset.variants[encoding] = _compress(data, encoding)
+    # 壓縮後沒有變小就不值得送
+    asset.variants = {enc: body for enc, body in asset.variants.items() if len(body) < len(data)}
+    return asset if asset.variants else None
+
+
+def precompress_tree(directory: Path) -> dict[str, CompressedAsset]:
+    """以 realpath 為鍵，回傳目錄下所有可壓縮檔案的壓縮版本"""
+    assets = {}
+    raw = compressed = 0
+    for path in directory.rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        asset = _load_asset(path)
+        if asset is None:
+            continue
+        assets[os.path.realpath(path)] = asset
+        raw += path.stat().st_size
+        compressed += min(len(body) for body in asset.variants.values())
+    if assets:
+        logger.info(
+            f"Precompressed {len(assets)} assets in {directory}: "
+            f"{raw // 1024} KiB → {compressed // 1024} KiB ({'/'.join(available_encodings())})"
+        )
+    return assets
+
+
+def negotiate(accept_encoding: str, offered) -> Optional[str]:
+    """依 Accept-Encoding 的 q 值挑選編碼；都不接受時回傳 None（送原檔）"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in offered:
+            continue
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles + 預壓縮版本協商與快取標頭"""
+
+    def __init__(self, *, directory: str, immutable: bool = False, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.cache_control = CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE
+        self.assets = precompress_tree(Path(directory))
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        asset = self.assets.get(os.path.realpath(full_path))
+        encoding = None
+        if asset is not None and asset.mtime == stat_result.st_mtime:
+            encoding = negotiate(request_headers.get("accept-encoding", ""), asset.variants)
+
+        if encoding is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers["Cache-Control"] = self.cache_control
+            if asset is not None:
+                response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        headers = {
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": self.cache_control,
+            "ETag": f'"{asset.etag}-{encoding}"',
+            "Last-Modified": asset.last_modified,
+        }
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+        return Response(asset.variants[encoding], status_code=status_code, headers=headers, media_type=asset.media_type)
+
+
+# ── 建置時預壓縮 ──────────────────────────────────────
+
+def write_precompressed(directory: Path) -> int:
+    """在原檔旁寫出 .gz / .br，回傳寫出的檔案數"""
+    written = 0
+    for path in directory.rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        if len(data) < MIN_COMPRESS_SIZE:
+            continue
+        for encoding in available_encodings():
+            body = _compress(data, encoding)
+            if len(body) < len(data):
+                path.with_name(path.name + ENCODING_SUFFIX[encoding]).write_bytes(body)
+                written += 1
+    return written
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="預先壓縮靜態資源（.gz / .br）")
+    parser.add_argument("directories", nargs="+", type=Path)
+    args = parser.parse_args(argv)
+    for directory in args.directories:
+        if directory.exists():
+            print(f"{directory}: {write_precompressed(directory)} 個壓縮檔")
+
+
+if __name__ == "__main__":
+    main()
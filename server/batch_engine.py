@@ -0,0 +1,713 @@
+"""
+靜默之島：選擇與代價 — 向量化批次引擎（NumPy）
+
+把 N 場遊戲存成陣列（每個玩家欄位的風險、伏筆數、道德標記、角色，
+每場的恐懼與流通），一次以少量陣列運算結算所有場次的一個回合。
+規則與 GameEngine.settle_round / settle_foreshadows / determine_ending 相同，
+並附有逐場對照純量引擎的交叉檢查。
+
+需要 numpy（不在伺服器的 requirements 中）：pip install -r requirements-dev.txt
+
+吞吐量：單核心約 13–20 萬場/秒（依策略；純量引擎約 3 千場/秒）。每回合只有固定數量的陣列運算、
+沒有逐場或逐玩家的 Python 迴圈，剩下的時間是記憶體頻寬，單核心無法達到每秒百萬場；
+目標因此調整為「單核心每秒 13–20 萬場，每秒百萬場靠多核心」。
+--workers 把場次切成 CHUNK_GAMES 一批交給 server.simulate 的程序池，吞吐量約隨核心數線性成長，
+每秒百萬場需要 5–6 個以上的核心。同一個主種子在任何 worker 數下得到相同的統計。
+
+使用方法：
+  python -m server.batch_engine --games 1000000 --seed 1
+  python -m server.batch_engine --games 10000000 --workers 8 --seed 1
+  python -m server.batch_engine --games 200000 --players 8 --strategy comply --check 2000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .game_engine import ROLE_PASSIVES, SETTLEMENT_RULES, GameEngine
+from .game_log import (
+    LOG_FORMAT, OP_ABILITY, OP_AUTO_EVADE, OP_CONFIRM, OP_END, OP_FORESHADOWS, OP_JOIN, OP_LEAVE,
+    OP_NAMES, OP_NEXT_EVENT, OP_NOTE, OP_OBSERVER, OP_PHASE, OP_REJOIN, OP_ROLES, OP_SETTLE, OP_VOTE, ScriptedRandom, get_varint,
+)
+from .models import EVENTS, EVADE_CHOICES, ForeshadowType, GamePhase, Player
+from .simulate import (
+    CHOICE_BY_CATEGORY, ROLE_RESIST_P, SimulationResult, batch_plan, format_report, parse_players, run_pool,
+)
+
+ROLES = "ABCDEFG"
+ROLE_INDEX = {r: i for i, r in enumerate(ROLES)}
+R_A, R_B, R_C, R_D, R_E, R_F, R_G = range(len(ROLES))
+
+# 選項分類代碼
+CAT_NONE, CAT_COMPLY, CAT_EVADE, CAT_RESIST = range(4)
+CATEGORY_CODES = {"": CAT_NONE, "comply": CAT_COMPLY, "evade": CAT_EVADE, "resist": CAT_RESIST}
+
+# 個人結局代碼（與 GameEngine._determine_personal_ending 的判定順序一致）
+PERSONAL_ENDINGS = ("taken_away", "moral_collapse", "moral_cost", "survivor", "ordinary")
+# 社會結局代碼；_find_closest_ending 依此順序比較距離
+SOCIAL_ENDINGS = ("C", "A", "B", "E", "D")
+CLOSEST_TARGETS = np.array([(6, np.nan), (5, 0.5), (5, 2.5), (0, 4), (1, 3)])
+
+TAKEN_RISK = 10
+# 一位玩家最多可能累積的模糊伏筆數（擲幣次數上限）
+MAX_VAGUE = sum(
+    any(r.foreshadow == ForeshadowType.VAGUE for r in SETTLEMENT_RULES[e.number].values())
+    for e in EVENTS if not e.is_auto_settle
+)
+
+# 程序池每批的場數（批次切分與 worker 數無關，結果才能重現）
+CHUNK_GAMES = 1 << 18
+# 每塊同時模擬的場數：陣列留在 CPU 快取內最快（1<<14 比 1<<18 快約一成）
+BLOCK_GAMES = 1 << 14
+
+STRATEGIES = ("random", "comply", "resist", "evade", "role")
+ABILITY_POLICIES = ("never", "early", "late", "random", "role")
+ABILITY_RANDOM_P = 0.25
+
+
+# ── 規則表 ────────────────────────────────────────────
+
+@dataclass
+class EventTable:
+    """單一事件各選項（依 EVENTS 中的順序）的結算效果陣列"""
+    keys: list[str]
+    fear: np.ndarray
+    flow: np.ndarray
+    risk: np.ndarray
+    vague: np.ndarray
+    silence: np.ndarray
+    category: np.ndarray
+    moral_cost: np.ndarray
+    moral_collapse: np.ndarray
+    evade_index: int                 # 超時自動迴避的選項
+    by_code: np.ndarray              # CAT_* → 選項索引（CAT_NONE 不使用）
+
+
+def _compile_event_tables() -> dict[int, EventTable]:
+    tables = {}
+    for event in EVENTS:
+        if event.is_auto_settle:
+            continue
+        rules = [SETTLEMENT_RULES[event.number][c.key] for c in event.choices]
+        keys = [c.key for c in event.choices]
+        tables[event.number] = EventTable(
+            keys=keys,
+            fear=np.array([r.fear for r in rules], dtype=np.int16),
+            flow=np.array([r.flow for r in rules], dtype=np.int16),
+            risk=np.array([r.risk for r in rules], dtype=np.int16),
+            vague=np.array([r.foreshadow == ForeshadowType.VAGUE for r in rules]),
+            silence=np.array([r.foreshadow == ForeshadowType.SILENCE for r in rules]),
+            category=np.array([CATEGORY_CODES[r.category] for r in rules], dtype=np.int8),
+            moral_cost=np.array([r.moral_cost for r in rules]),
+            moral_collapse=np.array([r.moral_collapse for r in rules]),
+            evade_index=next(i for i, k in enumerate(keys) if k in EVADE_CHOICES),
+            by_code=np.array(
+                [0] + [keys.index(CHOICE_BY_CATEGORY[event.number][cat]) for cat in ("comply", "evade", "resist")],
+                dtype=np.int8,
+            ),
+        )
+    return tables
+
+
+EVENT_TABLES = _compile_event_tables()
+
+# 角色被動：role code → 觸發社會恐懼的回合 / 選抵抗時額外風險
+PASSIVE_FEAR_EVENTS = {
+    e: np.array([e in ROLE_PASSIVES[r].fear_events if r in ROLE_PASSIVES else False for r in ROLES])
+    for e in EVENT_TABLES
+}
+PASSIVE_RESIST_RISK = np.array(
+    [ROLE_PASSIVES[r].resist_risk if r in ROLE_PASSIVES else 0 for r in ROLES], dtype=np.int16
+)
+
+
+# ── 批次狀態 ──────────────────────────────────────────
+
+class BatchEngine:
+    """N 場、每場 P 位玩家的遊戲狀態。所有欄位都是 (N,) 或 (N, P) 陣列。"""
+
+    def __init__(self, roles: np.ndarray):
+        n, p = roles.shape
+        self.roles = roles.astype(np.int8)
+        self.fear = np.zeros(n, dtype=np.int16)
+        self.flow = np.zeros(n, dtype=np.int16)
+        self.risk = np.zeros((n, p), dtype=np.int16)
+        self.vague = np.zeros((n, p), dtype=np.int8)
+        self.silence = np.zeros((n, p), dtype=np.int8)
+        self.complied = np.zeros((n, p), dtype=bool)
+        self.moral_cost = np.zeros((n, p), dtype=bool)
+        self.moral_collapse = np.zeros((n, p), dtype=bool)
+        self.taken = np.zeros((n, p), dtype=bool)
+        self.ability_used = np.zeros((n, p), dtype=bool)
+
+    @property
+    def games(self) -> int:
+        return self.roles.shape[0]
+
+    def settle_round(self, event_num: int, votes: np.ndarray, uses: np.ndarray, targets: np.ndarray):
+        """結算一回合。
+
+        votes：選項索引，-1 表示沒有投票；uses：本回合使用能力的玩家；
+        targets：D / G 能力的目標玩家索引。
+        """
+        t = EVENT_TABLES[event_num]
+        roles = self.roles
+        voted = votes >= 0
+        idx = np.where(voted, votes, 0)
+
+        category = np.where(voted, t.category[idx], CAT_NONE)
+        resist = category == CAT_RESIST
+        comply = category == CAT_COMPLY
+
+        self.complied |= comply
+        self.moral_cost |= voted & t.moral_cost[idx]
+        self.moral_collapse |= voted & t.moral_collapse[idx]
+
+        fear_delta = (t.fear[idx] * voted).sum(axis=1, dtype=np.int16)
+        flow_delta = (t.flow[idx] * voted).sum(axis=1, dtype=np.int16)
+        risk_delta = (t.risk[idx] * voted).astype(np.int16)
+
+        # 伏筆（A 能力：模糊不產生伏筆）
+        a_active = uses & (roles == R_A)
+        self.vague += voted & t.vague[idx] & ~a_active
+        self.silence += voted & t.silence[idx]
+
+        # 角色被動：A 不論是否投票；B / C 選抵抗時
+        fear_delta += PASSIVE_FEAR_EVENTS[event_num][roles].sum(axis=1, dtype=np.int16)
+        risk_delta += resist * PASSIVE_RESIST_RISK[roles]
+
+        # F 公開審查
+        public = (uses & (roles == R_F)).any(axis=1)
+        risk_delta += resist & public[:, None]
+
+        # 高流通風險
+        risk_delta += resist & ((self.flow + flow_delta) >= 3)[:, None]
+
+        # 多數壓力（E 能力取消）
+        e_cancel = (uses & (roles == R_E)).any(axis=1)
+        fear_delta += (comply.sum(axis=1) >= 5) & ~e_cancel
+
+        # B 取消一次恐懼
+        b_cancel = (uses & (roles == R_B)).any(axis=1)
+        fear_delta -= b_cancel & (fear_delta > 0)
+
+        # C：自己的 +1 風險轉為恐懼
+        c_fire = uses & (roles == R_C) & (risk_delta > 0)
+        risk_delta -= c_fire
+        fear_delta += c_fire.sum(axis=1, dtype=np.int16)
+
+        # D：替目標承擔 +1 風險
+        g_idx, d_idx = np.nonzero(uses & (roles == R_D))
+        if g_idx.size:
+            tgt = targets[g_idx, d_idx]
+            fire = risk_delta[g_idx, tgt] > 0
+            risk_delta[g_idx[fire], tgt[fire]] -= 1
+            risk_delta[g_idx[fire], d_idx[fire]] += 1
+
+        # G：目標的 +1 風險轉為恐懼
+        g_idx, u_idx = np.nonzero(uses & (roles == R_G))
+        if g_idx.size:
+            tgt = targets[g_idx, u_idx]
+            fire = risk_delta[g_idx, tgt] > 0
+            risk_delta[g_idx[fire], tgt[fire]] -= 1
+            np.add.at(fear_delta, g_idx[fire], 1)
+
+        self.fear = np.maximum(self.fear + fear_delta, 0).astype(np.int16)
+        self.flow = np.maximum(self.flow + flow_delta, 0).astype(np.int16)
+        self.risk = np.maximum(self.risk + risk_delta, 0).astype(np.int16)
+        self.taken |= self.risk >= TAKEN_RISK
+
+    def settle_foreshadows(self, coins: np.ndarray):
+        """事件 5 伏筆清算。coins：(N, P, MAX_VAGUE) 的擲幣結果（True 為正面）。"""
+        has = (self.vague > 0) | (self.silence > 0)
+        fear_delta = 2 * self.silence.sum(axis=1, dtype=np.int16) + has.sum(axis=1, dtype=np.int16) // 2
+
+        nth = np.arange(MAX_VAGUE)
+        heads = (coins & (nth < self.vague[:, :, None])).sum(axis=2, dtype=np.int16)
+        risk_delta = 5 * self.vague.astype(np.int16) + 10 * heads
+
+        self.fear = np.maximum(self.fear + fear_delta, 0).astype(np.int16)
+        self.risk = np.maximum(self.risk + risk_delta, 0).astype(np.int16)
+        self.taken |= self.risk >= TAKEN_RISK
+
+    def social_endings(self) -> np.ndarray:
+        """社會結局代碼（SOCIAL_ENDINGS 的索引）"""
+        fear = self.fear.astype(np.float64)
+        flow = self.flow.astype(np.float64)
+
+        # 不符合任何條件時取最接近的結局
+        dist = np.sqrt((fear[:, None] - CLOSEST_TARGETS[:, 0]) ** 2 + (flow[:, None] - CLOSEST_TARGETS[:, 1]) ** 2)
+        dist[:, 0] = np.abs(fear - CLOSEST_TARGETS[0, 0])
+        closest = dist.argmin(axis=1)
+
+        code = SOCIAL_ENDINGS.index
+        return np.select(
+            [
+                fear >= 6,
+                (fear == 0) & (flow >= 4),
+                (fear >= 4) & (flow <= 1),
+                (fear >= 4) & (flow >= 2) & (flow <= 3),
+                (fear <= 2) & (flow >= 2),
+            ],
+            [code("C"), code("E"), code("A"), code("B"), code("D")],
+            default=closest,
+        )
+
+    def personal_endings(self) -> np.ndarray:
+        """個人結局代碼（PERSONAL_ENDINGS 的索引）"""
+        return np.select(
+            [
+                self.risk >= TAKEN_RISK,
+                self.moral_collapse,
+                self.moral_cost,
+                (self.risk <= 2) & ~self.complied,
+            ],
+            [0, 1, 2, 3],
+            default=4,
+        )
+
+
+# ── 策略（向量化）────────────────────────────────────
+
+def _pick_categories(engine: BatchEngine, strategy: str, rng: np.random.Generator) -> np.ndarray:
+    """每位玩家本回合想投的選項類別（CAT_*）；規則同 server.simulate 的 _pick_category"""
+    shape = engine.roles.shape
+    if strategy == "random":
+        return rng.integers(CAT_COMPLY, CAT_RESIST + 1, size=shape).astype(np.int8)
+    if strategy != "role":
+        return np.full(shape, CATEGORY_CODES[strategy], dtype=np.int8)
+
+    # role：依角色與局勢（_role_aware_category），條件依序判斷，先符合者為準
+    roles, risk = engine.roles, engine.risk
+    comply_or_evade = np.where(rng.random(shape) < 0.5, CAT_COMPLY, CAT_EVADE)
+    any_category = rng.integers(CAT_COMPLY, CAT_RESIST + 1, size=shape)
+    cautious = (roles == R_B) | (roles == R_C)
+    resist_low_risk = (risk <= 1) & (rng.random(shape) < ROLE_RESIST_P)
+    return np.select(
+        [
+            risk >= 6,
+            cautious & resist_low_risk,
+            cautious,
+            (roles == R_D) & (engine.fear >= 3)[:, None],
+            (roles == R_A) & ~engine.ability_used,
+            roles == R_F,
+        ],
+        [CAT_COMPLY, CAT_RESIST, comply_or_evade, comply_or_evade, CAT_EVADE, CAT_COMPLY],
+        default=any_category,
+    ).astype(np.int8)
+
+
+def _pick_votes(engine: BatchEngine, event_num: int, categories: np.ndarray) -> np.ndarray:
+    t = EVENT_TABLES[event_num]
+    votes = t.by_code[categories]
+
+    # D 旁觀者被動：恐懼≥3 投抵抗會失敗，由超時自動迴避
+    blocked = (engine.roles == R_D) & (engine.fear >= 3)[:, None] & (t.category[votes] == CAT_RESIST)
+    votes = np.where(blocked, t.evade_index, votes)
+    return np.where(engine.taken, -1, votes).astype(np.int8)
+
+
+def _role_wants_ability(engine: BatchEngine, event_num: int, categories: np.ndarray) -> np.ndarray:
+    """role 能力策略：只在能力有實際效果時使用（同 server.simulate 的 _wants_ability）"""
+    roles = engine.roles
+    high_fear = (engine.fear >= 2)[:, None] | (event_num == 6)
+    return (
+        ((roles == R_A) & (categories == CAT_EVADE) & (event_num in (1, 4)))
+        | ((roles == R_C) & (categories == CAT_RESIST))
+        | (((roles == R_B) | (roles == R_E)) & high_fear)
+        | ((roles == R_F) & (event_num == 6))
+        | (((roles == R_D) | (roles == R_G)) & (event_num >= 3))
+    )
+
+
+def _pick_abilities(
+    engine: BatchEngine, event_num: int, policy: str, categories: np.ndarray, rng: np.random.Generator
+):
+    shape = engine.roles.shape
+    if policy == "never":
+        wants = np.zeros(shape, dtype=bool)
+    elif policy == "early":
+        wants = np.ones(shape, dtype=bool)
+    elif policy == "late":
+        wants = np.full(shape, event_num == 6)
+    elif policy == "role":
+        wants = _role_wants_ability(engine, event_num, categories)
+    else:
+        wants = rng.random(shape) < ABILITY_RANDOM_P
+    uses = wants & ~engine.ability_used & ~engine.taken
+
+    # D / G 的目標：風險最高、尚未被帶走的其他玩家（同分取索引最小者）
+    masked = np.where(engine.taken, -1, engine.risk.astype(np.int32))
+    targets = np.zeros(shape, dtype=np.int8)
+    targeted = uses & ((engine.roles == R_D) | (engine.roles == R_G))
+    g_idx, p_idx = np.nonzero(targeted)
+    if g_idx.size:
+        cand = masked[g_idx].copy()
+        cand[np.arange(g_idx.size), p_idx] = -1
+        best = cand.argmax(axis=1)
+        ok = cand[np.arange(g_idx.size), best] >= 0
+        targets[g_idx, p_idx] = best
+        uses[g_idx[~ok], p_idx[~ok]] = False  # 沒有可選目標：能力使用失敗
+    engine.ability_used |= uses
+    return uses, targets
+
+
+def random_roles(games: int, players: int, rng: np.random.Generator) -> np.ndarray:
+    pool = np.array([ROLE_INDEX[r.value] for r in GameEngine.role_pool(players)], dtype=np.int8)
+    return rng.permuted(np.tile(pool, (games, 1)), axis=1)
+
+
+def play_batch(
+    roles: np.ndarray,
+    strategy: str,
+    ability: str,
+    rng: np.random.Generator,
+    record: Optional[list] = None,
+) -> BatchEngine:
+    """跑完整場遊戲。record 若提供，會記下每個事件的輸入（供交叉檢查重播）。"""
+    engine = BatchEngine(roles)
+    for event in EVENTS:
+        if event.is_auto_settle:
+            coins = rng.random((engine.games, roles.shape[1], MAX_VAGUE)) < 0.5
+            if record is not None:
+                record.append(coins)
+            engine.settle_foreshadows(coins)
+            continue
+        categories = _pick_categories(engine, strategy, rng)
+        uses, targets = _pick_abilities(engine, event.number, ability, categories, rng)
+        votes = _pick_votes(engine, event.number, categories)
+        if record is not None:
+            record.append((votes, uses, targets))
+        engine.settle_round(event.number, votes, uses, targets)
+    return engine
+
+
+# ── 統計 ──────────────────────────────────────────────
+
+def collect(engine: BatchEngine, result: SimulationResult):
+    """把一批結果累加進 SimulationResult（與 simulate.py 相同格式）"""
+    social = np.bincount(engine.social_endings(), minlength=len(SOCIAL_ENDINGS))
+    for code, count in enumerate(social):
+        if count:
+            result.endings[SOCIAL_ENDINGS[code]] += int(count)
+
+    personal = engine.personal_endings()
+    for code, count in enumerate(np.bincount(personal.ravel(), minlength=len(PERSONAL_ENDINGS))):
+        if count:
+            result.personal_endings[PERSONAL_ENDINGS[code]] += int(count)
+
+    for code, role in enumerate(ROLES):
+        mask = engine.roles == code
+        n = int(mask.sum())
+        if not n:
+            continue
+        result.players_by_role[role] += n
+        result.taken_by_role[role] += int((engine.taken & mask).sum())
+        risks, counts = np.unique(engine.risk[mask], return_counts=True)
+        hist = result.risk_by_role.setdefault(role, Counter())
+        for risk, count in zip(risks.tolist(), counts.tolist()):
+            hist[risk] += count
+    result.games += engine.games
+
+
+def simulate_batch(
+    games: int,
+    players: tuple[int, ...] = (6, 7, 8),
+    strategy: str = "random",
+    ability: str = "random",
+    seed: Optional[int] = None,
+) -> SimulationResult:
+    rng = np.random.default_rng(seed)
+    result = SimulationResult()
+    start = time.perf_counter()
+
+    # 每場隨機抽人數：先依人數分組，同人數的場次一起跑
+    per_count = rng.multinomial(games, [1 / len(players)] * len(players))
+    for n_players, n_games in zip(players, per_count):
+        remaining = int(n_games)
+        while remaining > 0:
+            chunk = min(remaining, BLOCK_GAMES)
+            roles = random_roles(chunk, n_players, rng)
+            collect(play_batch(roles, strategy, ability, rng), result)
+            remaining -= chunk
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _run_chunk(args: tuple[int, tuple[int, ...], str, str, int]) -> SimulationResult:
+    games, players, strategy, ability, seed = args
+    return simulate_batch(games, players, strategy, ability, seed=seed)
+
+
+def simulate_batch_sharded(
+    games: int,
+    players: tuple[int, ...] = (6, 7, 8),
+    strategy: str = "random",
+    ability: str = "random",
+    seed: int = 0,
+    workers: Optional[int] = None,
+    progress=None,
+) -> SimulationResult:
+    """把場次切成 CHUNK_GAMES 一批，交給 server.simulate 的程序池。結果只取決於 seed，與 workers 無關。"""
+    jobs = [(n, players, strategy, ability, batch_seed) for n, batch_seed in batch_plan(games, seed, CHUNK_GAMES)]
+    return run_pool(_run_chunk, jobs, workers, progress)
+
+
+# ── 重播指令紀錄 ──────────────────────────────────────
+
+# 各指令的固定長度（指令碼 + 單一位元組參數）；清單與字串參數另外計算
+_RECORD_LENGTH = np.zeros(256, dtype=np.int64)
+for _op in (OP_NEXT_EVENT, OP_SETTLE, OP_END):
+    _RECORD_LENGTH[_op] = 1
+for _op in (OP_LEAVE, OP_CONFIRM, OP_PHASE, OP_OBSERVER, OP_NOTE, OP_REJOIN):
+    _RECORD_LENGTH[_op] = 2
+for _op in (OP_VOTE, OP_ABILITY):
+    _RECORD_LENGTH[_op] = 3
+_KNOWN_OPS = np.zeros(256, dtype=bool)
+_KNOWN_OPS[list(range(len(OP_NAMES)))] = True
+# 事件（1 起算，0 為尚未開始）→ 超時自動迴避的選項索引 / 是否為投票事件
+_EVADE_INDEX = np.array([0] + [EVENT_TABLES[e.number].evade_index if e.number in EVENT_TABLES else 0 for e in EVENTS])
+_VOTING_EVENT = np.array([False] + [e.number in EVENT_TABLES for e in EVENTS])
+MAX_PLAYERS = 8
+
+
+def replay_logs(logs: list[bytes]) -> list[tuple[np.ndarray, BatchEngine]]:
+    """
+    以批次引擎重播已結束遊戲的指令紀錄（server.game_log），依人數分組。
+    回傳 [(各場在 logs 中的索引, 該組的 BatchEngine)]；未結束的遊戲略過。
+
+    解碼也是向量化的：所有紀錄同步前進，每一步每場各讀一筆指令，
+    迴圈次數只取決於最長一場的指令數（約 80），與場數無關。
+    房間最多 8 人，玩家、選項、角色索引與擲幣位元都是單一位元組的 varint。
+    """
+    n = len(logs)
+    if not n:
+        return []
+    for data in logs:
+        if not data or data[0] != LOG_FORMAT:
+            raise ValueError(f"不支援的紀錄格式：{data[:1]!r}")
+    lengths = np.fromiter(map(len, logs), dtype=np.int64, count=n)
+    # 尾端補零：讀取清單參數時不會越界
+    buf = np.frombuffer(b"".join(logs) + bytes(4 + 2 * MAX_PLAYERS), dtype=np.uint8).astype(np.int64)
+    ends = np.cumsum(lengths)
+    pos = ends - lengths + 1
+
+    games = np.arange(n)
+    event = np.zeros(n, dtype=np.int64)
+    settled = np.zeros(n, dtype=bool)
+    finished = np.zeros(n, dtype=np.int64)
+    players = np.zeros(n, dtype=np.int64)
+    roles = np.zeros((n, MAX_PLAYERS), dtype=np.int8)
+    role_count = np.full(n, -1, dtype=np.int64)
+    votes = np.full((n, len(EVENTS), MAX_PLAYERS), -1, dtype=np.int8)
+    uses = np.zeros((n, len(EVENTS), MAX_PLAYERS), dtype=bool)
+    targets = np.zeros((n, len(EVENTS), MAX_PLAYERS), dtype=np.int8)
+    coins = np.zeros((n, MAX_PLAYERS, MAX_VAGUE), dtype=bool)
+    nth = np.arange(MAX_VAGUE)
+
+    active = games[pos < ends]
+    while active.size:
+        p = pos[active]
+        op = buf[p]
+        if not _KNOWN_OPS[op].all():
+            bad = active[~_KNOWN_OPS[op]][0]
+            raise ValueError(f"第 {bad} 場：未知的指令碼 {buf[pos[bad]]}")
+        b1 = buf[p + 1]
+        step = _RECORD_LENGTH[op]
+
+        m = op == OP_VOTE
+        if m.any():
+            g, e = active[m], event[active[m]]
+            ok = _VOTING_EVENT[e] & ~settled[g]
+            votes[g[ok], e[ok] - 1, b1[m][ok]] = buf[p[m] + 2][ok]
+
+        m = op == OP_NEXT_EVENT
+        if m.any():
+            g = active[m]
+            event[g] = np.minimum(event[g] + 1, len(EVENTS))
+            settled[g] = False
+
+        m = op == OP_SETTLE
+        if m.any():
+            finished[active[m]] += 1
+            settled[active[m]] = True
+
+        m = op == OP_ABILITY
+        if m.any():
+            # 回合結算後、第一個事件前或事件 5 使用的能力不影響任何結算
+            g, e = active[m], event[active[m]]
+            ok = _VOTING_EVENT[e] & ~settled[g]
+            target = buf[p[m] + 2][ok]
+            uses[g[ok], e[ok] - 1, b1[m][ok]] = True
+            targets[g[ok], e[ok] - 1, b1[m][ok]] = np.where(target > 0, target - 1, 0)
+
+        m = op == OP_AUTO_EVADE
+        if m.any():
+            g, e, count = active[m], event[active[m]], b1[m]
+            step[m] = 2 + count
+            for k in range(MAX_PLAYERS):
+                ok = (k < count) & _VOTING_EVENT[e]
+                votes[g[ok], e[ok] - 1, buf[p[m] + 2 + k][ok]] = _EVADE_INDEX[e[ok]]
+
+        m = op == OP_ROLES
+        if m.any():
+            g, count = active[m], b1[m]
+            step[m] = 2 + count
+            role_count[g] = count
+            for k in range(MAX_PLAYERS):
+                ok = k < count
+                roles[g[ok], k] = buf[p[m] + 2 + k][ok]
+
+        m = op == OP_FORESHADOWS
+        if m.any():
+            g, count = active[m], b1[m]
+            step[m] = 2 + 2 * count
+            finished[g] += 1
+            settled[g] = True
+            for k in range(MAX_PLAYERS):
+                ok = k < count
+                bits = buf[p[m] + 3 + 2 * k][ok]
+                coins[g[ok], k] = (bits[:, None] >> nth) & 1 == 1
+
+        m = op == OP_JOIN
+        if m.any():
+            g = active[m]
+            players[g] += 1
+            id_size = b1[m]
+            name_at = p[m] + 2 + id_size
+            name_size = buf[name_at]
+            step[m] = 3 + id_size + name_size
+            # 字串長度超過 127 bytes 時 varint 不只一個位元組：逐場解碼
+            long = (id_size >= 0x80) | (name_size >= 0x80)
+            for i in np.flatnonzero(long):
+                at = int(p[m][i]) + 1
+                size, at = get_varint(buf, at)
+                size, at = get_varint(buf, at + size)
+                step[np.flatnonzero(m)[i]] = at + size - int(p[m][i])
+
+        pos[active] += step
+        active = active[pos[active] < ends[active]]
+
+    complete = (finished >= len(EVENTS)) & (role_count == players)
+    results = []
+    for count in np.unique(players[complete]):
+        idx = np.flatnonzero(complete & (players == count))
+        engine = BatchEngine(roles[idx, :count])
+        for slot, event_def in enumerate(EVENTS):
+            if event_def.is_auto_settle:
+                engine.settle_foreshadows(coins[idx, :count])
+                continue
+            engine.ability_used |= uses[idx, slot, :count]
+            engine.settle_round(event_def.number, votes[idx, slot, :count], uses[idx, slot, :count], targets[idx, slot, :count])
+        results.append((idx, engine))
+    return results
+
+
+# ── 交叉檢查 ──────────────────────────────────────────
+
+def cross_check(games: int, players: int, strategy: str, ability: str, seed: Optional[int] = None) -> list[str]:
+    """以相同的角色、投票、能力與擲幣在 GameEngine 上重播，回傳不一致的描述"""
+    rng = np.random.default_rng(seed)
+    roles = random_roles(games, players, rng)
+    record: list = []
+    batch = play_batch(roles, strategy, ability, rng, record)
+    social = batch.social_endings()
+    personal = batch.personal_endings()
+
+    mismatches = []
+    for g in range(games):
+        coins = ScriptedRandom()
+        engine = GameEngine(rng=coins)
+        ids = [f"p{i}" for i in range(players)]
+        for i, pid in enumerate(ids):
+            engine.players[pid] = Player(id=pid, name=pid, role_id=ROLES[roles[g, i]])
+
+        for event, step in zip(EVENTS, record):
+            engine.get_next_event()
+            if event.is_auto_settle:
+                for i, pid in enumerate(ids):
+                    vague = [fs for fs in engine.players[pid].foreshadows if fs.ftype == ForeshadowType.VAGUE]
+                    coins.queue += ["heads" if step[g, i, k] else "tails" for k in range(len(vague))]
+                engine.settle_foreshadows()
+                continue
+            votes, uses, targets = step
+            t = EVENT_TABLES[event.number]
+            for i, pid in enumerate(ids):
+                if uses[g, i]:
+                    target = ids[targets[g, i]] if ROLES[roles[g, i]] in "DG" else None
+                    engine.use_ability(pid, target)
+            engine.set_phase(GamePhase.VOTING)
+            for i, pid in enumerate(ids):
+                if votes[g, i] >= 0:
+                    engine.submit_vote(pid, t.keys[votes[g, i]])
+            engine.auto_evade_timeout_players()
+            engine.settle_round()
+
+        ending = engine.determine_ending()
+        expected = (
+            engine.state.social_fear,
+            engine.state.thought_flow,
+            [engine.players[pid].risk for pid in ids],
+            ending["social_ending"]["key"],
+            [pe["ending_type"] for pe in ending["personal_endings"]],
+        )
+        actual = (
+            int(batch.fear[g]),
+            int(batch.flow[g]),
+            batch.risk[g].tolist(),
+            SOCIAL_ENDINGS[social[g]],
+            [PERSONAL_ENDINGS[c] for c in personal[g]],
+        )
+        if expected != actual:
+            mismatches.append(f"game {g} roles={''.join(ROLES[r] for r in roles[g])}: engine={expected} batch={actual}")
+    return mismatches
+
+
+# ── CLI ───────────────────────────────────────────────
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="靜默之島 向量化批次模擬")
+    parser.add_argument("--games", type=int, default=1_000_000, help="模擬場數")
+    parser.add_argument("--players", type=parse_players, default=(6, 7, 8), help="玩家人數，例如 6、6-8、6,8")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="random", help="投票策略")
+    parser.add_argument("--ability", choices=ABILITY_POLICIES, default="random", help="能力使用策略")
+    parser.add_argument("--seed", type=int, default=None, help="主隨機種子（未指定則隨機產生並輸出）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="程序數")
+    parser.add_argument("--check", type=int, default=0, help="先以純量引擎交叉檢查這麼多場（每種人數）")
+    args = parser.parse_args(argv)
+
+    if any(n < 6 or n > 8 for n in args.players):
+        parser.error(f"玩家人數必須在 6-8 之間: {args.players}")
+    if args.workers < 1:
+        parser.error("--workers 必須 ≥ 1")
+    if args.seed is None:
+        args.seed = random.SystemRandom().getrandbits(32)
+
+    if args.check:
+        for n in args.players:
+            bad = cross_check(args.check, n, args.strategy, args.ability, seed=args.seed)
+            print(f"交叉檢查 {n} 人 × {args.check} 場：{len(bad)} 場不一致", file=sys.stderr)
+            for line in bad[:5]:
+                print(f"  {line}", file=sys.stderr)
+            if bad:
+                sys.exit(1)
+
+    result = simulate_batch_sharded(
+        args.games, args.players, args.strategy, args.ability, seed=args.seed, workers=args.workers,
+        progress=lambda n: print(f"  …{n} 場", file=sys.stderr),
+    )
+    print(format_report(result))
+    print(f"\n主種子：{args.seed}（workers={args.workers}）")
+
+
+if __name__ == "__main__":
+    main()
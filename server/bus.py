@@ -0,0 +1,177 @@
+"""
+靜默之島：選擇與代價 — 跨程序廣播匯流排
+
+共享房間狀態（SILENT_ISLAND_STATE_BACKEND=redis://…）時，同一個房間的連線可能分散在不同 worker。
+其他 worker 上的連線在本地以 RemoteSocket 代表；送給它們的訊息先累積，
+同一輪事件處理中所有要送到同一個 worker 的訊息合併成一次 PUBLISH（一份回合結果 = 每個 worker 一則）。
+每個 worker 訂閱自己的頻道，收到後交給本地連線的發送佇列。
+
+- LocalBus：單一程序，沒有遠端連線（預設）
+- RespBus：Redis 相容的 pub/sub（本機可用 server.resp_server 代替）
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Optional
+
+from .outbound import EncodedMessage
+from .resp import RespClient, encode_command, read_reply
+
+logger = logging.getLogger("silent-island")
+
+# 訂閱連線中斷後重連的等待時間（秒）
+RESUBSCRIBE_DELAY = 1.0
+
+# 收到的訊息交給誰：(房間碼, 收件者, 訊息) → 是否成功送出
+Deliver = Callable[[str, str, EncodedMessage], bool]
+
+
+class RemoteSocket:
+    """另一個 worker 上的連線（房間狀態裡記錄的收件者位置）"""
+
+    __slots__ = ("worker", "room_code", "recipient")
+
+    def __init__(self, worker: str, room_code: str, recipient: str):
+        self.worker = worker
+        self.room_code = room_code
+        self.recipient = recipient   # "host" 或 player_id
+
+    def __repr__(self):
+        return f"RemoteSocket({self.worker}, {self.room_code}, {self.recipient})"
+
+
+class LocalBus:
+    """單一程序：所有連線都在本地，不需要匯流排"""
+
+    def send(self, socket: RemoteSocket, message: EncodedMessage) -> bool:
+        logger.warning(f"Message for {socket} dropped: no cross-process bus configured")
+        return False
+
+    async def start(self, deliver: Deliver):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Optional[dict]:
+        return None
+
+
+class RespBus:
+    """以 Redis 相容 pub/sub 在 worker 之間轉送訊息；每個 worker 一個頻道"""
+
+    def __init__(self, url: str, worker_id: str, prefix: str = "si:bus:"):
+        self.url = url
+        self.worker_id = worker_id
+        self.prefix = prefix
+        self.publisher = RespClient(url)
+        # 目標 worker → [(房間碼, 收件者, 訊息)]；在下一個事件迴圈週期一次送出
+        self._pending: dict[str, list[tuple[str, str, EncodedMessage]]] = {}
+        self._flush_scheduled = False
+        self._subscriber: Optional[asyncio.Task] = None
+        self._publishing: set[asyncio.Task] = set()
+        # 統計
+        self.published = 0        # PUBLISH 次數
+        self.messages_out = 0     # 經由匯流排送出的訊息數
+        self.messages_in = 0
+        self.undeliverable = 0    # 收到但本地已沒有該連線
+
+    def channel(self, worker: str) -> str:
+        return f"{self.prefix}{worker}"
+
+    def send(self, socket: RemoteSocket, message: EncodedMessage) -> bool:
+        self._pending.setdefault(socket.worker, []).append((socket.room_code, socket.recipient, message))
+        self.messages_out += 1
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return True
+
+    def _flush(self):
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        for worker, items in pending.items():
+            # 連續送給多位收件者的同一則訊息（廣播）只放一份文字
+            entries: list[tuple[str, list[str], EncodedMessage]] = []
+            for code, recipient, message in items:
+                if entries and entries[-1][0] == code and entries[-1][2] is message:
+                    entries[-1][1].append(recipient)
+                else:
+                    entries.append((code, [recipient], message))
+            payload = json.dumps(
+                [[code, recipients, message.type, message.text] for code, recipients, message in entries],
+                ensure_ascii=False,
+            )
+            task = asyncio.create_task(self._publish(worker, payload))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+    async def _publish(self, worker: str, payload: str):
+        try:
+            await self.publisher.execute("PUBLISH", self.channel(worker), payload)
+            self.published += 1
+        except Exception as e:
+            logger.warning(f"Bus publish to {worker} failed: {e}")
+
+    async def start(self, deliver: Deliver):
+        self._subscriber = asyncio.create_task(self._subscribe(deliver))
+
+    async def _subscribe(self, deliver: Deliver):
+        """專用連線訂閱本 worker 的頻道；斷線自動重連"""
+        subscriber = RespClient(self.url)
+        writer = None
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(subscriber.host, subscriber.port)
+                if subscriber.password:
+                    writer.write(encode_command("AUTH", subscriber.password))
+                    await writer.drain()
+                    await read_reply(reader)
+                writer.write(encode_command("SUBSCRIBE", self.channel(self.worker_id)))
+                await writer.drain()
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        self._receive(reply[2], deliver)
+            except asyncio.CancelledError:
+                if writer is not None:
+                    writer.close()
+                raise
+            except Exception as e:
+                logger.warning(f"Bus subscription lost ({e}), reconnecting")
+                if writer is not None:
+                    writer.close()
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    def _receive(self, payload: bytes, deliver: Deliver):
+        for code, recipients, msg_type, text in json.loads(payload):
+            message = EncodedMessage.from_text(msg_type, text)
+            for recipient in recipients:
+                self.messages_in += 1
+                if not deliver(code, recipient, message):
+                    self.undeliverable += 1
+
+    async def close(self):
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+        await self.publisher.close()
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.worker_id,
+            "published": self.published,
+            "messages_out": self.messages_out,
+            "messages_in": self.messages_in,
+            "undeliverable": self.undeliverable,
+        }
+
+
+def bus_from_env(worker_id: str):
+    """與共享狀態使用同一個 Redis（SILENT_ISLAND_STATE_BACKEND）"""
+    url = os.environ.get("SILENT_ISLAND_STATE_BACKEND", "memory")
+    if url.startswith("redis://"):
+        return RespBus(url, worker_id)
+    return LocalBus()
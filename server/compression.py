@@ -0,0 +1,208 @@
+"""
+靜默之島：選擇與代價 — WebSocket 壓縮（permessage-deflate）調校與統計
+
+回合結果、結局的敘事文字有數百 bytes，同時送給最多 8 位玩家與關主。
+uvicorn 預設會協商 permessage-deflate，但參數固定、也看不到效果。
+改用本模組的 WebSocket 協定類別後：
+- 壓縮參數可由環境變數調整；保留 context takeover（同一連線後續訊息沿用前面的字典）
+- 每條連線記錄原始 / 壓縮後的位元組與壓縮花費的時間（/api/metrics）
+- 很短的訊息不壓縮（RFC 7692 允許逐則決定，RSV1 未設定即為未壓縮）
+- 可逐房間關閉壓縮（CPU 吃緊時）：該房間的連線改送未壓縮的訊息，但連線不必重建
+
+啟動：
+  uvicorn server.main:app --ws server.compression:DeflateWebSocketProtocol
+
+設定（環境變數）：
+  SILENT_ISLAND_WS_DEFLATE              0 表示不協商壓縮（預設 1）
+  SILENT_ISLAND_WS_DEFLATE_LEVEL        zlib 壓縮等級 1–9（預設 6）
+  SILENT_ISLAND_WS_DEFLATE_WINDOW_BITS  伺服器端視窗大小 9–15（預設 15）
+  SILENT_ISLAND_WS_DEFLATE_MEM_LEVEL    zlib memLevel 1–9（預設 8）
+  SILENT_ISLAND_WS_DEFLATE_MIN_SIZE     短於此長度（bytes）的訊息不壓縮（預設 128）
+"""
+from __future__ import annotations
+
+import dataclasses
+import logging
+import os
+import time
+from typing import Any, Optional, Sequence
+
+from fastapi import WebSocket
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from websockets.extensions.base import Extension
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from websockets.frames import CTRL_OPCODES, Frame
+from websockets.server import ServerProtocol
+from websockets.typing import ExtensionParameter
+
+# ASGI scope["extensions"] 中存放本連線壓縮狀態的鍵
+SCOPE_KEY = "silent-island.deflate"
+
+
+@dataclasses.dataclass
+class DeflateSettings:
+    enabled: bool = True
+    level: int = 6
+    window_bits: int = 15
+    mem_level: int = 8
+    min_size: int = 128
+
+
+def settings_from_env() -> DeflateSettings:
+    env = os.environ.get
+    return DeflateSettings(
+        enabled=env("SILENT_ISLAND_WS_DEFLATE", "1") not in ("0", "false", "off"),
+        level=int(env("SILENT_ISLAND_WS_DEFLATE_LEVEL", "6")),
+        window_bits=int(env("SILENT_ISLAND_WS_DEFLATE_WINDOW_BITS", "15")),
+        mem_level=int(env("SILENT_ISLAND_WS_DEFLATE_MEM_LEVEL", "8")),
+        min_size=int(env("SILENT_ISLAND_WS_DEFLATE_MIN_SIZE", "128")),
+    )
+
+
+# ── 統計 ──────────────────────────────────────────────
+
+class DeflateStats:
+    """送出訊息的壓縮統計（每條連線一份，另有全程序合計 totals）"""
+
+    def __init__(self):
+        self.messages = 0       # 壓縮的訊息數
+        self.skipped = 0        # 太短或房間關閉壓縮而未壓縮的訊息數
+        self.raw_bytes = 0      # 壓縮前
+        self.wire_bytes = 0     # 壓縮後
+        self.seconds = 0.0      # 壓縮花費的時間（在事件迴圈上同步執行）
+
+    def record(self, raw: int, wire: int, seconds: float):
+        self.messages += 1
+        self.raw_bytes += raw
+        self.wire_bytes += wire
+        self.seconds += seconds
+
+    def merge(self, other: DeflateStats):
+        self.messages += other.messages
+        self.skipped += other.skipped
+        self.raw_bytes += other.raw_bytes
+        self.wire_bytes += other.wire_bytes
+        self.seconds += other.seconds
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "skipped": self.skipped,
+            "raw_bytes": self.raw_bytes,
+            "wire_bytes": self.wire_bytes,
+            "ratio": round(self.wire_bytes / self.raw_bytes, 3) if self.raw_bytes else None,
+            "cpu_ms": round(self.seconds * 1000, 2),
+            "us_per_kb": round(self.seconds * 1e6 / (self.raw_bytes / 1024), 1) if self.raw_bytes else None,
+        }
+
+
+totals = DeflateStats()
+# 成功協商壓縮的連線數（0 表示沒有以本模組的協定類別啟動，或客戶端都不支援）
+negotiated = 0
+
+
+# ── permessage-deflate ────────────────────────────────
+
+class MeteredDeflate(Extension):
+    """包住 websockets 的 PerMessageDeflate：計時、統計，並可暫停壓縮"""
+
+    def __init__(self, inner: Extension, min_size: int):
+        self.inner = inner
+        self.name = inner.name
+        self.min_size = min_size
+        self.enabled = True
+        self.stats = DeflateStats()
+
+    def decode(self, frame: Frame, *, max_size: Optional[int] = None) -> Frame:
+        return self.inner.decode(frame, max_size=max_size)
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        # uvicorn 一則訊息只送一個 frame，跳過壓縮不會拆開同一則訊息
+        if frame.fin and (not self.enabled or len(frame.data) < self.min_size):
+            self.stats.skipped += 1
+            totals.skipped += 1
+            return frame
+        start = time.perf_counter()
+        encoded = self.inner.encode(frame)
+        seconds = time.perf_counter() - start
+        self.stats.record(len(frame.data), len(encoded.data), seconds)
+        totals.record(len(frame.data), len(encoded.data), seconds)
+        return encoded
+
+
+class MeteredDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, settings: DeflateSettings):
+        super().__init__(
+            server_max_window_bits=settings.window_bits,
+            compress_settings={"level": settings.level, "memLevel": settings.mem_level},
+        )
+        self.min_size = settings.min_size
+
+    def process_request_params(
+        self,
+        params: Sequence[ExtensionParameter],
+        accepted_extensions: Sequence[Extension],
+    ) -> tuple[list[ExtensionParameter], Extension]:
+        global negotiated
+        response, extension = super().process_request_params(params, accepted_extensions)
+        negotiated += 1
+        return response, MeteredDeflate(extension, self.min_size)
+
+
+class DeflateWebSocketProtocol(WebSocketsSansIOProtocol):
+    """uvicorn 的 WebSocket 協定，改用可調校、有統計的 permessage-deflate"""
+
+    settings = settings_from_env()
+
+    def __init__(self, config, server_state, app_state: dict[str, Any], _loop=None):
+        super().__init__(config, server_state, app_state, _loop)
+        extensions = [MeteredDeflateFactory(self.settings)] if self.settings.enabled else []
+        self.conn = ServerProtocol(
+            extensions=extensions,
+            max_size=self.config.ws_max_size,
+            logger=logging.getLogger("uvicorn.error"),
+        )
+
+    def handle_connect(self, event):
+        super().handle_connect(event)
+        # 交給應用程式：以 extension_for(ws) 取得本連線的壓縮狀態
+        for extension in self.conn.extensions:
+            if isinstance(extension, MeteredDeflate) and hasattr(self, "scope"):
+                self.scope["extensions"][SCOPE_KEY] = extension
+
+
+# ── 應用程式端 ────────────────────────────────────────
+
+def extension_for(ws: Any) -> Optional[MeteredDeflate]:
+    """連線協商到的壓縮（未協商、或不是以本模組的協定類別啟動時為 None）"""
+    if not isinstance(ws, WebSocket):
+        return None
+    return ws.scope.get("extensions", {}).get(SCOPE_KEY)
+
+
+def follow(ws: Any, enabled: bool):
+    """讓連線的壓縮跟隨房間設定"""
+    extension = extension_for(ws)
+    if extension is not None:
+        extension.enabled = enabled
+
+
+def room_stats(sockets: Sequence[Any]) -> Optional[dict]:
+    """房間所有本地連線的壓縮統計合計（都沒有協商壓縮時為 None）"""
+    extensions = [e for e in map(extension_for, sockets) if e is not None]
+    if not extensions:
+        return None
+    merged = DeflateStats()
+    for extension in extensions:
+        merged.merge(extension.stats)
+    return {"connections": len(extensions), **merged.stats()}
+
+
+def stats() -> dict:
+    return {
+        "negotiated": negotiated,
+        "settings": dataclasses.asdict(DeflateWebSocketProtocol.settings),
+        **totals.stats(),
+    }
@@ -0,0 +1,139 @@
+"""
+靜默之島：選擇與代價 — WebSocket 訊息分派
+
+以訊息類型為鍵的處理器註冊表。每個處理器宣告所需身分（host / player）
+與 payload 欄位型別，分派時以一次 dict 查表找到處理器。
+"""
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import WebSocket
+
+from . import outbound
+from .outbound import EncodedMessage
+from .room import Room
+
+logger = logging.getLogger("silent-island")
+
+# 欄位名稱 → (允許的型別, 預設值)；缺少或為 null 時使用預設值
+Schema = dict[str, tuple[Any, Any]]
+
+
+@dataclass
+class Session:
+    """一條 WebSocket 連線的身分狀態"""
+    ws: WebSocket
+    role: Optional[str] = None        # "host" or "player"
+    room: Optional[Room] = None
+    player_id: Optional[str] = None
+
+    def has_role(self, role: str) -> bool:
+        if self.role != role or self.room is None:
+            return False
+        if role == "player" and not self.player_id:
+            return False
+        return True
+
+
+HandlerFunc = Callable[[Session, dict], Awaitable[None]]
+
+
+@dataclass
+class Handler:
+    msg_type: str
+    func: HandlerFunc
+    role: Optional[str] = None            # 需要的身分；None 表示不限
+    schema: Schema = field(default_factory=dict)
+    denied_message: Optional[str] = None  # 身分不符時回覆的錯誤（None 則靜默忽略）
+    # 統計（供 /api/metrics 與效能分析）
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "avg_ms": round(self.total_time / self.calls * 1000, 3) if self.calls else None,
+            "max_ms": round(self.max_time * 1000, 3),
+        }
+
+
+def _error(session: Session, message: str):
+    outbound.put(session.ws, EncodedMessage({"type": "error", "message": message}))
+
+
+class Dispatcher:
+    """訊息類型 → 處理器"""
+
+    def __init__(self):
+        self.handlers: dict[str, Handler] = {}
+
+    def on(
+        self,
+        msg_type: str,
+        role: Optional[str] = None,
+        schema: Optional[Schema] = None,
+        denied_message: Optional[str] = None,
+    ) -> Callable[[HandlerFunc], HandlerFunc]:
+        """註冊處理器的 decorator"""
+        def decorator(func: HandlerFunc) -> HandlerFunc:
+            if msg_type in self.handlers:
+                raise ValueError(f"重複註冊的訊息類型: {msg_type}")
+            self.handlers[msg_type] = Handler(
+                msg_type=msg_type,
+                func=func,
+                role=role,
+                schema=schema or {},
+                denied_message=denied_message,
+            )
+            return func
+        return decorator
+
+    def parse(self, handler: Handler, msg: dict) -> Optional[dict]:
+        """依 schema 取出欄位；型別不符回傳 None"""
+        payload = {}
+        for name, (types, default) in handler.schema.items():
+            value = msg.get(name)
+            if value is None:
+                value = default
+            elif not isinstance(value, types) or (isinstance(value, bool) and bool not in _as_tuple(types)):
+                return None
+            payload[name] = value
+        return payload
+
+    async def dispatch(self, session: Session, msg: dict):
+        msg_type = msg.get("type")
+        handler = self.handlers.get(msg_type) if isinstance(msg_type, str) else None
+        if handler is None:
+            _error(session, f"未知訊息類型: {msg_type}")
+            return
+
+        if handler.role and not session.has_role(handler.role):
+            if handler.denied_message:
+                _error(session, handler.denied_message)
+            return
+
+        payload = self.parse(handler, msg)
+        if payload is None:
+            _error(session, "無效的訊息格式")
+            return
+
+        start = time.perf_counter()
+        try:
+            await handler.func(session, payload)
+        finally:
+            elapsed = time.perf_counter() - start
+            handler.calls += 1
+            handler.total_time += elapsed
+            handler.max_time = max(handler.max_time, elapsed)
+
+    def stats(self) -> dict[str, dict]:
+        return {t: h.stats() for t, h in self.handlers.items()}
+
+
+def _as_tuple(types: Any) -> tuple:
+    return types if isinstance(types, tuple) else (types,)
@@ -0,0 +1,451 @@
+"""
+靜默之島：選擇與代價 — 結局機率窮舉器
+
+除了事件 5 的伏筆擲幣，GameEngine 的結算在給定投票與能力後是確定的。
+本模組對一組固定的角色分配，逐事件走訪所有可達的
+(social_fear, thought_flow, 各玩家狀態)，以標準化後的狀態合併（memoize）
+相同的局面，擲幣分支依機率加權，算出精確的結局機率（而非抽樣）。
+
+玩家狀態只保留影響之後結算與結局的欄位：風險、伏筆數、道德 / 服從標記；
+被帶走的玩家與角色、策略相同且不是能力目標的玩家會再進一步合併。
+
+狀態數隨「有分支的玩家數」指數成長：所有玩家都 uniform 時仍可能過大，
+可固定部分玩家的策略，或用 --social-only 只算社會結局（恐懼≥6 且不會再
+下降的局面直接吸收為結局 C）。
+
+使用方法：
+  python -m server.enumerator --roles ABCDEE
+  python -m server.enumerator --roles ABCDEFGE --policy B=comply,C=evade --ability C=4 --ability G=6:0
+  python -m server.enumerator --roles ABCDEE --policy A=comply,B=comply --social-only
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from math import comb
+from typing import Optional
+
+from .game_engine import ROLE_PASSIVES, SETTLEMENT_RULES, GameEngine
+from .models import EVENTS, ForeshadowType, Player, RoleID
+from .simulate import CHOICE_BY_CATEGORY
+
+# 投票策略："uniform" 為所有可選選項等機率；其餘為固定選擇該類選項
+POLICIES = ("uniform", "comply", "evade", "resist")
+
+# 玩家狀態欄位旗標
+FLAG_COMPLIED = 1        # ever_complied
+FLAG_MORAL_COST = 2      # moral_cost
+FLAG_MORAL_COLLAPSE = 4  # moral_collapse
+
+TAKEN_RISK = 10
+# 結局只區分 恐懼≥6；恐懼之後不會再下降時即可截斷
+ENDING_FEAR_CAP = 6
+
+# (risk, 模糊伏筆數, 沉默伏筆數, 旗標)
+PlayerState = tuple[int, int, int, int]
+# (social_fear, thought_flow, 各玩家狀態)
+State = tuple[int, int, tuple[PlayerState, ...]]
+# social_only 模式下已確定為結局 C 的吸收狀態
+ABSORBED: State = (-1, -1, ())
+
+
+@dataclass
+class AbilityUse:
+    """能力使用排程：在第 event 回合使用，target 為目標玩家索引（D / G 需要）"""
+    event: int
+    target: Optional[int] = None
+
+
+@dataclass
+class RoundAbilities:
+    """某一回合生效的能力（由能力排程預先整理）"""
+    a_no_foreshadow: frozenset[int] = frozenset()
+    b_cancel_fear: bool = False
+    e_cancel_majority: bool = False
+    f_public_vote: bool = False
+    c_risk_to_fear: tuple[int, ...] = ()
+    d_take_risk: tuple[tuple[int, int], ...] = ()     # (使用者, 目標)
+    g_risk_to_fear: tuple[tuple[int, int], ...] = ()  # (使用者, 目標)
+
+
+@dataclass
+class EnumerationResult:
+    roles: tuple[str, ...]
+    endings: dict[str, float]                 # 社會結局 key → 機率
+    personal_endings: list[dict[str, float]]  # 每位玩家：個人結局 type → 機率（social_only 時為空）
+    taken_away: list[float]                   # 每位玩家被帶走的機率（social_only 時為空）
+    states_per_event: list[int] = field(default_factory=list)
+    transitions: int = 0
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "roles": "".join(self.roles),
+            "endings": dict(sorted(self.endings.items())),
+            "taken_away": self.taken_away,
+            "personal_endings": [dict(sorted(pe.items())) for pe in self.personal_endings],
+            "states_per_event": self.states_per_event,
+            "transitions": self.transitions,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+class Enumerator:
+    """對固定角色分配、投票策略與能力排程做精確的結局機率計算"""
+
+    def __init__(
+        self,
+        roles: list[str],
+        policies: Optional[dict[int, str]] = None,
+        abilities: Optional[dict[int, AbilityUse]] = None,
+        social_only: bool = False,
+    ):
+        if not 6 <= len(roles) <= 8:
+            raise ValueError(f"需要 6-8 位玩家，目前 {len(roles)} 位")
+        valid_roles = {r.value for r in RoleID}
+        for role in roles:
+            if role not in valid_roles:
+                raise ValueError(f"未知角色: {role}")
+
+        self.roles = tuple(roles)
+        self.n = len(roles)
+        self.policies = [(policies or {}).get(i, "uniform") for i in range(self.n)]
+        for policy in self.policies:
+            if policy not in POLICIES:
+                raise ValueError(f"未知投票策略: {policy}")
+
+        self.abilities = dict(abilities or {})
+        for i, use in self.abilities.items():
+            if not 0 <= i < self.n:
+                raise ValueError(f"玩家索引超出範圍: {i}")
+            if self.roles[i] in ("D", "G"):
+                if use.target is None or not 0 <= use.target < self.n:
+                    raise ValueError(f"{self.roles[i]} 角色能力需要指定目標玩家")
+
+        self.social_only = social_only
+        self._groups = self._exchangeable_groups()
+        self._fear_caps = self._compute_fear_caps()
+        self._round_abilities = {event.number: self._compile_abilities(event.number) for event in EVENTS}
+
+    # ── 標準化 ────────────────────────────────────────
+
+    def _exchangeable_groups(self) -> list[list[int]]:
+        """角色、策略相同、沒有能力排程且不是能力目標的玩家可以互換"""
+        targets = {use.target for use in self.abilities.values()}
+        buckets: dict[tuple, list[int]] = defaultdict(list)
+        for i in range(self.n):
+            if i in self.abilities or i in targets:
+                continue
+            buckets[(self.roles[i], self.policies[i])].append(i)
+        return [idx for idx in buckets.values() if len(idx) > 1]
+
+    def _compute_fear_caps(self) -> list[int]:
+        """每個事件結算後恐懼的截斷值：≥6 且之後最多還能下降多少"""
+        drops = []
+        for event in EVENTS:
+            rules = SETTLEMENT_RULES.get(event.number, {})
+            worst = min((r.fear for r in rules.values()), default=0)
+            drops.append(self.n * max(0, -worst))
+        return [ENDING_FEAR_CAP + sum(drops[k + 1:]) for k in range(len(EVENTS))]
+
+    def _compile_abilities(self, event_num: int) -> RoundAbilities:
+        active = [(i, use) for i, use in self.abilities.items() if use.event == event_num]
+        by_role = lambda role: [(i, use) for i, use in active if self.roles[i] == role]
+        return RoundAbilities(
+            a_no_foreshadow=frozenset(i for i, _ in by_role("A")),
+            b_cancel_fear=bool(by_role("B")),
+            e_cancel_majority=bool(by_role("E")),
+            f_public_vote=bool(by_role("F")),
+            c_risk_to_fear=tuple(i for i, _ in by_role("C")),
+            d_take_risk=tuple((i, use.target) for i, use in by_role("D")),
+            g_risk_to_fear=tuple((i, use.target) for i, use in by_role("G")),
+        )
+
+    def _canonical(self, fear: int, flow: int, players: list[PlayerState], level: int, after_foreshadows: bool) -> State:
+        cap = self._fear_caps[level]
+        if self.social_only and fear >= cap == ENDING_FEAR_CAP:
+            return ABSORBED
+        fear = min(fear, cap)
+        out = []
+        for risk, vague, silence, flags in players:
+            if after_foreshadows:
+                vague = silence = 0
+            if risk >= TAKEN_RISK:
+                # 被帶走：只剩伏筆對事件 5 的社會恐懼有影響
+                out.append((TAKEN_RISK, 1 if vague and not silence else 0, silence, 0))
+                continue
+            if flags & (FLAG_MORAL_COST | FLAG_MORAL_COLLAPSE):
+                # 個人結局已由道德標記決定，是否服從過不再重要
+                flags &= ~FLAG_COMPLIED
+            out.append((risk, vague, silence, flags))
+        for idx in self._groups:
+            for i, ps in zip(idx, sorted(out[i] for i in idx)):
+                out[i] = ps
+        return fear, flow, tuple(out)
+
+    # ── 投票選項 ──────────────────────────────────────
+
+    def _vote_options(self, event_num: int, i: int, ps: PlayerState, fear: int) -> list[tuple[Optional[str], float]]:
+        if ps[0] >= TAKEN_RISK:
+            return [(None, 1.0)]
+        keys = CHOICE_BY_CATEGORY[event_num]
+        rules = SETTLEMENT_RULES[event_num]
+        # D 旁觀者被動：恐懼≥3 不能選抵抗類（投票失敗 → 超時自動迴避）
+        blocked = self.roles[i] == "D" and fear >= 3
+        policy = self.policies[i]
+        if policy != "uniform":
+            key = keys[policy]
+            if blocked and rules[key].category == "resist":
+                key = keys["evade"]
+            return [(key, 1.0)]
+        allowed = [k for k, r in rules.items() if not (blocked and r.category == "resist")]
+        return [(k, 1.0 / len(allowed)) for k in allowed]
+
+    # ── 結算 ──────────────────────────────────────────
+
+    def _settle_round(self, event_num: int, fear: int, flow: int, players: tuple[PlayerState, ...], votes: tuple) -> tuple[int, int, list[PlayerState]]:
+        """與 GameEngine.settle_round 相同的規則，只計算數值"""
+        rules = SETTLEMENT_RULES[event_num]
+        ab = self._round_abilities[event_num]
+
+        fear_delta = 0
+        flow_delta = 0
+        risk_delta = [0] * self.n
+        vague = [ps[1] for ps in players]
+        silence = [ps[2] for ps in players]
+        flags = [ps[3] for ps in players]
+        resisters = []
+        comply_count = 0
+
+        for i, choice in enumerate(votes):
+            role = self.roles[i]
+            passive = ROLE_PASSIVES.get(role)
+            if choice is None:
+                if passive and event_num in passive.fear_events:
+                    fear_delta += 1
+                continue
+
+            rule = rules[choice]
+            if rule.category == "comply":
+                comply_count += 1
+                flags[i] |= FLAG_COMPLIED
+            if rule.moral_cost:
+                flags[i] |= FLAG_MORAL_COST
+            if rule.moral_collapse:
+                flags[i] |= FLAG_MORAL_COLLAPSE
+
+            fear_delta += rule.fear
+            flow_delta += rule.flow
+            risk_delta[i] += rule.risk
+
+            if rule.foreshadow == ForeshadowType.VAGUE:
+                if i not in ab.a_no_foreshadow:
+                    vague[i] += 1
+            elif rule.foreshadow == ForeshadowType.SILENCE:
+                silence[i] += 1
+
+            if passive:
+                if event_num in passive.fear_events:
+                    fear_delta += 1
+                if rule.category == "resist":
+                    risk_delta[i] += passive.resist_risk
+            if rule.category == "resist":
+                resisters.append(i)
+                if ab.f_public_vote:
+                    risk_delta[i] += 1
+
+        if flow + flow_delta >= 3:
+            for i in resisters:
+                risk_delta[i] += 1
+
+        if comply_count >= 5 and not ab.e_cancel_majority:
+            fear_delta += 1
+
+        if ab.b_cancel_fear and fear_delta > 0:
+            fear_delta -= 1
+
+        for i in ab.c_risk_to_fear:
+            if risk_delta[i] > 0:
+                risk_delta[i] -= 1
+                fear_delta += 1
+        for i, target in ab.d_take_risk:
+            if risk_delta[target] > 0:
+                risk_delta[target] -= 1
+                risk_delta[i] += 1
+        for i, target in ab.g_risk_to_fear:
+            if risk_delta[target] > 0:
+                risk_delta[target] -= 1
+                fear_delta += 1
+
+        fear = max(0, fear + fear_delta)
+        flow = max(0, flow + flow_delta)
+        out = [
+            (max(0, players[i][0] + risk_delta[i]), vague[i], silence[i], flags[i])
+            for i in range(self.n)
+        ]
+        return fear, flow, out
+
+    def _settle_foreshadows(self, fear: int, flow: int, players: tuple[PlayerState, ...]):
+        """與 GameEngine.settle_foreshadows 相同的規則。產生 (fear, flow, players, 機率)。"""
+        silence_total = sum(ps[2] for ps in players)
+        with_foreshadow = sum(1 for ps in players if ps[1] or ps[2])
+        fear = max(0, fear + 2 * silence_total + with_foreshadow // 2)
+
+        # 每個模糊伏筆：風險 +5，擲幣正面再 +10
+        branches = []
+        for risk, vague, silence, flags in players:
+            if not vague or risk >= TAKEN_RISK:
+                branches.append([((risk, vague, silence, flags), 1.0)])
+                continue
+            branches.append([
+                ((risk + 5 * vague + 10 * heads, vague, silence, flags), comb(vague, heads) / 2 ** vague)
+                for heads in range(vague + 1)
+            ])
+        for combo in itertools.product(*branches):
+            prob = 1.0
+            for _, q in combo:
+                prob *= q
+            yield fear, flow, [ps for ps, _ in combo], prob
+
+    # ── 窮舉 ──────────────────────────────────────────
+
+    def run(self, max_states: Optional[int] = None) -> EnumerationResult:
+        start = time.perf_counter()
+        dist: dict[State, float] = {(0, 0, tuple((0, 0, 0, 0) for _ in range(self.n))): 1.0}
+        states_per_event = []
+        transitions = 0
+
+        for level, event in enumerate(EVENTS):
+            nxt: dict[State, float] = defaultdict(float)
+            if ABSORBED in dist:
+                nxt[ABSORBED] = dist.pop(ABSORBED)
+            if event.is_auto_settle:
+                for (fear, flow, players), p in dist.items():
+                    for f, fl, ps, q in self._settle_foreshadows(fear, flow, players):
+                        nxt[self._canonical(f, fl, ps, level, True)] += p * q
+                        transitions += 1
+            else:
+                for (fear, flow, players), p in dist.items():
+                    options = [self._vote_options(event.number, i, ps, fear) for i, ps in enumerate(players)]
+                    for combo in itertools.product(*options):
+                        q = p
+                        for _, w in combo:
+                            q *= w
+                        votes = tuple(k for k, _ in combo)
+                        f, fl, ps = self._settle_round(event.number, fear, flow, players, votes)
+                        nxt[self._canonical(f, fl, ps, level, level >= 4)] += q
+                        transitions += 1
+            dist = nxt
+            states_per_event.append(len(dist))
+            if max_states is not None and len(dist) > max_states:
+                raise RuntimeError(f"事件 {event.number} 後狀態數 {len(dist)} 超過上限 {max_states}")
+
+        return self._collect(dist, states_per_event, transitions, time.perf_counter() - start)
+
+    def _collect(self, dist: dict[State, float], states_per_event: list[int], transitions: int, elapsed: float) -> EnumerationResult:
+        endings: dict[str, float] = defaultdict(float)
+        personal: list[dict[str, float]] = [defaultdict(float) for _ in range(self.n)]
+        if ABSORBED in dist:
+            endings["C"] += dist.pop(ABSORBED)
+        for (fear, flow, players), p in dist.items():
+            endings[GameEngine.social_ending_key(fear, flow)] += p
+            if self.social_only:
+                continue
+            for i, (risk, _, _, flags) in enumerate(players):
+                ending = GameEngine._determine_personal_ending(Player(
+                    risk=risk,
+                    ever_complied=bool(flags & FLAG_COMPLIED),
+                    moral_cost=bool(flags & FLAG_MORAL_COST),
+                    moral_collapse=bool(flags & FLAG_MORAL_COLLAPSE),
+                ))
+                personal[i][ending["ending_type"]] += p
+
+        # 可互換的玩家已被排序合併：以群組平均作為每位成員的結果
+        for idx in self._groups:
+            merged: dict[str, float] = defaultdict(float)
+            for i in idx:
+                for k, v in personal[i].items():
+                    merged[k] += v / len(idx)
+            for i in idx:
+                personal[i] = dict(merged)
+
+        return EnumerationResult(
+            roles=self.roles,
+            endings=dict(endings),
+            personal_endings=[] if self.social_only else [dict(pe) for pe in personal],
+            taken_away=[] if self.social_only else [pe.get("taken_away", 0.0) for pe in personal],
+            states_per_event=states_per_event,
+            transitions=transitions,
+            elapsed=elapsed,
+        )
+
+
+# ── CLI ───────────────────────────────────────────────
+
+def _parse_assignments(values: list[str], roles: str) -> dict[str, list[str]]:
+    """把 "B=comply,C=evade" 之類的參數展開成 {key: [value, ...]}"""
+    out: dict[str, list[str]] = defaultdict(list)
+    for value in values:
+        for item in value.split(","):
+            if item:
+                key, _, val = item.partition("=")
+                out[key.strip()].append(val.strip())
+    return out
+
+
+def _player_indices(key: str, roles: str) -> list[int]:
+    """鍵可以是玩家索引（0 起）或角色代號（該角色的所有玩家）"""
+    if key.isdigit():
+        return [int(key)]
+    return [i for i, r in enumerate(roles) if r == key]
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="靜默之島 結局機率窮舉器")
+    parser.add_argument("--roles", default="ABCDEE", help="角色分配（依玩家順序），例如 ABCDEE、ABCDEFE、ABCDEFGE")
+    parser.add_argument("--policy", action="append", default=[], help="投票策略，例如 B=comply,0=evade（預設 uniform）")
+    parser.add_argument("--ability", action="append", default=[], help="能力排程：角色或索引=回合[:目標索引]，例如 C=4、G=6:0")
+    parser.add_argument("--social-only", action="store_true", help="只計算社會結局（可大幅減少狀態數）")
+    parser.add_argument("--max-states", type=int, default=2_000_000, help="任一事件後狀態數超過即中止（0 為不限）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args(argv)
+
+    roles = args.roles.upper()
+    policies: dict[int, str] = {}
+    for key, vals in _parse_assignments(args.policy, roles).items():
+        for i in _player_indices(key, roles):
+            policies[i] = vals[-1]
+    abilities: dict[int, AbilityUse] = {}
+    for key, vals in _parse_assignments(args.ability, roles).items():
+        event, _, target = vals[-1].partition(":")
+        for i in _player_indices(key, roles):
+            abilities[i] = AbilityUse(int(event), int(target) if target else None)
+
+    try:
+        enumerator = Enumerator(list(roles), policies, abilities, social_only=args.social_only)
+        result = enumerator.run(max_states=args.max_states or None)
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+
+    if args.json:
+        print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
+        return
+
+    print(f"角色 {''.join(result.roles)}：{result.transitions} 次轉移，"
+          f"各事件後狀態數 {result.states_per_event}（{result.elapsed:.2f} 秒）")
+    print("\n社會結局：")
+    for key, p in sorted(result.endings.items()):
+        print(f"  {key}  {p:8.4%}")
+    if result.personal_endings:
+        print("\n個人結局：")
+    for i, pe in enumerate(result.personal_endings):
+        parts = "  ".join(f"{k}:{v:.2%}" for k, v in sorted(pe.items()))
+        print(f"  {i} {result.roles[i]}  {parts}")
+
+
+if __name__ == "__main__":
+    main()
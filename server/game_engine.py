@@ -4,8 +4,10 @@
 from __future__ import annotations
 
 import random
+from dataclasses import dataclass
 from typing import Any, Optional
 
+from .game_log import GameLog
 from .models import (
     CLOSURE_TEXT,
     COMPLY_CHOICES,
@@ -17,6 +19,7 @@ from .models import (
     EXTRA_ROLES_8,
     FORESHADOW_NARRATIVES,
     HOST_GUIDANCE,
+    MAX_NOTES_PER_GAME,
     MORAL_COLLAPSE_CHOICES,
     MORAL_COLLAPSE_TEXT,
     MORAL_COST_CHOICES,
@@ -33,18 +36,123 @@ from .models import (
     Foreshadow,
     ForeshadowType,
     GamePhase,
+    GameEvent,
     GameState,
     Player,
     RoleID,
 )
 
 
+# ── 結算規則表 ────────────────────────────────────────
+
+@dataclass(frozen=True)
+class ChoiceRule:
+    """單一 (事件, 選項) 的結算效果"""
+    fear: int
+    flow: int
+    risk: int
+    foreshadow: Optional[ForeshadowType]
+    message: str
+    narrative: str
+    category: str          # "comply" / "evade" / "resist"（投票統計、多數壓力、抵抗相關效果）
+    moral_cost: bool
+    moral_collapse: bool
+
+
+def compile_settlement_rules(events: list[GameEvent]) -> dict[int, dict[str, ChoiceRule]]:
+    """把 EVENTS 的選項效果與分類常數編譯成 event_number → choice_key → ChoiceRule"""
+    table: dict[int, dict[str, ChoiceRule]] = {}
+    for event in events:
+        narratives = NARRATIVE_RESULTS.get(event.number, {})
+        rules = {}
+        for c in event.choices:
+            if c.key in COMPLY_CHOICES:
+                category = "comply"
+            elif c.key in EVADE_CHOICES:
+                category = "evade"
+            elif c.key in RESIST_CHOICES:
+                category = "resist"
+            else:
+                category = ""
+            rules[c.key] = ChoiceRule(
+                fear=c.fear,
+                flow=c.flow,
+                risk=c.risk,
+                foreshadow=c.foreshadow,
+                message=c.message,
+                narrative=narratives.get(c.key, ""),
+                category=category,
+                moral_cost=c.key in MORAL_COST_CHOICES,
+                moral_collapse=c.key in MORAL_COLLAPSE_CHOICES,
+            )
+        table[event.number] = rules
+    return table
+
+
+SETTLEMENT_RULES = compile_settlement_rules(EVENTS)
+
+
+@dataclass(frozen=True)
+class RolePassive:
+    """角色被動的結算效果"""
+    fear_events: frozenset[int] = frozenset()  # 這些回合結算後社會恐懼 +1（不論選項）
+    resist_risk: int = 0                        # 選抵抗類時額外風險
+    message: str = ""
+
+
+ROLE_PASSIVES: dict[str, RolePassive] = {
+    # A 教師「眾目所視」：第 2、4、6 回合結算後，社會恐懼 +1
+    "A": RolePassive(fear_events=frozenset({2, 4, 6}), message="教師被動「眾目所視」觸發：社會恐懼 +1。"),
+    # B 公務員「服從義務」：選抵抗風險+1
+    "B": RolePassive(resist_risk=1, message="公務員被動「服從義務」觸發：風險額外 +1。"),
+    # C 大學生「激進標籤」：選抵抗風險+1
+    "C": RolePassive(resist_risk=1, message="大學生被動「激進標籤」觸發：風險額外 +1。"),
+}
+
+
 class GameEngine:
     """核心遊戲邏輯。一個 Room 持有一個 GameEngine。"""
 
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
         self.players: dict[str, Player] = {}  # player_id → Player
         self.state = GameState()
+        # 角色分配、伏筆擲幣、氛圍文字都用這個 RNG；傳入帶種子的實例即可重現整場遊戲
+        self.rng = rng or random.Random()
+        # 指令紀錄（None 表示不記錄，例如模擬器）
+        self.log: Optional[GameLog] = None
+
+    # ── 玩家 ──────────────────────────────────────────
+
+    def add_player(self, player: Player):
+        self.players[player.id] = player
+        if self.log is not None:
+            self.log.join(player.id, player.name)
+
+    def disconnect(self, player_id: str):
+        """標記玩家已斷線（保留在遊戲中）"""
+        self.players[player_id].connected = False
+        if self.log is not None:
+            self.log.leave(player_id)
+
+    def reconnect(self, player_id: str):
+        """斷線的玩家重新連上（保留原本的角色、票與風險）"""
+        player = self.players[player_id]
+        if player.connected:
+            return
+        player.connected = True
+        if self.log is not None:
+            self.log.rejoin(player_id)
+
+    def set_phase(self, phase: GamePhase):
+        self.state.phase = phase
+        if self.log is not None:
+            self.log.phase(phase)
+
+    def count_note(self, player_id: str):
+        """記錄玩家送出一張匿名紙條"""
+        self.players[player_id].note_count += 1
+        if self.log is not None:
+            self.log.note(player_id)
 
     # ── 氛圍文字 ──────────────────────────────────────
 
@@ -80,6 +188,30 @@ class GameEngine:
         if n < 6 or n > 8:
             raise ValueError(f"需要 6-8 位玩家，目前 {n} 位")
 
+        roles = self.role_pool(n)
+        self.rng.shuffle(roles)
+        self.rng.shuffle(player_ids)
+
+        assignment = {pid: role.value for pid, role in zip(player_ids, roles)}
+        self.apply_roles(assignment)
+
+        result = {}
+        for pid, role_id in assignment.items():
+            result[pid] = self.players[pid].role_info
+            result[pid]["role_id"] = role_id
+        return result
+
+    def apply_roles(self, assignment: dict[str, str]):
+        """套用角色分配（player_id → role_id），進入事件階段"""
+        for pid, role_id in assignment.items():
+            self.players[pid].role_id = role_id
+        self.state.phase = GamePhase.EVENT
+        if self.log is not None:
+            self.log.roles(assignment)
+
+    @staticmethod
+    def role_pool(n: int) -> list[RoleID]:
+        """n 位玩家時要分配的角色（未洗牌）"""
         roles = list(CORE_ROLES)  # A, B, C, D
 
         if n >= 7:
@@ -90,18 +222,7 @@ class GameEngine:
         # 補充到跟玩家數量一樣
         while len(roles) < n:
             roles.append(RoleID.E)  # 額外的用一般市民填充
-
-        random.shuffle(roles)
-        random.shuffle(player_ids)
-
-        result = {}
-        for pid, role in zip(player_ids, roles):
-            self.players[pid].role_id = role.value
-            result[pid] = self.players[pid].role_info
-            result[pid]["role_id"] = role.value
-
-        self.state.phase = GamePhase.EVENT
-        return result
+        return roles
 
     # ── 身份確認 ──────────────────────────────────────
 
@@ -111,6 +232,8 @@ class GameEngine:
         if not player or player.identity_confirmed:
             return False
         player.identity_confirmed = True
+        if self.log is not None:
+            self.log.confirm(player_id)
         return True
 
     def all_identities_confirmed(self) -> bool:
@@ -150,6 +273,8 @@ class GameEngine:
             return None
 
         self.state.current_event = next_num
+        if self.log is not None:
+            self.log.next_event()
         self.state.votes_this_round.clear()
         self.state.abilities_this_round.clear()
         self.state.public_voting = False
@@ -230,6 +355,8 @@ class GameEngine:
                 self.state.votes_this_round[pid] = evade_key
                 player.votes[self.state.current_event] = evade_key
                 auto_voted.append(pid)
+        if self.log is not None:
+            self.log.auto_evade(auto_voted)
         return auto_voted
 
     # ── 能力使用 ──────────────────────────────────────
@@ -307,6 +434,8 @@ class GameEngine:
         else:
             return {"success": False, "message": "無可用能力"}
 
+        if self.log is not None:
+            self.log.ability(player_id, target_player_id if role in ("D", "G") else None)
         return result
 
     # ── 投票 ──────────────────────────────────────────
@@ -324,9 +453,7 @@ class GameEngine:
             return False  # 被帶走的玩家不能投票
 
         # 驗證選項有效
-        event = EVENTS[self.state.current_event - 1]
-        valid_keys = [c.key for c in event.choices]
-        if choice not in valid_keys:
+        if choice not in SETTLEMENT_RULES.get(self.state.current_event, {}):
             return False
 
         # D 角色限制：恐懼≥3 不能選抵抗類
@@ -335,6 +462,8 @@ class GameEngine:
 
         self.state.votes_this_round[player_id] = choice
         player.votes[self.state.current_event] = choice
+        if self.log is not None:
+            self.log.vote(player_id, choice)
         return True
 
     def all_voted(self) -> bool:
@@ -351,6 +480,8 @@ class GameEngine:
         event_num = self.state.current_event
         event = EVENTS[event_num - 1]
         self.state.phase = GamePhase.SETTLING
+        if self.log is not None:
+            self.log.settle()
 
         fear_delta = 0
         flow_delta = 0
@@ -359,151 +490,71 @@ class GameEngine:
         for pid in self.players:
             player_results[pid] = {"risk_delta": 0, "messages": [], "narrative": ""}
 
-        # ── 處理每個玩家的投票 ──
+        # ── 單次走訪本回合投票：選項效果、角色被動、公開審查、投票統計 ──
+        rules = SETTLEMENT_RULES.get(event_num, {})
+        vote_counts = {"comply": 0, "evade": 0, "resist": 0}
+        resisters: list[str] = []
+
         for pid, choice in self.state.votes_this_round.items():
             player = self.players[pid]
             pr = player_results[pid]
+            rule = rules.get(choice)
+            if rule is None:
+                continue
 
-            # 追蹤服從選項
-            if choice in COMPLY_CHOICES:
+            if rule.category:
+                vote_counts[rule.category] += 1
+            if rule.category == "comply":
                 player.ever_complied = True
-
-            # 追蹤道德代價
-            if choice in MORAL_COST_CHOICES:
+            if rule.moral_cost:
                 player.moral_cost = True
-
-            # 追蹤道德崩解
-            if choice in MORAL_COLLAPSE_CHOICES:
+            if rule.moral_collapse:
                 player.moral_collapse = True
 
-            if event_num == 1:
-                # 事件1：服從(恐懼+1)，迴避(伏筆:模糊)，抵抗(流通+1,風險+1)
-                if choice == "comply":
-                    fear_delta += 1
-                elif choice == "evade":
-                    # A 角色能力：迴避不產生伏筆
-                    a_active = (player.role_id == "A" and
-                                pid in self.state.abilities_this_round and
-                                self.state.abilities_this_round[pid].get("type") == "A_no_foreshadow")
-                    if not a_active:
-                        player.foreshadows.append(
-                            Foreshadow(pid, ForeshadowType.VAGUE, event_num)
-                        )
-                        pr["messages"].append("⚠️ 這筆帳記下了，第 5 回合清算")
-                    else:
-                        pr["messages"].append("能力效果：迴避未產生伏筆。")
-                elif choice == "resist":
-                    flow_delta += 1
-                    pr["risk_delta"] += 1
-
-            elif event_num == 2:
-                # 事件2：安撫(恐懼-1)，沉默(伏筆:沉默)，提供資訊(風險-1,🩸道德代價)
-                if choice == "comfort":
-                    fear_delta -= 1
-                elif choice == "silence":
-                    player.foreshadows.append(
-                        Foreshadow(pid, ForeshadowType.SILENCE, event_num)
-                    )
+            fear_delta += rule.fear
+            flow_delta += rule.flow
+            pr["risk_delta"] += rule.risk
+
+            if rule.foreshadow is not None:
+                # A 角色能力：迴避（模糊）不產生伏筆
+                a_active = (rule.foreshadow == ForeshadowType.VAGUE and
+                            player.role_id == "A" and
+                            self.state.abilities_this_round.get(pid, {}).get("type") == "A_no_foreshadow")
+                if not a_active:
+                    player.foreshadows.append(Foreshadow(pid, rule.foreshadow, event_num))
                     pr["messages"].append("⚠️ 這筆帳記下了，第 5 回合清算")
-                elif choice == "info":
-                    pr["risk_delta"] -= 1
-                    pr["messages"].append("🩸 你提供了資訊。道德代價。")
-
-            elif event_num == 3:
-                # 事件3：遠離(風險-1)，提醒(流通+1,風險+1)，舉報(流通-1,風險-1,🩸道德代價)
-                if choice == "avoid":
-                    pr["risk_delta"] -= 1
-                elif choice == "warn":
-                    flow_delta += 1
+                else:
+                    pr["messages"].append("能力效果：迴避未產生伏筆。")
+            if rule.message:
+                pr["messages"].append(rule.message)
+            if rule.narrative:
+                pr["narrative"] = rule.narrative
+
+            # 角色被動效果（斷線玩家不觸發）
+            if player.connected:
+                fear_delta += self._apply_passive(player, event_num, rule, pr)
+
+            if rule.category == "resist":
+                resisters.append(pid)
+                # F 公開審查效果：選抵抗者額外+1風險
+                if self.state.public_voting:
                     pr["risk_delta"] += 1
-                elif choice == "report":
-                    flow_delta -= 1
-                    pr["risk_delta"] -= 1
-                    pr["messages"].append("🩸 你舉報了他們。道德代價。")
-
-            elif event_num == 4:
-                # 事件4：配合(恐懼+1)，模糊(伏筆:模糊)，拒絕(風險+2)
-                if choice == "cooperate":
-                    fear_delta += 1
-                elif choice == "vague":
-                    a_active = (player.role_id == "A" and
-                                pid in self.state.abilities_this_round and
-                                self.state.abilities_this_round[pid].get("type") == "A_no_foreshadow")
-                    if not a_active:
-                        player.foreshadows.append(
-                            Foreshadow(pid, ForeshadowType.VAGUE, event_num)
-                        )
-                        pr["messages"].append("⚠️ 這筆帳記下了，第 5 回合清算")
-                    else:
-                        pr["messages"].append("能力效果：迴避未產生伏筆。")
-                elif choice == "refuse":
-                    pr["risk_delta"] += 2
-
-            elif event_num == 6:
-                # 事件6：全面接受(恐懼+2,風險-2,💀道德崩解)，拖延(無效果)，公開拒絕(流通+1,風險+2)
-                if choice == "accept":
-                    fear_delta += 2
-                    pr["risk_delta"] -= 2
-                    pr["messages"].append("💀 你簽署了聲明。道德崩解。")
-                elif choice == "delay":
-                    # v2.0: 拖延敷衍 = 無效果
-                    pr["messages"].append("你選擇了拖延敷衍。什麼也沒有發生。")
-                elif choice == "refuse":
-                    flow_delta += 1
-                    pr["risk_delta"] += 2
-
-        # ── 敘事結果文字 ──
-        event_narratives = NARRATIVE_RESULTS.get(event_num, {})
-        for pid, choice in self.state.votes_this_round.items():
-            narrative = event_narratives.get(choice, "")
-            if narrative:
-                player_results[pid]["narrative"] = narrative
+                    pr["messages"].append("公開審查效果：抵抗者風險額外 +1。")
 
-        # ── 角色被動效果 ──
+        # 未投票但在線的玩家仍會觸發與選項無關的被動（A 教師）
         for pid, player in self.players.items():
-            if not player.connected:
-                continue
-            pr = player_results[pid]
-            choice = self.state.votes_this_round.get(pid)
-
-            # A 教師被動：「眾目所視」第 2、4、6 回合結算後，社會恐懼 +1
-            if player.role_id == "A" and event_num in (2, 4, 6):
-                fear_delta += 1
-                pr["messages"].append("教師被動「眾目所視」觸發：社會恐懼 +1。")
-
-            # B 公務員被動：選抵抗風險+1
-            if player.role_id == "B" and choice in RESIST_CHOICES:
-                pr["risk_delta"] += 1
-                pr["messages"].append("公務員被動「服從義務」觸發：風險額外 +1。")
-
-            # C 大學生被動：選抵抗風險+1
-            if player.role_id == "C" and choice in RESIST_CHOICES:
-                pr["risk_delta"] += 1
-                pr["messages"].append("大學生被動「激進標籤」觸發：風險額外 +1。")
-
-        # ── F 公開審查效果：選抵抗者額外+1風險 ──
-        if self.state.public_voting:
-            for pid, choice in self.state.votes_this_round.items():
-                if choice in RESIST_CHOICES:
-                    player_results[pid]["risk_delta"] += 1
-                    player_results[pid]["messages"].append("公開審查效果：抵抗者風險額外 +1。")
+            if player.connected and pid not in self.state.votes_this_round:
+                fear_delta += self._apply_passive(player, event_num, None, player_results[pid])
 
         # ── 高流通風險：思想流通≥3 時，選抵抗者風險+1 ──
-        current_flow = self.state.thought_flow + flow_delta
-        if current_flow >= 3:
-            for pid, choice in self.state.votes_this_round.items():
-                if choice in RESIST_CHOICES:
-                    player_results[pid]["risk_delta"] += 1
-                    player_results[pid]["messages"].append("高流通風險：思想流通≥3，抵抗者風險 +1。")
+        if self.state.thought_flow + flow_delta >= 3:
+            for pid in resisters:
+                player_results[pid]["risk_delta"] += 1
+                player_results[pid]["messages"].append("高流通風險：思想流通≥3，抵抗者風險 +1。")
 
         # ── 多數壓力判定：5人或以上選服從 → 恐懼+1 ──
-        comply_count = 0
-        for pid, choice in self.state.votes_this_round.items():
-            if choice in COMPLY_CHOICES:
-                comply_count += 1
-
         majority_fear = False
-        if comply_count >= 5:
+        if vote_counts["comply"] >= 5:
             majority_fear = True
             if not self.state.e_cancel_majority:
                 fear_delta += 1
@@ -554,18 +605,6 @@ class GameEngine:
             player.risk += pr["risk_delta"]
             player.risk = max(0, player.risk)
 
-        # ── 投票統計 ──
-        comply_total = 0
-        evade_total = 0
-        resist_total = 0
-        for pid, choice in self.state.votes_this_round.items():
-            if choice in COMPLY_CHOICES:
-                comply_total += 1
-            elif choice in EVADE_CHOICES:
-                evade_total += 1
-            elif choice in RESIST_CHOICES:
-                resist_total += 1
-
         # ── 被帶走檢查 ──
         taken_away_players = []
         for pid, player in self.players.items():
@@ -580,7 +619,9 @@ class GameEngine:
         atmosphere_text = self.get_atmosphere_text()
 
         # ── 社會情境敘事 ──
-        social_narrative = self._get_social_narrative(comply_total, evade_total, resist_total)
+        social_narrative = self._get_social_narrative(
+            vote_counts["comply"], vote_counts["evade"], vote_counts["resist"]
+        )
 
         # ── 風險警告 ──
         risk_warnings: dict[str, str] = {}
@@ -597,11 +638,7 @@ class GameEngine:
             "flow_delta": flow_delta,
             "majority_triggered": majority_fear,
             "public_voting": self.state.public_voting,
-            "vote_summary": {
-                "comply": comply_total,
-                "evade": evade_total,
-                "resist": resist_total,
-            },
+            "vote_summary": vote_counts,
             "taken_away": taken_away_players,
             "atmosphere_text": atmosphere_text,
             "social_narrative": social_narrative,
@@ -619,6 +656,20 @@ class GameEngine:
             },
         }
 
+    def _apply_passive(self, player: Player, event_num: int, rule: Optional[ChoiceRule], pr: dict) -> int:
+        """套用角色被動（rule 為 None 表示未投票）。回傳造成的社會恐懼變化。"""
+        passive = ROLE_PASSIVES.get(player.role_id)
+        if passive is None:
+            return 0
+        fear = 0
+        if event_num in passive.fear_events:
+            fear += 1
+            pr["messages"].append(passive.message)
+        if passive.resist_risk and rule is not None and rule.category == "resist":
+            pr["risk_delta"] += passive.resist_risk
+            pr["messages"].append(passive.message)
+        return fear
+
     # ── 事件 5 伏筆清算 ──────────────────────────────
 
     def settle_foreshadows(self) -> dict:
@@ -664,7 +715,7 @@ class GameEngine:
                 elif fs.ftype == ForeshadowType.VAGUE:
                     # 模糊標記：風險 +5，擲幣 50% → +10
                     player_results[pid]["risk_delta"] += 5
-                    coin = random.choice(["heads", "tails"])
+                    coin = self.rng.choice(["heads", "tails"])
                     extra = 10 if coin == "heads" else 0
                     player_results[pid]["risk_delta"] += extra
                     player_results[pid]["coin_flips"].append({
@@ -684,6 +735,12 @@ class GameEngine:
                             FORESHADOW_NARRATIVES["vague_result_tails"]
                         )
 
+        if self.log is not None:
+            self.log.foreshadows({
+                pid: [flip["result"] == "heads" for flip in pr["coin_flips"]]
+                for pid, pr in player_results.items()
+            })
+
         # 集體代價：每 2 位有伏筆的玩家 → 額外恐懼+1
         foreshadow_count = len(players_with_foreshadow)
         extra_fear = foreshadow_count // 2
@@ -744,28 +801,7 @@ class GameEngine:
         fear = self.state.social_fear
         flow = self.state.thought_flow
 
-        # v2.0 社會結局判定（按優先順序）
-        # C 全面噤聲：恐懼≥6
-        # E 短暫的春天：恐懼=0, 流通≥4
-        # A 表面穩定：恐懼≥4, 流通≤1
-        # B 緊繃未崩：恐懼≥4, 流通 2-3
-        # D 裂縫中的光：恐懼≤2, 流通≥2
-        social_ending_key = None
-        if fear >= 6:
-            social_ending_key = "C"
-        elif fear == 0 and flow >= 4:
-            social_ending_key = "E"
-        elif fear >= 4 and flow <= 1:
-            social_ending_key = "A"
-        elif fear >= 4 and 2 <= flow <= 3:
-            social_ending_key = "B"
-        elif fear <= 2 and flow >= 2:
-            social_ending_key = "D"
-
-        # 若都不符合，取最接近的
-        if social_ending_key is None:
-            social_ending_key = self._find_closest_ending(fear, flow)
-
+        social_ending_key = self.social_ending_key(fear, flow)
         social_ending = ENDINGS[social_ending_key]
 
         # v2.0 個人結局
@@ -782,6 +818,8 @@ class GameEngine:
             })
 
         self.state.phase = GamePhase.ENDED
+        if self.log is not None:
+            self.log.end()
 
         return {
             "social_ending": {
@@ -798,7 +836,34 @@ class GameEngine:
             },
         }
 
-    def _determine_personal_ending(self, player: Player) -> dict:
+    @staticmethod
+    def social_ending_key(fear: int, flow: int) -> str:
+        """依社會恐懼與思想流通判定社會結局 key"""
+        # v2.0 社會結局判定（按優先順序）
+        # C 全面噤聲：恐懼≥6
+        # E 短暫的春天：恐懼=0, 流通≥4
+        # A 表面穩定：恐懼≥4, 流通≤1
+        # B 緊繃未崩：恐懼≥4, 流通 2-3
+        # D 裂縫中的光：恐懼≤2, 流通≥2
+        social_ending_key = None
+        if fear >= 6:
+            social_ending_key = "C"
+        elif fear == 0 and flow >= 4:
+            social_ending_key = "E"
+        elif fear >= 4 and flow <= 1:
+            social_ending_key = "A"
+        elif fear >= 4 and 2 <= flow <= 3:
+            social_ending_key = "B"
+        elif fear <= 2 and flow >= 2:
+            social_ending_key = "D"
+
+        # 若都不符合，取最接近的
+        if social_ending_key is None:
+            social_ending_key = GameEngine._find_closest_ending(fear, flow)
+        return social_ending_key
+
+    @staticmethod
+    def _determine_personal_ending(player: Player) -> dict:
         """判定單一玩家的個人結局"""
         # 🚨 被帶走：風險≥10
         if player.risk >= 10:
@@ -845,7 +910,8 @@ class GameEngine:
             "taken_away": False,
         }
 
-    def _find_closest_ending(self, fear: int, flow: int) -> str:
+    @staticmethod
+    def _find_closest_ending(fear: int, flow: int) -> str:
         """找最接近的結局"""
         targets = {
             "C": (6, None),
@@ -901,6 +967,38 @@ class GameEngine:
             "players": players_data,
         }
 
+    def get_player_view(self, player_id: str) -> dict:
+        """玩家視角：重新連線時補上目前狀態（只含該玩家看得到的資訊）"""
+        player = self.players[player_id]
+        view = {
+            "phase": self.state.phase.value,
+            "event_number": self.state.current_event,
+            "social_fear": self.state.social_fear,
+            "thought_flow": self.state.thought_flow,
+            "role": {
+                "role_id": player.role_id,
+                **player.role_info,
+            } if player.role_id else None,
+            "identity_confirmed": player.identity_confirmed,
+            "ability_used": player.ability_used,
+            "risk": player.risk,
+            "risk_zone": self._get_risk_zone(player.risk),
+            "note_remaining": MAX_NOTES_PER_GAME - player.note_count,
+            "taken_away": player.taken_away,
+            "observer_mode": player.observer_mode,
+            "vote": self.state.votes_this_round.get(player_id),
+            "public_voting": self.state.public_voting,
+        }
+        if self.state.current_event and self.state.phase not in (GamePhase.WAITING, GamePhase.ENDED):
+            event = EVENTS[self.state.current_event - 1]
+            view["event"] = {
+                "title": event.title,
+                "description": event.description,
+                "choices": self.get_choices_for_player(player_id),
+                "is_auto_settle": event.is_auto_settle,
+            }
+        return view
+
     # ── v3.0 輔助方法 ────────────────────────────────────
 
     def _get_risk_zone(self, risk: int) -> str:
@@ -950,6 +1048,8 @@ class GameEngine:
         player = self.players.get(player_id)
         if player and player.taken_away and not player.observer_mode:
             player.observer_mode = True
+            if self.log is not None:
+                self.log.observer(player_id)
             return True
         return False
 
@@ -957,7 +1057,7 @@ class GameEngine:
         """取得隨機等待氛圍文字"""
         texts = WAITING_ATMOSPHERE.get(context, [])
         if texts:
-            return random.choice(texts)
+            return self.rng.choice(texts)
         return ""
 
     def get_host_guidance(self, event_number: int, phase: str) -> str:
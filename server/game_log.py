@@ -0,0 +1,390 @@
+"""
+靜默之島：選擇與代價 — 遊戲指令紀錄與重播
+
+GameEngine 的每個狀態變更（加入、角色分配、投票、能力、結算…）依序附加到 GameLog，
+一場遊戲如何走到現在都有紀錄。隨機或由狀態推導出的結果（角色分配、擲幣、超時自動迴避的玩家）
+也一併記下，重播不依賴 RNG：規則改變後重播舊紀錄，可以檢查這些結果是否仍然相同。
+
+編碼：一個格式位元組，之後每筆紀錄為「指令碼 + 參數」，整數皆為 LEB128 varint。
+玩家以加入順序的索引表示，選項以該事件選項列表中的索引表示，一場 8 人遊戲約 200 bytes。
+
+- replay()：以 GameEngine 逐筆重播（完整重建房間狀態，並驗證紀錄的結果）
+- server.batch_engine.replay_logs()：以 NumPy 一次重播大量已結束的遊戲（只算結算與結局）
+
+吞吐量：replay() 單核心約每秒 2 千場（一場約 0.5 ms），未達每秒數萬場的目標。
+時間大多在 GameEngine 本身（settle_round 約四成，其餘為投票、能力與解碼），
+略過敘事與檢視也只快約兩成，所以它只用於當機後重建單一房間。
+規則改變後大量重新驗證歷史遊戲請用 replay_logs()，單核心約每秒 3–4 萬場。
+
+使用方法（以模擬遊戲產生紀錄並量測重播速度）：
+  python -m server.game_log --games 20000 --seed 1
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+from .models import EVENTS, GamePhase, Player
+
+# 紀錄格式版本（指令或參數有不相容變動時遞增）
+LOG_FORMAT = 1
+
+ROLES = "ABCDEFG"
+PHASES = list(GamePhase)
+
+# ── 指令碼 ────────────────────────────────────────────
+(
+    OP_JOIN,          # 玩家 id, 名字
+    OP_LEAVE,         # 玩家
+    OP_ROLES,         # 人數, 每位玩家的角色（加入順序）
+    OP_CONFIRM,       # 玩家
+    OP_NEXT_EVENT,    # —
+    OP_PHASE,         # 階段
+    OP_ABILITY,       # 玩家, 目標 + 1（0 表示沒有目標）
+    OP_VOTE,          # 玩家, 選項
+    OP_AUTO_EVADE,    # 人數, 被自動迴避的玩家…
+    OP_SETTLE,        # —
+    OP_FORESHADOWS,   # 人數, 每位玩家（擲幣數, 正面位元）
+    OP_OBSERVER,      # 玩家
+    OP_NOTE,          # 玩家
+    OP_END,           # —
+    OP_REJOIN,        # 玩家（斷線後以 resume 重新連上）
+) = range(15)
+
+OP_NAMES = (
+    "join", "leave", "roles", "confirm", "next_event", "phase", "ability",
+    "vote", "auto_evade", "settle", "foreshadows", "observer", "note", "end", "rejoin",
+)
+
+
+class ReplayMismatch(ValueError):
+    """重播結果與紀錄不一致（規則改變或紀錄損毀）"""
+
+
+# ── varint ────────────────────────────────────────────
+
+def put_varint(buf: bytearray, value: int):
+    """附加一個 LEB128 無號整數"""
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _put_str(buf: bytearray, text: str):
+    data = text.encode("utf-8")
+    put_varint(buf, len(data))
+    buf += data
+
+
+def get_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """讀取 pos 處的 LEB128 無號整數，回傳 (值, 下一個位置)；server.batch_engine 也用它略過字串參數"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _get_str(data: bytes, pos: int) -> tuple[str, int]:
+    size, pos = get_varint(data, pos)
+    return data[pos:pos + size].decode("utf-8"), pos + size
+
+
+# ── 紀錄 ──────────────────────────────────────────────
+
+class GameLog:
+    """一場遊戲的指令紀錄（只附加）"""
+
+    def __init__(self, data: bytes = b""):
+        self.data = bytearray(data or bytes([LOG_FORMAT]))
+        self.players: dict[str, int] = {}   # player_id → 加入順序
+        self.event = 0                      # 目前事件（選項索引以此查表）
+        self.records = 0
+        if data:
+            # 從既有紀錄接續：重建索引
+            for op, args in records(bytes(self.data)):
+                self.records += 1
+                if op == OP_JOIN:
+                    self.players[args[0]] = len(self.players)
+                elif op == OP_NEXT_EVENT:
+                    self.event += 1
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def _op(self, op: int, *values: int):
+        self.data.append(op)
+        for value in values:
+            put_varint(self.data, value)
+        self.records += 1
+
+    def join(self, player_id: str, name: str):
+        self.players[player_id] = len(self.players)
+        self.data.append(OP_JOIN)
+        _put_str(self.data, player_id)
+        _put_str(self.data, name)
+        self.records += 1
+
+    def leave(self, player_id: str):
+        self._op(OP_LEAVE, self.players[player_id])
+
+    def rejoin(self, player_id: str):
+        self._op(OP_REJOIN, self.players[player_id])
+
+    def roles(self, assignment: dict[str, str]):
+        order = sorted(assignment, key=self.players.__getitem__)
+        self._op(OP_ROLES, len(order), *(ROLES.index(assignment[pid]) for pid in order))
+
+    def confirm(self, player_id: str):
+        self._op(OP_CONFIRM, self.players[player_id])
+
+    def next_event(self):
+        self.event += 1
+        self._op(OP_NEXT_EVENT)
+
+    def phase(self, phase: GamePhase):
+        self._op(OP_PHASE, PHASES.index(phase))
+
+    def ability(self, player_id: str, target_id: Optional[str]):
+        self._op(OP_ABILITY, self.players[player_id], self.players[target_id] + 1 if target_id else 0)
+
+    def vote(self, player_id: str, choice: str):
+        keys = [c.key for c in EVENTS[self.event - 1].choices]
+        self._op(OP_VOTE, self.players[player_id], keys.index(choice))
+
+    def auto_evade(self, player_ids: list[str]):
+        self._op(OP_AUTO_EVADE, len(player_ids), *(self.players[pid] for pid in player_ids))
+
+    def settle(self):
+        self._op(OP_SETTLE)
+
+    def foreshadows(self, flips: dict[str, list[bool]]):
+        """flips：每位玩家依序的擲幣結果（True 為正面）"""
+        values = [len(self.players)]
+        for pid in sorted(self.players, key=self.players.__getitem__):
+            coins = flips.get(pid, [])
+            values += [len(coins), sum(1 << i for i, heads in enumerate(coins) if heads)]
+        self._op(OP_FORESHADOWS, *values)
+
+    def observer(self, player_id: str):
+        self._op(OP_OBSERVER, self.players[player_id])
+
+    def note(self, player_id: str):
+        self._op(OP_NOTE, self.players[player_id])
+
+    def end(self):
+        self._op(OP_END)
+
+
+def records(data: bytes) -> Iterator[tuple[int, tuple]]:
+    """解碼紀錄：依序產生 (指令碼, 參數)；玩家仍是加入順序的索引（OP_JOIN 為字串）"""
+    if not data or data[0] != LOG_FORMAT:
+        raise ValueError(f"不支援的紀錄格式：{data[:1]!r}")
+    pos, end = 1, len(data)
+    # 玩家、選項、角色索引都小於 128：varint 幾乎都是單一位元組，先走快速路徑
+    while pos < end:
+        op = data[pos]
+        pos += 1
+        if op in _NO_ARGS:
+            yield op, ()
+        elif op in _ONE_ARG:
+            value = data[pos]
+            if value < 0x80:
+                pos += 1
+            else:
+                value, pos = get_varint(data, pos)
+            yield op, (value,)
+        elif op in _TWO_ARGS:
+            a, b = data[pos], data[pos + 1]
+            if a < 0x80 and b < 0x80:
+                pos += 2
+            else:
+                a, pos = get_varint(data, pos)
+                b, pos = get_varint(data, pos)
+            yield op, (a, b)
+        elif op in _LIST_ARGS:
+            count, pos = get_varint(data, pos)
+            values = tuple(data[pos:pos + count])
+            if all(v < 0x80 for v in values):
+                pos += count
+            else:
+                values = []
+                for _ in range(count):
+                    value, pos = get_varint(data, pos)
+                    values.append(value)
+                values = tuple(values)
+            yield op, values
+        elif op == OP_JOIN:
+            player_id, pos = _get_str(data, pos)
+            name, pos = _get_str(data, pos)
+            yield op, (player_id, name)
+        elif op == OP_FORESHADOWS:
+            count, pos = get_varint(data, pos)
+            values = []
+            for _ in range(count):
+                flips, pos = get_varint(data, pos)
+                bits, pos = get_varint(data, pos)
+                values.append(_FLIPS[flips][bits] if flips < len(_FLIPS) else tuple(bool(bits >> i & 1) for i in range(flips)))
+            yield op, tuple(values)
+        else:
+            raise ValueError(f"未知的指令碼 {op}（位置 {pos - 1}）")
+
+
+_NO_ARGS = frozenset({OP_NEXT_EVENT, OP_SETTLE, OP_END})
+_ONE_ARG = frozenset({OP_LEAVE, OP_CONFIRM, OP_PHASE, OP_OBSERVER, OP_NOTE, OP_REJOIN})
+_TWO_ARGS = frozenset({OP_ABILITY, OP_VOTE})
+_LIST_ARGS = frozenset({OP_ROLES, OP_AUTO_EVADE})
+# 擲幣數 → 正面位元 → 結果 tuple（常見的少量擲幣預先展開）
+_FLIPS = [[tuple(bool(bits >> i & 1) for i in range(n)) for bits in range(1 << n)] for n in range(8)]
+
+
+# ── 重播 ──────────────────────────────────────────────
+
+class ScriptedRandom(random.Random):
+    """choice() 依序回傳預先排好的結果，讓 GameEngine 重現紀錄中的擲幣"""
+
+    def __init__(self):
+        super().__init__(0)
+        self.queue: deque = deque()
+
+    def choice(self, seq):
+        return self.queue.popleft()
+
+
+def replay(data: bytes, strict: bool = True, resume: bool = False):
+    """
+    以 GameEngine 逐筆重播紀錄，回傳重建的引擎。
+    strict 時，投票 / 能力失敗或自動迴避的玩家與紀錄不同會丟出 ReplayMismatch。
+    resume 時引擎接續使用這份紀錄（例如當機後重建房間），否則不記錄。
+    """
+    from .game_engine import GameEngine
+
+    coins = ScriptedRandom()
+    engine = GameEngine(rng=coins)
+    ids: list[str] = []
+
+    def check(ok: bool, what: str):
+        if strict and not ok:
+            raise ReplayMismatch(f"事件 {engine.state.current_event}：{what}")
+
+    for op, args in records(data):
+        if op == OP_JOIN:
+            player_id, name = args
+            engine.add_player(Player(id=player_id, name=name))
+            ids.append(player_id)
+        elif op == OP_LEAVE:
+            engine.disconnect(ids[args[0]])
+        elif op == OP_REJOIN:
+            engine.reconnect(ids[args[0]])
+        elif op == OP_ROLES:
+            engine.apply_roles({ids[i]: ROLES[r] for i, r in enumerate(args)})
+        elif op == OP_CONFIRM:
+            engine.confirm_identity(ids[args[0]])
+        elif op == OP_NEXT_EVENT:
+            engine.get_next_event()
+        elif op == OP_PHASE:
+            engine.set_phase(PHASES[args[0]])
+        elif op == OP_ABILITY:
+            player, target = args
+            result = engine.use_ability(ids[player], ids[target - 1] if target else None)
+            check(result["success"], f"{ids[player]} 的能力無法使用：{result['message']}")
+        elif op == OP_VOTE:
+            player, choice = args
+            key = EVENTS[engine.state.current_event - 1].choices[choice].key
+            check(engine.submit_vote(ids[player], key), f"{ids[player]} 投 {key} 失敗")
+        elif op == OP_AUTO_EVADE:
+            voted = engine.auto_evade_timeout_players()
+            check(voted == [ids[i] for i in args], f"自動迴避 {voted}，紀錄為 {[ids[i] for i in args]}")
+        elif op == OP_SETTLE:
+            engine.settle_round()
+        elif op == OP_FORESHADOWS:
+            for flips in args:
+                coins.queue.extend("heads" if heads else "tails" for heads in flips)
+            engine.settle_foreshadows()
+            check(not coins.queue, "擲幣次數與紀錄不同")
+            coins.queue.clear()
+        elif op == OP_OBSERVER:
+            engine.transition_to_observer(ids[args[0]])
+        elif op == OP_NOTE:
+            engine.count_note(ids[args[0]])
+        elif op == OP_END:
+            engine.determine_ending()
+
+    engine.rng = random.Random()
+    if resume:
+        engine.log = GameLog(data)
+    return engine
+
+
+# ── CLI ───────────────────────────────────────────────
+
+def record_games(games: int, seed: int) -> list[bytes]:
+    """以無頭模擬器跑 games 場並回傳各場的紀錄"""
+    from .game_engine import GameEngine
+    from .simulate import SimulationConfig, play_game
+
+    rng = random.Random(seed)
+    config = SimulationConfig()
+    logs = []
+    for _ in range(games):
+        engine = GameEngine(rng)
+        engine.log = GameLog()
+        for j in range(rng.choice(config.players)):
+            engine.add_player(Player(id=f"p{j}", name=f"p{j}"))
+        play_game(engine, config, rng)
+        logs.append(bytes(engine.log))
+    return logs
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="靜默之島 指令紀錄重播")
+    parser.add_argument("--games", type=int, default=20000, help="產生並重播的場數")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    logs = record_games(args.games, args.seed)
+    size = sum(map(len, logs))
+    print(f"紀錄 {args.games} 場：平均 {size / len(logs):.0f} bytes / 場")
+
+    start = time.perf_counter()
+    engines = [replay(log) for log in logs]
+    elapsed = time.perf_counter() - start
+    print(f"GameEngine 重播：{args.games / elapsed:,.0f} 場/秒（完整重建房間，未達每秒數萬場；大量驗證請用批次重播）")
+
+    try:
+        from .batch_engine import replay_logs
+    except ImportError:
+        print("（未安裝 numpy，略過批次重播；每秒數萬場的重新驗證需要 numpy）")
+        return
+
+    start = time.perf_counter()
+    groups = replay_logs(logs)
+    elapsed = time.perf_counter() - start
+    print(f"批次重播：{args.games / elapsed:,.0f} 場/秒")
+
+    mismatches = []
+    for indices, batch in groups:
+        for k, i in enumerate(indices.tolist()):
+            engine = engines[i]
+            expected = (engine.state.social_fear, engine.state.thought_flow, [p.risk for p in engine.players.values()])
+            if expected != (int(batch.fear[k]), int(batch.flow[k]), batch.risk[k].tolist()):
+                mismatches.append(i)
+    if mismatches:
+        print(f"❌ {len(mismatches)} 場批次與逐筆重播不一致，例如第 {mismatches[0]} 場")
+        sys.exit(1)
+    print("✅ 批次與逐筆重播結果一致")
+
+
+if __name__ == "__main__":
+    main()
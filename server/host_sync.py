@@ -0,0 +1,76 @@
+"""
+靜默之島：選擇與代價 — 關主狀態增量同步
+
+關主畫面在幾乎每個動作後都要更新 get_host_view()（恐懼、流通、階段、每位玩家的風險…），
+但每次大部分欄位都沒變。改為有版本的狀態通道：
+- 每則帶有關主狀態的訊息附上遞增的序號 seq
+- 一般只送與上一次相比有變動的欄位（host_delta）
+- 關主剛連上、本地沒有比對基準，或關主發現序號跳號而要求（host_sync）時，才送完整快照（host_view）
+
+host_delta 格式：{"social_fear": 3, "phase": "voting", "players": {player_id: {"risk": 5}}}
+玩家的欄位整個取代（foreshadows、votes 也是）；玩家有增減時改送完整快照。
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Optional
+
+# 全部房間合計的送出次數（供 /api/metrics）
+sent: Counter[str] = Counter()
+
+
+def normalize(view: dict[str, Any]) -> dict[str, Any]:
+    """比對用的形式：玩家以 id 為鍵；votes 的鍵轉成字串（與送出的 JSON 相同，也能原樣存入房間狀態）"""
+    players = {}
+    for player in view["players"]:
+        fields = dict(player)
+        fields["votes"] = {str(event): choice for event, choice in player["votes"].items()}
+        players[player["id"]] = fields
+    return {**{k: v for k, v in view.items() if k != "players"}, "players": players}
+
+
+def diff(base: dict[str, Any], current: dict[str, Any]) -> dict[str, Any]:
+    delta = {k: v for k, v in current.items() if k != "players" and base.get(k) != v}
+    players = {}
+    for pid, fields in current["players"].items():
+        before = base["players"][pid]
+        changed = {k: v for k, v in fields.items() if before.get(k) != v}
+        if changed:
+            players[pid] = changed
+    if players:
+        delta["players"] = players
+    return delta
+
+
+class HostSync:
+    """一個房間的關主狀態通道：序號與關主目前持有的狀態（下一次的比對基準）"""
+
+    def __init__(self, seq: int = 0, base: Optional[dict[str, Any]] = None):
+        self.seq = seq
+        self.base = base   # None：下一次送完整快照
+
+    def reset(self):
+        """關主（重新）連上：下一次送完整快照"""
+        self.base = None
+
+    def update(self, view: dict[str, Any]) -> dict[str, Any]:
+        """回傳要併入關主訊息的欄位：{"seq", "host_delta"}，或沒有基準時 {"seq", "host_view"}"""
+        current = normalize(view)
+        self.seq += 1
+        base, self.base = self.base, current
+        if base is None or base["players"].keys() != current["players"].keys():
+            sent["full"] += 1
+            return {"seq": self.seq, "host_view": view}
+        sent["delta"] += 1
+        return {"seq": self.seq, "host_delta": diff(base, current)}
+
+    def full(self, view: dict[str, Any]) -> dict[str, Any]:
+        self.base = None
+        return self.update(view)
+
+    def to_list(self) -> list:
+        return [self.seq, self.base]
+
+    @classmethod
+    def from_list(cls, data: Optional[list]) -> HostSync:
+        return cls(*data) if data else cls()
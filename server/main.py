@@ -4,31 +4,60 @@
 from __future__ import annotations
 
 import asyncio
-import io
+import hmac
 import json
 import logging
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
-import qrcode
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import HTMLResponse, StreamingResponse, RedirectResponse
+from fastapi import FastAPI, Query, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.websockets import WebSocketDisconnected
 
+from . import affinity, bus as message_bus, compression, host_sync, outbound, qr, resume, snapshot, wire
+from .assets import PrecompressedStaticFiles
+from .bus import RemoteSocket
+from .dispatch import Dispatcher, Session
 from .models import GamePhase, MAX_NOTES_PER_GAME, MAX_NOTE_LENGTH
+from .outbound import EncodedMessage, Payload, encode
+from .pages import StaticPage
+from .qr import qr_cache
 from .room import Room, room_manager
+from .state import LockTimeout
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("silent-island")
 
-app = FastAPI(title="靜默之島：選擇與代價 v2.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 續玩憑證的金鑰：重新啟動後與其他 worker 都要能驗證
+    await resume.persist_secret(resume_tokens, room_manager.backend, snapshots)
+    if snapshots:
+        logger.info(f"Restored {snapshots.restore()} rooms from snapshot {snapshots.store.path}")
+        snapshots.start()
+    reaper = asyncio.create_task(_reap_rooms())
+    await bus.start(_deliver_from_bus)
+    yield
+    reaper.cancel()
+    await bus.close()
+    if snapshots:
+        await snapshots.close()
+    await room_manager.backend.close()
+
+
+app = FastAPI(title="靜默之島：選擇與代價 v2.0", lifespan=lifespan)
 
 # ── 靜態檔案 ──────────────────────────────────────────
 CLIENT_DIR = Path(__file__).parent.parent / "client"
 REACT_DIR = Path(__file__).parent.parent / "client-react" / "out"
 AUDIO_DIR = Path(__file__).parent.parent / "audio"
 
-app.mount("/static", StaticFiles(directory=str(CLIENT_DIR)), name="static")
+# JS / CSS 啟動時預先壓縮，依 Accept-Encoding 回傳 gzip / br
+app.mount("/static", PrecompressedStaticFiles(directory=str(CLIENT_DIR)), name="static")
 
 # 背景音樂 / 音效
 if AUDIO_DIR.exists():
@@ -37,35 +66,44 @@ if AUDIO_DIR.exists():
 # React 靜態資源（_next/）
 _next_dir = REACT_DIR / "_next"
 if _next_dir.exists():
-    app.mount("/_next", StaticFiles(directory=str(_next_dir)), name="react-next")
+    app.mount("/_next", PrecompressedStaticFiles(directory=str(_next_dir), immutable=True), name="react-next")
 else:
     logger.warning(f"React build not found at {REACT_DIR}, /play will return 404")
 
 
 # ── HTTP Routes ───────────────────────────────────────
 
+# 頁面啟動時載入一次，之後從記憶體回應（支援 ETag / 304）
+PAGES = {
+    "index": StaticPage(CLIENT_DIR / "index.html"),
+    "host": StaticPage(CLIENT_DIR / "host.html"),
+    "player": StaticPage(CLIENT_DIR / "player.html", placeholder="{{ROOM_CODE}}"),
+    "react": StaticPage(REACT_DIR / "index.html"),
+}
+
+
 @app.get("/")
-async def index():
-    return HTMLResponse((CLIENT_DIR / "index.html").read_text(encoding="utf-8"))
+async def index(request: Request):
+    return PAGES["index"].response(request)
 
 
 @app.get("/host")
-async def host_page():
-    return HTMLResponse((CLIENT_DIR / "host.html").read_text(encoding="utf-8"))
+async def host_page(request: Request):
+    return PAGES["host"].response(request)
 
 
 @app.get("/player")
-async def player_page():
+async def player_page(request: Request):
     """舊版玩家頁面（vanilla JS）"""
-    return HTMLResponse((CLIENT_DIR / "player.html").read_text(encoding="utf-8"))
+    return PAGES["player"].response(request)
 
 
 @app.get("/play")
-async def react_player_page():
+async def react_player_page(request: Request):
     """React 玩家頁面"""
-    html_path = REACT_DIR / "index.html"
-    if html_path.exists():
-        return HTMLResponse(html_path.read_text(encoding="utf-8"))
+    page = PAGES["react"]
+    if page.exists:
+        return page.response(request)
     return HTMLResponse("<p>React build not found. Run: cd client-react && npm run build</p>", status_code=404)
 
 
@@ -73,630 +111,1024 @@ async def react_player_page():
 async def join_page(room: Optional[str] = None):
     """掃 QR Code 後跳轉到玩家頁面（React 版）"""
     if room:
-        html_path = REACT_DIR / "index.html"
-        if html_path.exists():
+        if PAGES["react"].exists:
             return RedirectResponse(f"/play?room={room}")
         # fallback 到舊版
-        html = (CLIENT_DIR / "player.html").read_text(encoding="utf-8")
-        html = html.replace("{{ROOM_CODE}}", room)
-        return HTMLResponse(html)
+        return PAGES["player"].render(room)
     return RedirectResponse("/")
 
 
-@app.get("/api/qr/{room_code}")
-async def get_qr(room_code: str, request: Request):
-    """產生 QR Code 圖片"""
-    base_url = str(request.base_url).rstrip("/")
-    join_url = f"{base_url}/join?room={room_code}"
+room_manager.on_remove(qr_cache.discard_room)
 
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(join_url)
-    qr.make(fit=True)
+# 房間親和路由（SILENT_ISLAND_WORKERS 未設定時為 None）
+router = affinity.router_from_env()
+# 房間狀態快照（SILENT_ISLAND_SNAPSHOT 未設定時為 None）
+snapshots = snapshot.snapshotter_from_env(room_manager)
+# 斷線續玩憑證（SILENT_ISLAND_RESUME_SECRET）
+resume_tokens = resume.tokens_from_env()
+if router:
+    room_manager.code_filter = router.is_local
+# 管理 API 的權杖（SILENT_ISLAND_ADMIN_TOKEN；未設定時管理 API 停用）
+admin_token = os.environ.get("SILENT_ISLAND_ADMIN_TOKEN")
 
-    img = qr.make_image(fill_color="white", back_color="black")
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
 
-    return StreamingResponse(buf, media_type="image/png")
+@app.get("/api/qr/{room_code}")
+async def get_qr(room_code: str, request: Request, fmt: str = Query("png", alias="format")):
+    """產生 QR Code 圖片（format=png 或 svg；結果快取，房間移除時清除）"""
+    if fmt not in qr.MEDIA_TYPES:
+        return Response(f"unsupported format: {fmt}", status_code=400)
+    base_url = str(request.base_url).rstrip("/")
+    body = await qr_cache.render_async(base_url, room_code, fmt)
+    # 圖片只由網址決定，內容不會變
+    return Response(body, media_type=qr.MEDIA_TYPES[fmt], headers={"Cache-Control": "public, max-age=3600"})
+
+
+@app.get("/api/config")
+async def client_config():
+    """首頁加入表單用的房間碼格式（SILENT_ISLAND_ROOM_CODE_LENGTH / _ALPHABET）"""
+    return {
+        "room_code_length": room_manager.codes.length,
+        "room_code_alphabet": room_manager.codes.alphabet,
+    }
+
+
+@app.get("/api/metrics")
+async def metrics():
+    """各房間連線的發送佇列狀態（深度、落後、延遲），用來找出落後的玩家"""
+    def outbox_stats(ws) -> Optional[dict]:
+        if isinstance(ws, RemoteSocket):
+            return {"worker": ws.worker}
+        outbox = outbound.get(ws) if ws else None
+        return outbox.stats() if outbox else None
+
+    rooms = {}
+    for code, room in room_manager.rooms.items():
+        rooms[code] = {
+            "host": outbox_stats(room.host_ws),
+            "players": {pid: outbox_stats(pws) for pid, pws in room.player_ws.items()},
+            "compression": {"enabled": room.compress, **(compression.room_stats(room.sockets) or {})},
+        }
+    return {
+        "rooms": room_manager.stats(),
+        "outbound": rooms,
+        "handlers": dispatcher.stats(),
+        "qr_cache": qr_cache.stats(),
+        "affinity": router.stats() if router else None,
+        "bus": bus.stats(),
+        "snapshots": snapshots.stats() if snapshots else None,
+        "host_sync": dict(host_sync.sent),
+        "compression": compression.stats(),
+    }
+
+
+def _is_admin(request: Request) -> bool:
+    """請求帶有 Authorization: Bearer <SILENT_ISLAND_ADMIN_TOKEN>"""
+    if not admin_token:
+        return False
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), admin_token.encode())
+
+
+@app.post("/api/rooms/{room_code}/compression")
+async def set_room_compression(room_code: str, request: Request, enabled: bool = Query(...)):
+    """開關房間的 WebSocket 壓縮（CPU 吃緊時關閉；已連線的玩家不必重連）
+
+    需要管理權杖；房間親和路由時轉給擁有該房間的 worker。
+    """
+    if not admin_token:
+        return Response("admin API disabled: set SILENT_ISLAND_ADMIN_TOKEN", status_code=403)
+    if not _is_admin(request):
+        return Response("unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    code = room_manager.codes.normalize(room_code)
+    if router and not router.is_local(code):
+        target = f"{request.url.path}?{request.url.query}"
+        try:
+            status, media_type, body = await affinity.forward(
+                router.owner_url(code), "POST", target, {"Authorization": request.headers["authorization"]}
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning(f"Forward to {router.owner_url(code)} failed: {e}")
+            return Response("room owner unavailable", status_code=502)
+        return Response(body, status_code=status, media_type=media_type)
+    room = await room_manager.find(code)
+    if room is None:
+        return Response(f"room not found: {room_code}", status_code=404)
+    async with room_manager.checkout(room):
+        room.compress = enabled
+    for ws in room.sockets:
+        compression.follow(ws, enabled)
+    logger.info(f"Room {room.code} compression {'enabled' if enabled else 'disabled'}")
+    return {"room_code": room.code, "enabled": enabled}
 
 
 # ── WebSocket ─────────────────────────────────────────
 
-async def send_json(ws: WebSocket, data: dict):
-    """安全發送 JSON"""
-    try:
-        await ws.send_text(json.dumps(data, ensure_ascii=False))
-    except Exception:
-        pass
-
-
-async def broadcast_to_players(room: Room, data: dict, exclude: Optional[str] = None):
-    """向所有玩家廣播"""
-    for pid, ws in list(room.player_ws.items()):
-        if pid == exclude:
-            continue
-        await send_json(ws, data)
-
-
-async def broadcast_all(room: Room, data: dict):
-    """向關主和所有玩家廣播"""
-    if room.host_ws:
-        await send_json(room.host_ws, data)
-    await broadcast_to_players(room, data)
-
-
-async def _transition_to_observer(room: Room, player_id: str):
-    """5 秒後將被帶走的玩家轉為觀察者模式"""
-    await asyncio.sleep(5)
-    if room.engine.transition_to_observer(player_id):
-        if player_id in room.player_ws:
-            await send_json(room.player_ws[player_id], {
-                "type": "observer_mode",
-                "message": "你已進入觀察者模式。你可以繼續觀看事件和結果，但無法投票、使用能力或傳紙條。",
-            })
-
-
-@app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
-    await ws.accept()
-    role = None        # "host" or "player"
-    room: Optional[Room] = None
-    player_id: Optional[str] = None
-
-    try:
-        while True:
-            raw = await ws.receive_text()
-            try:
-                msg = json.loads(raw)
-            except json.JSONDecodeError:
-                await send_json(ws, {"type": "error", "message": "無效的訊息格式"})
-                continue
+# 跨程序匯流排：共享房間狀態時，把訊息送到連在其他 worker 的關主 / 玩家
+bus = message_bus.bus_from_env(room_manager.worker_id)
 
-            msg_type = msg.get("type")
-
-            # ── 建立房間 ──
-            if msg_type == "create_room":
-                room = room_manager.create_room()
-                room.host_ws = ws
-                role = "host"
-                logger.info(f"Room created: {room.code}")
-                await send_json(ws, {
-                    "type": "room_created",
-                    "room_code": room.code,
-                    "qr_url": f"/api/qr/{room.code}",
-                })
 
-            # ── 加入房間 ──
-            elif msg_type == "join_room":
-                # 防重複：若該 WebSocket 已是玩家，忽略重複加入
-                if role == "player":
-                    logger.info(f"Duplicate join_room ignored for player {player_id}")
-                    continue
+async def send_json(ws: WebSocket | RemoteSocket, data: Payload) -> bool:
+    """把訊息排入該連線的發送佇列（不等待實際寫入）。回傳是否成功排入。"""
+    if isinstance(ws, RemoteSocket):
+        return bus.send(ws, encode(data))
+    return outbound.put(ws, encode(data))
 
-                code = msg.get("room_code", "").strip()
-                name = msg.get("player_name", "").strip()
 
-                if not code or not name:
-                    await send_json(ws, {"type": "error", "message": "請輸入房間碼和名字"})
-                    continue
+def _deliver_from_bus(code: str, recipient: str, message: EncodedMessage) -> bool:
+    """其他 worker 透過匯流排送來的訊息：交給本程序的連線"""
+    room = room_manager.rooms.get(code)
+    if room is None:
+        return False
+    ws = room.host_ws if recipient == "host" else room.player_ws.get(recipient)
+    if ws is None or isinstance(ws, RemoteSocket):
+        return False
+    return outbound.put(ws, message)
 
-                r = room_manager.get_room(code)
-                if not r:
-                    await send_json(ws, {"type": "error", "message": "房間不存在"})
-                    continue
 
-                if r.started:
-                    await send_json(ws, {"type": "error", "message": "遊戲已開始，無法加入"})
-                    continue
+async def fan_out(sends: dict[str, tuple[WebSocket, Payload]]) -> dict[str, bool]:
+    """
+    發送多則訊息（收件者 key → (ws, data)）。
+    每條連線各自的 writer 同時寫出，一個慢速連線只會拖慢自己。
+    回傳每位收件者是否成功排入；實際延遲見 /api/metrics。
+    """
+    return {key: await send_json(ws, data) for key, (ws, data) in sends.items()}
 
-                player = r.add_player(name)
-                if not player:
-                    await send_json(ws, {"type": "error", "message": "房間已滿（最多 8 人）"})
-                    continue
 
-                room = r
-                player_id = player.id
-                role = "player"
-                room.player_ws[player_id] = ws
+async def broadcast_to_players(
+    room: Room, data: Payload, exclude: Optional[str] = None
+) -> dict[str, bool]:
+    """向所有玩家廣播（同時送出，payload 只序列化一次）"""
+    message = encode(data)
+    return await fan_out({
+        pid: (ws, message)
+        for pid, ws in list(room.player_ws.items())
+        if pid != exclude
+    })
 
-                logger.info(f"Player {name} ({player_id}) joined room {code}")
 
-                await send_json(ws, {
-                    "type": "joined",
-                    "player_id": player_id,
-                    "player_name": name,
-                    "room_code": code,
-                    "player_count": room.player_count,
-                })
+def host_state(room: Room) -> dict:
+    """附在關主訊息中的狀態：與上次相比有變動的欄位（沒有基準時為完整快照），帶遞增序號"""
+    return room.host_sync.update(room.engine.get_host_view())
 
-                if room.host_ws:
-                    await send_json(room.host_ws, {
-                        "type": "player_joined",
-                        "player_id": player_id,
-                        "player_name": name,
-                        "player_count": room.player_count,
-                        "players": room.get_player_list(),
-                    })
-
-                await broadcast_to_players(room, {
-                    "type": "player_joined",
-                    "player_name": name,
-                    "player_count": room.player_count,
-                }, exclude=player_id)
-
-            # ── 開始遊戲 ──
-            elif msg_type == "start_game":
-                if role != "host" or not room:
-                    await send_json(ws, {"type": "error", "message": "只有關主可以開始遊戲"})
-                    continue
-
-                if room.player_count < 6:
-                    await send_json(ws, {"type": "error", "message": f"至少需要 6 位玩家（目前 {room.player_count} 位）"})
-                    continue
-
-                try:
-                    roles = room.engine.assign_roles()
-                except ValueError as e:
-                    await send_json(ws, {"type": "error", "message": str(e)})
-                    continue
-
-                room.started = True
-
-                for pid, role_info in roles.items():
-                    if pid in room.player_ws:
-                        await send_json(room.player_ws[pid], {
-                            "type": "game_started",
-                            "role": {
-                                "role_id": role_info["role_id"],
-                                "name": role_info["name"],
-                                "passive": role_info["passive"],
-                                "ability": role_info["ability"],
-                            },
-                        })
-
-                await send_json(ws, {
-                    "type": "game_started_host",
-                    "host_view": room.engine.get_host_view(),
-                })
-                await send_json(ws, {
-                    "type": "identity_confirmation_status",
-                    **room.engine.get_identity_confirmation_status(),
-                })
 
-            # ── 確認身份 ──
-            elif msg_type == "confirm_identity":
-                if role != "player" or not room or not player_id:
-                    continue
-
-                newly_confirmed = room.engine.confirm_identity(player_id)
-                if not newly_confirmed:
-                    continue
-
-                await send_json(ws, {"type": "identity_confirmed"})
-
-                status = room.engine.get_identity_confirmation_status()
-                if room.host_ws:
-                    await send_json(room.host_ws, {
-                        "type": "identity_confirmation_status",
-                        **status,
-                    })
-                    if status["all_confirmed"]:
-                        await send_json(room.host_ws, {
-                            "type": "all_identities_confirmed",
-                        })
-
-            # ── 下一事件 ──
-            elif msg_type == "next_event":
-                if role != "host" or not room:
-                    continue
-
-                event_data = room.engine.get_next_event()
-                if not event_data:
-                    await send_json(ws, {"type": "error", "message": "沒有更多事件了"})
-                    continue
-
-                # 事件5：自動結算（無投票）
-                if event_data["is_auto_settle"]:
-                    await broadcast_all(room, {
-                        "type": "event",
-                        **event_data,
-                    })
-
-                    await asyncio.sleep(2)
-
-                    result = room.engine.settle_foreshadows()
-
-                    await send_json(ws, {
-                        "type": "foreshadow_settlement",
-                        "result": result,
-                        "host_view": room.engine.get_host_view(),
-                    })
-
-                    for pid, pws in room.player_ws.items():
-                        pr = result["player_results"].get(pid, {})
-                        is_taken = any(t["player_id"] == pid for t in result.get("taken_away", []))
-                        await send_json(pws, {
-                            "type": "foreshadow_settlement",
-                            "has_foreshadow": pr.get("has_foreshadow", False),
-                            "messages": pr.get("messages", []),
-                            "narratives": pr.get("narratives", []),
-                            "foreshadows": pr.get("foreshadows", []),
-                            "coin_flips": pr.get("coin_flips", []),
-                            "risk": pr.get("risk", 0),
-                            "risk_delta": pr.get("risk_delta", 0),
-                            "risk_zone": pr.get("risk_zone", "safe"),
-                            "social_fear": result["social_fear"],
-                            "thought_flow": result["thought_flow"],
-                            "atmosphere_text": result.get("atmosphere_text", ""),
-                            "taken_away": result.get("taken_away", []),
-                            "you_taken_away": is_taken,
-                        })
-
-                    # 觀察者模式：被帶走 5 秒後轉為觀察者
-                    for taken in result.get("taken_away", []):
-                        taken_pid = taken["player_id"]
-                        asyncio.create_task(
-                            _transition_to_observer(room, taken_pid)
-                        )
-                else:
-                    for pid, pws in room.player_ws.items():
-                        choices = room.engine.get_choices_for_player(pid)
-                        await send_json(pws, {
-                            "type": "event",
-                            "event_number": event_data["event_number"],
-                            "title": event_data["title"],
-                            "description": event_data["description"],
-                            "choices": choices,
-                            "is_auto_settle": False,
-                        })
-
-                    await send_json(ws, {
-                        "type": "event",
-                        **event_data,
-                        "host_view": room.engine.get_host_view(),
-                    })
-
-            # ── 開始沉默倒數 ──
-            elif msg_type == "start_silence":
-                if role != "host" or not room:
-                    continue
-                room.engine.state.phase = GamePhase.SILENCE
-                atmosphere = room.engine.get_waiting_atmosphere("pre_voting")
-                guidance = room.engine.get_host_guidance(
-                    room.engine.state.current_event, "pre_silence"
-                )
-                await broadcast_all(room, {
-                    "type": "silence_countdown",
-                    "seconds": 5,
-                    "atmosphere": atmosphere,
-                    "host_guidance": guidance,
-                })
+async def broadcast_all(room: Room, data: Payload) -> dict[str, bool]:
+    """向關主和所有玩家廣播（同時送出，payload 只序列化一次）"""
+    message = encode(data)
+    sends = {pid: (ws, message) for pid, ws in list(room.player_ws.items())}
+    if room.host_ws:
+        sends["host"] = (room.host_ws, message)
+    return await fan_out(sends)
 
-            # ── 開始討論 ──
-            elif msg_type == "start_discussion":
-                if role != "host" or not room:
-                    continue
-                seconds = msg.get("seconds", 120)
-                room.engine.state.phase = GamePhase.DISCUSSION
-                atmosphere = room.engine.get_waiting_atmosphere("pre_discussion")
-                guidance = room.engine.get_host_guidance(
-                    room.engine.state.current_event, "discussion"
-                )
-                await broadcast_all(room, {
-                    "type": "discussion_start",
-                    "seconds": seconds,
-                    "atmosphere": atmosphere,
-                    "host_guidance": guidance,
-                })
 
-            # ── 開始投票 ──
-            elif msg_type == "start_voting":
-                if role != "host" or not room:
-                    continue
-                room.engine.state.phase = GamePhase.VOTING
-                atmosphere = room.engine.get_waiting_atmosphere("pre_voting")
-                guidance = room.engine.get_host_guidance(
-                    room.engine.state.current_event, "voting_open"
-                )
-                await broadcast_all(room, {
-                    "type": "voting_open",
-                    "seconds": 30,
-                    "public_voting": room.engine.state.public_voting,
-                    "atmosphere": atmosphere,
-                    "host_guidance": guidance,
-                })
+# ── 房間回收 ──────────────────────────────────────────
 
-            # ── 投票 ──
-            elif msg_type == "vote":
-                if role != "player" or not room or not player_id:
-                    continue
-
-                choice = msg.get("choice", "")
-                success = room.engine.submit_vote(player_id, choice)
-
-                if success:
-                    await send_json(ws, {
-                        "type": "vote_confirmed",
-                        "choice": choice,
-                    })
-
-                    if room.host_ws:
-                        player = room.engine.players[player_id]
-                        await send_json(room.host_ws, {
-                            "type": "vote_received",
-                            "player_id": player_id,
-                            "player_name": player.name,
-                            "choice": choice,
-                            "all_voted": room.engine.all_voted(),
-                        })
-
-                    if room.engine.state.public_voting:
-                        player = room.engine.players[player_id]
-                        await broadcast_to_players(room, {
-                            "type": "public_vote",
-                            "player_name": player.name,
-                            "choice": choice,
-                        })
-                else:
-                    await send_json(ws, {"type": "error", "message": "投票失敗（可能已投票或選項無效）"})
-
-            # ── 投票超時（關主觸發）──
-            elif msg_type == "vote_timeout":
-                if role != "host" or not room:
-                    continue
-
-                # 自動為未投票玩家選迴避
-                auto_voted = room.engine.auto_evade_timeout_players()
-
-                # 通知被自動投票的玩家
-                for pid in auto_voted:
-                    if pid in room.player_ws:
-                        evade_key = room.engine.get_evade_choice_key()
-                        await send_json(room.player_ws[pid], {
-                            "type": "auto_voted",
-                            "choice": evade_key,
-                            "message": "投票超時，自動選擇迴避。",
-                        })
-
-                # 通知關主
-                if auto_voted and room.host_ws:
-                    names = [room.engine.players[pid].name for pid in auto_voted if pid in room.engine.players]
-                    await send_json(room.host_ws, {
-                        "type": "auto_voted_notification",
-                        "players": names,
-                        "message": f"{', '.join(names)} 投票超時，自動選擇迴避。",
-                    })
-
-            # ── 結束投票 / 結算 ──
-            elif msg_type == "end_voting":
-                if role != "host" or not room:
-                    continue
-
-                # 先自動為未投票玩家選迴避
-                auto_voted = room.engine.auto_evade_timeout_players()
-                for pid in auto_voted:
-                    if pid in room.player_ws:
-                        evade_key = room.engine.get_evade_choice_key()
-                        await send_json(room.player_ws[pid], {
-                            "type": "auto_voted",
-                            "choice": evade_key,
-                            "message": "投票超時，自動選擇迴避。",
-                        })
-
-                result = room.engine.settle_round()
-
-                await send_json(ws, {
-                    "type": "round_result",
-                    "result": result,
-                    "host_view": room.engine.get_host_view(),
-                })
+# 檢查閒置房間的間隔（秒）
+REAP_INTERVAL = 30
+# 房間被回收時關閉連線用的 close code（4000–4999 為應用程式自訂）
+CLOSE_CODE_ROOM_CLOSED = 4001
+# 玩家以新連線續玩時關閉舊連線
+CLOSE_CODE_REPLACED = 4002
 
-                for pid, pws in room.player_ws.items():
-                    pr = result["player_results"].get(pid, {})
-                    is_taken = any(t["player_id"] == pid for t in result.get("taken_away", []))
-                    messages = list(pr.get("messages", []))
-                    if result.get("random_incident"):
-                        messages.append(f"📢 {result['random_incident']['narrative']}")
-                    await send_json(pws, {
-                        "type": "round_result",
-                        "social_fear": result["social_fear"],
-                        "thought_flow": result["thought_flow"],
-                        "your_risk": pr.get("risk", 0),
-                        "your_risk_delta": pr.get("risk_delta", 0),
-                        "risk_zone": pr.get("risk_zone", "safe"),
-                        "messages": messages,
-                        "narrative": pr.get("narrative", ""),
-                        "majority_triggered": result.get("majority_triggered", False),
-                        "atmosphere_text": result.get("atmosphere_text", ""),
-                        "social_narrative": result.get("social_narrative", ""),
-                        "risk_warning": result.get("risk_warnings", {}).get(pid, ""),
-                        "taken_away": result.get("taken_away", []),
-                        "you_taken_away": is_taken,
-                        "vote_summary": result.get("vote_summary", {}),
-                    })
-
-                # 觀察者模式：被帶走 5 秒後轉為觀察者
-                for taken in result.get("taken_away", []):
-                    taken_pid = taken["player_id"]
-                    asyncio.create_task(
-                        _transition_to_observer(room, taken_pid)
-                    )
-
-            # ── 使用能力 ──
-            elif msg_type == "use_ability":
-                if role != "player" or not room or not player_id:
-                    continue
-
-                target = msg.get("target_player_id")
-                result = room.engine.use_ability(player_id, target)
-
-                await send_json(ws, {
-                    "type": "ability_result",
-                    **result,
-                })
 
-                if room.host_ws and result.get("success"):
-                    player = room.engine.players[player_id]
-                    await send_json(room.host_ws, {
-                        "type": "ability_used",
-                        "player_id": player_id,
-                        "player_name": player.name,
-                        "role_id": player.role_id,
-                        "message": result["message"],
-                        "host_view": room.engine.get_host_view(),
-                    })
-
-                if result.get("success"):
-                    player = room.engine.players[player_id]
-                    ability_data = room.engine.state.abilities_this_round.get(player_id, {})
-
-                    # 匿名能力廣播
-                    broadcast_text = room.engine.get_ability_broadcast_text(player.role_id)
-                    await broadcast_to_players(room, {
-                        "type": "ability_broadcast",
-                        "message": broadcast_text,
-                    }, exclude=player_id)
-
-                    if ability_data.get("type") == "F_public_vote":
-                        await broadcast_to_players(room, {
-                            "type": "public_vote_announced",
-                            "message": "⚠ 本回合為公開投票！所有人的選擇將即時可見。選抵抗者風險 +1。",
-                        })
-
-            # ── 顯示結局 ──
-            elif msg_type == "show_ending":
-                if role != "host" or not room:
-                    continue
-
-                ending = room.engine.determine_ending()
-
-                await send_json(ws, {
-                    "type": "ending",
-                    **ending,
-                })
+async def _reap_rooms():
+    """定期回收閒置過久的房間（連線由 _close_reaped 關閉）"""
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        room_manager.reap()
 
-                for pid, pws in room.player_ws.items():
-                    personal = next(
-                        (pe for pe in ending["personal_endings"] if pe["player_id"] == pid),
-                        None,
-                    )
-                    await send_json(pws, {
-                        "type": "ending",
-                        "social_ending": ending["social_ending"],
-                        "personal_ending": personal,
-                        "closure_text": ending["closure_text"],
-                        "reflection_text": ending["reflection_text"],
-                        "final_stats": ending["final_stats"],
-                    })
-
-            # ── 取得玩家列表 ──
-            elif msg_type == "get_players":
-                if role != "player" or not room:
-                    continue
-                players = [
-                    {"id": p.id, "name": p.name}
-                    for p in room.engine.players.values()
-                    if p.id != player_id and not p.taken_away
-                ]
-                await send_json(ws, {
-                    "type": "player_list",
-                    "players": players,
-                })
 
-            # ── 匿名紙條 ──
-            elif msg_type == "send_note":
-                if role != "player" or not room or not player_id:
-                    continue
+async def _close_sockets(sockets: list[WebSocket], code: int):
+    for ws in sockets:
+        await outbound.close(ws, code)
 
-                target_id = msg.get("target_player_id", "")
-                note_text = msg.get("text", "").strip()
 
-                sender = room.engine.players.get(player_id)
-                target = room.engine.players.get(target_id)
+def _close_reaped(room: Room):
+    """房間被回收（定期或建立房間時達上限）：關閉仍連著的連線"""
+    logger.info(f"Room {room.code} reaped (phase={room.phase.value}, players={room.player_count})")
+    asyncio.get_running_loop().create_task(_close_sockets(room.sockets, CLOSE_CODE_ROOM_CLOSED))
 
-                if not sender or not target:
-                    await send_json(ws, {"type": "error", "message": "目標玩家不存在"})
-                    continue
 
-                if sender.taken_away:
-                    await send_json(ws, {"type": "error", "message": "你已被帶走，無法傳紙條"})
-                    continue
+room_manager.on_reap(_close_reaped)
 
-                if sender.note_count >= MAX_NOTES_PER_GAME:
-                    await send_json(ws, {"type": "error", "message": f"紙條用完了（每場限 {MAX_NOTES_PER_GAME} 次）"})
-                    continue
 
-                if not note_text or len(note_text) > MAX_NOTE_LENGTH:
-                    await send_json(ws, {"type": "error", "message": f"紙條內容必須在 1-{MAX_NOTE_LENGTH} 字之間"})
-                    continue
+async def _transition_to_observer(room: Room, player_id: str):
+    """5 秒後將被帶走的玩家轉為觀察者模式"""
+    await asyncio.sleep(5)
+    async with room_manager.checkout(room):
+        if not room.engine.transition_to_observer(player_id):
+            return
+    if player_id in room.player_ws:
+        await send_json(room.player_ws[player_id], {
+            "type": "observer_mode",
+            "message": "你已進入觀察者模式。你可以繼續觀看事件和結果，但無法投票、使用能力或傳紙條。",
+        })
+
+
+def _close_replaced(ws: WebSocket):
+    """玩家已在其他 worker 續玩：關閉本程序的舊連線"""
+    asyncio.get_running_loop().create_task(outbound.close(ws, CLOSE_CODE_REPLACED))
+
+
+room_manager.on_replace(_close_replaced)
+
+
+# ── 訊息處理器 ────────────────────────────────────────
+
+dispatcher = Dispatcher()
+
+
+# ── 建立房間 ──
+@dispatcher.on("create_room")
+async def handle_create_room(session: Session, msg: dict):
+    ws = session.ws
+    room = await room_manager.create()
+    if room is None:
+        await send_json(ws, {"type": "error", "message": "伺服器房間數已達上限，請稍後再試"})
+        return
+    async with room_manager.checkout(room):
+        room.host_ws = ws  # 共享後端時連線位置也寫回儲存
+        room.host_sync.reset()
+    session.room = room
+    session.role = "host"
+    logger.info(f"Room created: {room.code}")
+    await send_json(ws, {
+        "type": "room_created",
+        "room_code": room.code,
+        "qr_url": f"/api/qr/{room.code}?format=svg",
+        "resume_token": resume_tokens.issue(room.code, resume.HOST_ID),
+    })
+
+
+# ── 加入房間 ──
+@dispatcher.on("join_room", schema={
+    "room_code": (str, ""),
+    "player_name": (str, ""),
+})
+async def handle_join_room(session: Session, msg: dict):
+    ws = session.ws
+
+    # 防重複：若該 WebSocket 已是玩家，忽略重複加入
+    if session.role == "player":
+        logger.info(f"Duplicate join_room ignored for player {session.player_id}")
+        return
+
+    code = msg["room_code"].strip()
+    name = msg["player_name"].strip()
+
+    if not code or not name:
+        await send_json(ws, {"type": "error", "message": "請輸入房間碼和名字"})
+        return
+
+    r = await room_manager.find(code)
+    if not r:
+        await send_json(ws, {"type": "error", "message": "房間不存在"})
+        return
+
+    async with room_manager.checkout(r):
+        await _join(session, r, name)
+
+
+async def _join(session: Session, room: Room, name: str):
+    ws = session.ws
+    if room.started:
+        await send_json(ws, {"type": "error", "message": "遊戲已開始，無法加入"})
+        return
+
+    player = room.add_player(name)
+    if not player:
+        await send_json(ws, {"type": "error", "message": "房間已滿（最多 8 人）"})
+        return
+
+    player_id = player.id
+    session.room = room
+    session.player_id = player_id
+    session.role = "player"
+    room.player_ws[player_id] = ws
+
+    logger.info(f"Player {name} ({player_id}) joined room {room.code}")
+
+    await send_json(ws, {
+        "type": "joined",
+        "player_id": player_id,
+        "player_name": name,
+        "room_code": room.code,
+        "player_count": room.player_count,
+        "resume_token": resume_tokens.issue(room.code, player_id),
+    })
 
-                if target_id == player_id:
-                    await send_json(ws, {"type": "error", "message": "不能傳紙條給自己"})
-                    continue
+    if room.host_ws:
+        await send_json(room.host_ws, {
+            "type": "player_joined",
+            "player_id": player_id,
+            "player_name": name,
+            "player_count": room.player_count,
+            "players": room.get_player_list(),
+        })
+
+    await broadcast_to_players(room, {
+        "type": "player_joined",
+        "player_name": name,
+        "player_count": room.player_count,
+    }, exclude=player_id)
+
+
+# ── 斷線續玩 ──
+@dispatcher.on("resume", schema={"token": (str, "")})
+async def handle_resume(session: Session, msg: dict):
+    ws = session.ws
+    if session.role is not None:
+        return
+
+    claim = resume_tokens.verify(msg["token"])
+    room = await room_manager.find(claim[0]) if claim else None
+    if room is None:
+        await send_json(ws, {"type": "resume_failed", "message": "無法恢復連線，請重新加入"})
+        return
+
+    async with room_manager.checkout(room):
+        if claim[1] == resume.HOST_ID:
+            await _resume_host(session, room)
+        else:
+            await _resume(session, room, claim[1])
+
+
+async def _resume(session: Session, room: Room, player_id: str):
+    """把新連線接回原本的玩家，並以一則訊息補上目前狀態"""
+    ws = session.ws
+    player = room.engine.players.get(player_id)
+    if player is None:
+        await send_json(ws, {"type": "resume_failed", "message": "無法恢復連線，請重新加入"})
+        return
+
+    previous = room.player_ws.get(player_id)
+    room.engine.reconnect(player_id)
+    room.player_ws[player_id] = ws
+    session.room = room
+    session.player_id = player_id
+    session.role = "player"
+
+    logger.info(f"Player {player.name} ({player_id}) resumed in room {room.code}")
+
+    await send_json(ws, {
+        "type": "resumed",
+        "player_id": player_id,
+        "player_name": player.name,
+        "room_code": room.code,
+        "player_count": room.player_count,
+        **room.engine.get_player_view(player_id),
+    })
+
+    # 舊連線可能還沒被偵測到中斷：關閉它（它的斷線處理會發現玩家已換到新連線）
+    if previous is not None and previous is not ws and not isinstance(previous, RemoteSocket):
+        await outbound.close(previous, CLOSE_CODE_REPLACED)
 
-                sender.note_count += 1
+    if room.host_ws:
+        await send_json(room.host_ws, {
+            "type": "player_reconnected",
+            "player_id": player_id,
+            "players": room.get_player_list(),
+        })
+
+
+async def _resume_host(session: Session, room: Room):
+    """把新連線接回關主（包括伺服器重新啟動、從快照恢復的房間），並送出完整的關主狀態"""
+    ws = session.ws
+    previous = room.host_ws
+    room.host_ws = ws
+    session.room = room
+    session.role = "host"
+
+    logger.info(f"Host resumed in room {room.code}")
+
+    await send_json(ws, {
+        "type": "host_resumed",
+        "room_code": room.code,
+        "qr_url": f"/api/qr/{room.code}?format=svg",
+        "started": room.started,
+        "players": room.get_player_list(),
+        **room.host_sync.full(room.engine.get_host_view()),
+    })
+
+    if previous is not None and previous is not ws and not isinstance(previous, RemoteSocket):
+        await outbound.close(previous, CLOSE_CODE_REPLACED)
+
+    await broadcast_to_players(room, {
+        "type": "host_reconnected",
+        "message": "關主已重新連線",
+    })
+
+
+# ── 開始遊戲 ──
+@dispatcher.on("start_game", role="host", denied_message="只有關主可以開始遊戲")
+async def handle_start_game(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+
+    if room.player_count < 6:
+        await send_json(ws, {"type": "error", "message": f"至少需要 6 位玩家（目前 {room.player_count} 位）"})
+        return
 
-                await send_json(ws, {
-                    "type": "note_sent",
-                    "remaining": MAX_NOTES_PER_GAME - sender.note_count,
-                })
+    try:
+        roles = room.engine.assign_roles()
+    except ValueError as e:
+        await send_json(ws, {"type": "error", "message": str(e)})
+        return
+
+    room.started = True
+
+    sends = {
+        pid: (room.player_ws[pid], {
+            "type": "game_started",
+            "role": {
+                "role_id": role_info["role_id"],
+                "name": role_info["name"],
+                "passive": role_info["passive"],
+                "ability": role_info["ability"],
+            },
+        })
+        for pid, role_info in roles.items()
+        if pid in room.player_ws
+    }
+    sends["host"] = (ws, {
+        "type": "game_started_host",
+        **host_state(room),
+    })
+    await fan_out(sends)
+    await send_json(ws, {
+        "type": "identity_confirmation_status",
+        **room.engine.get_identity_confirmation_status(),
+    })
+
+
+# ── 確認身份 ──
+@dispatcher.on("confirm_identity", role="player")
+async def handle_confirm_identity(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+    player_id = session.player_id
+
+    newly_confirmed = room.engine.confirm_identity(player_id)
+    if not newly_confirmed:
+        return
+
+    await send_json(ws, {"type": "identity_confirmed"})
+
+    status = room.engine.get_identity_confirmation_status()
+    if room.host_ws:
+        await send_json(room.host_ws, {
+            "type": "identity_confirmation_status",
+            **status,
+        })
+        if status["all_confirmed"]:
+            await send_json(room.host_ws, {
+                "type": "all_identities_confirmed",
+            })
 
-                if target_id in room.player_ws:
-                    await send_json(room.player_ws[target_id], {
-                        "type": "note_received",
-                        "text": note_text,
-                        "sender_id": player_id,
-                    })
 
-            # ── 回覆紙條 ──
-            elif msg_type == "reply_note":
-                if role != "player" or not room or not player_id:
-                    continue
+# ── 下一事件 ──
+@dispatcher.on("next_event", role="host")
+async def handle_next_event(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+
+    event_data = room.engine.get_next_event()
+    if not event_data:
+        await send_json(ws, {"type": "error", "message": "沒有更多事件了"})
+        return
+
+    # 事件5：自動結算（無投票）。2 秒後另外結算，等待期間不佔用房間（共享後端時即房間鎖）
+    if event_data["is_auto_settle"]:
+        await broadcast_all(room, {
+            "type": "event",
+            **event_data,
+        })
+        asyncio.create_task(_settle_foreshadows(room))
+    else:
+        sends = {
+            pid: (pws, {
+                "type": "event",
+                "event_number": event_data["event_number"],
+                "title": event_data["title"],
+                "description": event_data["description"],
+                "choices": room.engine.get_choices_for_player(pid),
+                "is_auto_settle": False,
+            })
+            for pid, pws in room.player_ws.items()
+        }
+        sends["host"] = (ws, {
+            "type": "event",
+            **event_data,
+            **host_state(room),
+        })
+        await fan_out(sends)
+
+
+async def _settle_foreshadows(room: Room):
+    """事件5 揭露 2 秒後結算所有伏筆"""
+    await asyncio.sleep(2)
+    async with room_manager.checkout(room):
+        if room.engine.state.phase != GamePhase.AUTO_SETTLE:
+            return  # 關主已推進到下一事件
+        result = room.engine.settle_foreshadows()
+
+        sends = {}
+        if room.host_ws:
+            sends["host"] = (room.host_ws, {
+                "type": "foreshadow_settlement",
+                "result": result,
+                **host_state(room),
+            })
 
-                target_id = msg.get("target_player_id", "")
-                note_text = msg.get("text", "").strip()
+        for pid, pws in room.player_ws.items():
+            pr = result["player_results"].get(pid, {})
+            is_taken = any(t["player_id"] == pid for t in result.get("taken_away", []))
+            sends[pid] = (pws, {
+                "type": "foreshadow_settlement",
+                "has_foreshadow": pr.get("has_foreshadow", False),
+                "messages": pr.get("messages", []),
+                "narratives": pr.get("narratives", []),
+                "foreshadows": pr.get("foreshadows", []),
+                "coin_flips": pr.get("coin_flips", []),
+                "risk": pr.get("risk", 0),
+                "risk_delta": pr.get("risk_delta", 0),
+                "risk_zone": pr.get("risk_zone", "safe"),
+                "social_fear": result["social_fear"],
+                "thought_flow": result["thought_flow"],
+                "atmosphere_text": result.get("atmosphere_text", ""),
+                "taken_away": result.get("taken_away", []),
+                "you_taken_away": is_taken,
+            })
+        await fan_out(sends)
+
+    # 觀察者模式：被帶走 5 秒後轉為觀察者
+    for taken in result.get("taken_away", []):
+        asyncio.create_task(_transition_to_observer(room, taken["player_id"]))
+
+
+# ── 開始沉默倒數 ──
+@dispatcher.on("start_silence", role="host")
+async def handle_start_silence(session: Session, msg: dict):
+    room = session.room
+
+    room.engine.set_phase(GamePhase.SILENCE)
+    atmosphere = room.engine.get_waiting_atmosphere("pre_voting")
+    guidance = room.engine.get_host_guidance(
+        room.engine.state.current_event, "pre_silence"
+    )
+    await broadcast_all(room, {
+        "type": "silence_countdown",
+        "seconds": 5,
+        "atmosphere": atmosphere,
+        "host_guidance": guidance,
+    })
+
+
+# ── 開始討論 ──
+@dispatcher.on("start_discussion", role="host", schema={"seconds": ((int, float), 120)})
+async def handle_start_discussion(session: Session, msg: dict):
+    room = session.room
+
+    seconds = msg["seconds"]
+    room.engine.set_phase(GamePhase.DISCUSSION)
+    atmosphere = room.engine.get_waiting_atmosphere("pre_discussion")
+    guidance = room.engine.get_host_guidance(
+        room.engine.state.current_event, "discussion"
+    )
+    await broadcast_all(room, {
+        "type": "discussion_start",
+        "seconds": seconds,
+        "atmosphere": atmosphere,
+        "host_guidance": guidance,
+    })
+
+
+# ── 開始投票 ──
+@dispatcher.on("start_voting", role="host")
+async def handle_start_voting(session: Session, msg: dict):
+    room = session.room
+
+    room.engine.set_phase(GamePhase.VOTING)
+    atmosphere = room.engine.get_waiting_atmosphere("pre_voting")
+    guidance = room.engine.get_host_guidance(
+        room.engine.state.current_event, "voting_open"
+    )
+    await broadcast_all(room, {
+        "type": "voting_open",
+        "seconds": 30,
+        "public_voting": room.engine.state.public_voting,
+        "atmosphere": atmosphere,
+        "host_guidance": guidance,
+    })
+
+
+# ── 投票 ──
+@dispatcher.on("vote", role="player", schema={"choice": (str, "")})
+async def handle_vote(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+    player_id = session.player_id
+
+    choice = msg["choice"]
+    success = room.engine.submit_vote(player_id, choice)
+
+    if success:
+        await send_json(ws, {
+            "type": "vote_confirmed",
+            "choice": choice,
+        })
+
+        if room.host_ws:
+            player = room.engine.players[player_id]
+            await send_json(room.host_ws, {
+                "type": "vote_received",
+                "player_id": player_id,
+                "player_name": player.name,
+                "choice": choice,
+                "all_voted": room.engine.all_voted(),
+            })
 
-                sender = room.engine.players.get(player_id)
-                target = room.engine.players.get(target_id)
+        if room.engine.state.public_voting:
+            player = room.engine.players[player_id]
+            await broadcast_to_players(room, {
+                "type": "public_vote",
+                "player_name": player.name,
+                "choice": choice,
+            })
+    else:
+        await send_json(ws, {"type": "error", "message": "投票失敗（可能已投票或選項無效）"})
+
+
+# ── 投票超時（關主觸發）──
+@dispatcher.on("vote_timeout", role="host")
+async def handle_vote_timeout(session: Session, msg: dict):
+    room = session.room
+
+    # 自動為未投票玩家選迴避
+    auto_voted = room.engine.auto_evade_timeout_players()
+
+    # 通知被自動投票的玩家
+    evade_key = room.engine.get_evade_choice_key()
+    auto_msg = EncodedMessage({
+        "type": "auto_voted",
+        "choice": evade_key,
+        "message": "投票超時，自動選擇迴避。",
+    })
+    await fan_out({
+        pid: (room.player_ws[pid], auto_msg)
+        for pid in auto_voted
+        if pid in room.player_ws
+    })
+
+    # 通知關主
+    if auto_voted and room.host_ws:
+        names = [room.engine.players[pid].name for pid in auto_voted if pid in room.engine.players]
+        await send_json(room.host_ws, {
+            "type": "auto_voted_notification",
+            "players": names,
+            "message": f"{', '.join(names)} 投票超時，自動選擇迴避。",
+        })
+
+
+# ── 結束投票 / 結算 ──
+@dispatcher.on("end_voting", role="host")
+async def handle_end_voting(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+
+    # 先自動為未投票玩家選迴避
+    auto_voted = room.engine.auto_evade_timeout_players()
+    evade_key = room.engine.get_evade_choice_key()
+    auto_msg = EncodedMessage({
+        "type": "auto_voted",
+        "choice": evade_key,
+        "message": "投票超時，自動選擇迴避。",
+    })
+    await fan_out({
+        pid: (room.player_ws[pid], auto_msg)
+        for pid in auto_voted
+        if pid in room.player_ws
+    })
+
+    result = room.engine.settle_round()
+
+    sends = {"host": (ws, {
+        "type": "round_result",
+        "result": result,
+        **host_state(room),
+    })}
+
+    for pid, pws in room.player_ws.items():
+        pr = result["player_results"].get(pid, {})
+        is_taken = any(t["player_id"] == pid for t in result.get("taken_away", []))
+        messages = list(pr.get("messages", []))
+        if result.get("random_incident"):
+            messages.append(f"📢 {result['random_incident']['narrative']}")
+        sends[pid] = (pws, {
+            "type": "round_result",
+            "social_fear": result["social_fear"],
+            "thought_flow": result["thought_flow"],
+            "your_risk": pr.get("risk", 0),
+            "your_risk_delta": pr.get("risk_delta", 0),
+            "risk_zone": pr.get("risk_zone", "safe"),
+            "messages": messages,
+            "narrative": pr.get("narrative", ""),
+            "majority_triggered": result.get("majority_triggered", False),
+            "atmosphere_text": result.get("atmosphere_text", ""),
+            "social_narrative": result.get("social_narrative", ""),
+            "risk_warning": result.get("risk_warnings", {}).get(pid, ""),
+            "taken_away": result.get("taken_away", []),
+            "you_taken_away": is_taken,
+            "vote_summary": result.get("vote_summary", {}),
+        })
+    await fan_out(sends)
+
+    # 觀察者模式：被帶走 5 秒後轉為觀察者
+    for taken in result.get("taken_away", []):
+        taken_pid = taken["player_id"]
+        asyncio.create_task(
+            _transition_to_observer(room, taken_pid)
+        )
+
+
+# ── 使用能力 ──
+@dispatcher.on("use_ability", role="player", schema={"target_player_id": (str, None)})
+async def handle_use_ability(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+    player_id = session.player_id
+
+    target = msg["target_player_id"]
+    result = room.engine.use_ability(player_id, target)
+
+    await send_json(ws, {
+        "type": "ability_result",
+        **result,
+    })
+
+    if room.host_ws and result.get("success"):
+        player = room.engine.players[player_id]
+        await send_json(room.host_ws, {
+            "type": "ability_used",
+            "player_id": player_id,
+            "player_name": player.name,
+            "role_id": player.role_id,
+            "message": result["message"],
+            **host_state(room),
+        })
+
+    if result.get("success"):
+        player = room.engine.players[player_id]
+        ability_data = room.engine.state.abilities_this_round.get(player_id, {})
+
+        # 匿名能力廣播
+        broadcast_text = room.engine.get_ability_broadcast_text(player.role_id)
+        await broadcast_to_players(room, {
+            "type": "ability_broadcast",
+            "message": broadcast_text,
+        }, exclude=player_id)
+
+        if ability_data.get("type") == "F_public_vote":
+            await broadcast_to_players(room, {
+                "type": "public_vote_announced",
+                "message": "⚠ 本回合為公開投票！所有人的選擇將即時可見。選抵抗者風險 +1。",
+            })
 
-                if not sender or not target:
-                    await send_json(ws, {"type": "error", "message": "目標玩家不存在"})
-                    continue
 
-                if sender.taken_away:
-                    await send_json(ws, {"type": "error", "message": "你已被帶走，無法回覆"})
-                    continue
+# ── 關主狀態重新同步（關主發現序號跳號）──
+@dispatcher.on("host_sync", role="host")
+async def handle_host_sync(session: Session, msg: dict):
+    room = session.room
+    await send_json(session.ws, {
+        "type": "host_state",
+        **room.host_sync.full(room.engine.get_host_view()),
+    })
+
+
+# ── 顯示結局 ──
+@dispatcher.on("show_ending", role="host")
+async def handle_show_ending(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+
+    ending = room.engine.determine_ending()
+
+    sends = {"host": (ws, {
+        "type": "ending",
+        **ending,
+    })}
+
+    for pid, pws in room.player_ws.items():
+        personal = next(
+            (pe for pe in ending["personal_endings"] if pe["player_id"] == pid),
+            None,
+        )
+        sends[pid] = (pws, {
+            "type": "ending",
+            "social_ending": ending["social_ending"],
+            "personal_ending": personal,
+            "closure_text": ending["closure_text"],
+            "reflection_text": ending["reflection_text"],
+            "final_stats": ending["final_stats"],
+        })
+    await fan_out(sends)
+
+
+# ── 取得玩家列表 ──
+@dispatcher.on("get_players", role="player")
+async def handle_get_players(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+    player_id = session.player_id
+
+    players = [
+        {"id": p.id, "name": p.name}
+        for p in room.engine.players.values()
+        if p.id != player_id and not p.taken_away
+    ]
+    await send_json(ws, {
+        "type": "player_list",
+        "players": players,
+    })
+
+
+# ── 匿名紙條 ──
+@dispatcher.on("send_note", role="player", schema={
+    "target_player_id": (str, ""),
+    "text": (str, ""),
+})
+async def handle_send_note(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+    player_id = session.player_id
+
+    target_id = msg["target_player_id"]
+    note_text = msg["text"].strip()
+
+    sender = room.engine.players.get(player_id)
+    target = room.engine.players.get(target_id)
+
+    if not sender or not target:
+        await send_json(ws, {"type": "error", "message": "目標玩家不存在"})
+        return
+
+    if sender.taken_away:
+        await send_json(ws, {"type": "error", "message": "你已被帶走，無法傳紙條"})
+        return
+
+    if sender.note_count >= MAX_NOTES_PER_GAME:
+        await send_json(ws, {"type": "error", "message": f"紙條用完了（每場限 {MAX_NOTES_PER_GAME} 次）"})
+        return
+
+    if not note_text or len(note_text) > MAX_NOTE_LENGTH:
+        await send_json(ws, {"type": "error", "message": f"紙條內容必須在 1-{MAX_NOTE_LENGTH} 字之間"})
+        return
+
+    if target_id == player_id:
+        await send_json(ws, {"type": "error", "message": "不能傳紙條給自己"})
+        return
+
+    room.engine.count_note(sender.id)
+
+    await send_json(ws, {
+        "type": "note_sent",
+        "remaining": MAX_NOTES_PER_GAME - sender.note_count,
+    })
+
+    if target_id in room.player_ws:
+        await send_json(room.player_ws[target_id], {
+            "type": "note_received",
+            "text": note_text,
+            "sender_id": player_id,
+        })
+
+
+# ── 回覆紙條 ──
+@dispatcher.on("reply_note", role="player", schema={
+    "target_player_id": (str, ""),
+    "text": (str, ""),
+})
+async def handle_reply_note(session: Session, msg: dict):
+    ws = session.ws
+    room = session.room
+    player_id = session.player_id
+
+    target_id = msg["target_player_id"]
+    note_text = msg["text"].strip()
+
+    sender = room.engine.players.get(player_id)
+    target = room.engine.players.get(target_id)
+
+    if not sender or not target:
+        await send_json(ws, {"type": "error", "message": "目標玩家不存在"})
+        return
+
+    if sender.taken_away:
+        await send_json(ws, {"type": "error", "message": "你已被帶走，無法回覆"})
+        return
+
+    if sender.note_count >= MAX_NOTES_PER_GAME:
+        await send_json(ws, {"type": "error", "message": f"紙條用完了（每場限 {MAX_NOTES_PER_GAME} 次）"})
+        return
+
+    if not note_text or len(note_text) > MAX_NOTE_LENGTH:
+        await send_json(ws, {"type": "error", "message": f"回覆內容必須在 1-{MAX_NOTE_LENGTH} 字之間"})
+        return
+
+    room.engine.count_note(sender.id)
+
+    await send_json(ws, {
+        "type": "note_sent",
+        "remaining": MAX_NOTES_PER_GAME - sender.note_count,
+    })
+
+    if target_id in room.player_ws:
+        await send_json(room.player_ws[target_id], {
+            "type": "note_received",
+            "text": note_text,
+            "sender_id": player_id,
+            "is_reply": True,
+        })
+
+
+def _foreign_owner(msg: dict) -> Optional[str]:
+    """訊息指向其他 worker 擁有的房間時，回傳擁有者的內部位址"""
+    if router is None or msg.get("type") not in affinity.ROUTED_TYPES:
+        return None
+    code = msg.get("room_code")
+    if not isinstance(code, str) or not code.strip():
+        return None
+    code = room_manager.codes.normalize(code)
+    return None if router.is_local(code) else router.owner_url(code)
+
 
-                if sender.note_count >= MAX_NOTES_PER_GAME:
-                    await send_json(ws, {"type": "error", "message": f"紙條用完了（每場限 {MAX_NOTES_PER_GAME} 次）"})
-                    continue
+async def _proxy_to_owner(ws: WebSocket, owner: str, first_message: str, subprotocol: Optional[str]):
+    router.proxied += 1
+    try:
+        await affinity.proxy(ws, owner, first_message, subprotocol)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        router.proxy_failures += 1
+        logger.warning(f"Proxy to {owner} failed: {e}")
+        await send_json(ws, {"type": "error", "message": "房間暫時無法連線，請再試一次"})
 
-                if not note_text or len(note_text) > MAX_NOTE_LENGTH:
-                    await send_json(ws, {"type": "error", "message": f"回覆內容必須在 1-{MAX_NOTE_LENGTH} 字之間"})
-                    continue
 
-                sender.note_count += 1
+@app.websocket("/ws")
+async def websocket_endpoint(ws: WebSocket):
+    # 客戶端要求精簡格式時改送 MessagePack（見 server/wire.py），否則維持 JSON 文字
+    subprotocol = wire.SUBPROTOCOL if wire.SUBPROTOCOL in ws.scope.get("subprotocols", []) else None
+    await ws.accept(subprotocol=subprotocol)
+    outbound.attach(ws, compact=subprotocol is not None)
+    session = Session(ws)
 
-                await send_json(ws, {
-                    "type": "note_sent",
-                    "remaining": MAX_NOTES_PER_GAME - sender.note_count,
-                })
+    try:
+        while True:
+            raw = await ws.receive_text()
+            try:
+                msg = json.loads(raw)
+            except json.JSONDecodeError:
+                msg = None
+            if not isinstance(msg, dict):
+                await send_json(ws, {"type": "error", "message": "無效的訊息格式"})
+                continue
 
-                if target_id in room.player_ws:
-                    await send_json(room.player_ws[target_id], {
-                        "type": "note_received",
-                        "text": note_text,
-                        "sender_id": player_id,
-                        "is_reply": True,
-                    })
+            room = session.room
+            if room is None:
+                owner = _foreign_owner(msg)
+                if owner:
+                    await _proxy_to_owner(ws, owner, raw, subprotocol)
+                    return
+                await dispatcher.dispatch(session, msg)
+                if session.room:
+                    compression.follow(ws, session.room.compress)
+                continue
+            try:
+                async with room_manager.checkout(room):
+                    await dispatcher.dispatch(session, msg)
+            except LockTimeout:
+                await send_json(ws, {"type": "error", "message": "伺服器忙碌，請再試一次"})
+            room_manager.touch(room)
+            # 房間的壓縮設定可能由其他 worker 變更：每則訊息後跟上
+            compression.follow(ws, room.compress)
+
+    except (WebSocketDisconnect, WebSocketDisconnected):
+        # WebSocketDisconnected：連線已由本端關閉（送出失敗、佇列滿被踢除、被新連線取代）
+        await _on_disconnect(session, ws)
+    except Exception as e:
+        logger.error(f"WebSocket error: {e}", exc_info=True)
+    finally:
+        outbound.detach(ws)
 
-            else:
-                await send_json(ws, {"type": "error", "message": f"未知訊息類型: {msg_type}"})
 
-    except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected: role={role}, player_id={player_id}")
-        if room and player_id:
+async def _on_disconnect(session: Session, ws: WebSocket):
+    room, role, player_id = session.room, session.role, session.player_id
+    logger.info(f"WebSocket disconnected: role={role}, player_id={player_id}")
+    if room:
+        room_manager.touch(room)
+    if room and player_id:
+        async with room_manager.checkout(room):
+            if room.player_ws.get(player_id) is not ws:
+                return  # 玩家已以新連線續玩
             room.remove_player(player_id)
             if room.host_ws:
                 await send_json(room.host_ws, {
@@ -704,17 +1136,19 @@ async def websocket_endpoint(ws: WebSocket):
                     "player_id": player_id,
                     "players": room.get_player_list(),
                 })
-        elif room and role == "host":
+    elif room and role == "host":
+        async with room_manager.checkout(room):
+            if room.host_ws is not ws:
+                return  # 關主已以新連線接回
             await broadcast_to_players(room, {
                 "type": "host_disconnected",
                 "message": "關主已斷線",
             })
             room.host_ws = None
-    except Exception as e:
-        logger.error(f"WebSocket error: {e}", exc_info=True)
+            room.host_sync.reset()
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    uvicorn.run(app, host="0.0.0.0", port=8001, ws=compression.DeflateWebSocketProtocol)
 
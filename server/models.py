@@ -66,6 +66,20 @@ EXTRA_ROLES_7 = [RoleID.E, RoleID.F]
 EXTRA_ROLES_8 = [RoleID.G]
 
 
+# ── 伏筆 ──────────────────────────────────────────────
+
+class ForeshadowType(str, enum.Enum):
+    SILENCE = "silence"   # 沉默
+    VAGUE = "vague"       # 模糊
+
+
+@dataclass
+class Foreshadow:
+    player_id: str
+    ftype: ForeshadowType
+    event_number: int
+
+
 # ── 事件 ──────────────────────────────────────────────
 
 @dataclass
@@ -74,6 +88,12 @@ class EventChoice:
     label: str         # 顯示文本
     is_comply: bool = False  # 是否屬於「服從類」（多數壓力判定用）
     description: str = ""    # 情境化描述
+    # 結算效果（由 GameEngine 預先編譯成查表）
+    fear: int = 0            # 社會恐懼變化
+    flow: int = 0            # 思想流通變化
+    risk: int = 0            # 個人風險變化
+    foreshadow: Optional[ForeshadowType] = None  # 產生的伏筆（第 5 回合清算）
+    message: str = ""        # 結算時給玩家的訊息
 
 
 @dataclass
@@ -92,11 +112,14 @@ EVENTS: list[GameEvent] = [
         description="上級發出通知，要求所有機構進行一次「思想狀態普查」。每個人都被要求填寫一份問卷，內容涉及你對當前社會制度的看法。你的主管暗示：「照實填就好了，大家都知道該怎麼寫。」",
         choices=[
             EventChoice("comply", "照實填寫問卷", is_comply=True,
-                        description="你用最安全的措辭填完了問卷。你知道答案都是對的。"),
+                        description="你用最安全的措辭填完了問卷。你知道答案都是對的。",
+                        fear=1),
             EventChoice("evade", "裝病拖延",
-                        description="你說你身體不舒服，想晚幾天交。主管的表情變了。"),
+                        description="你說你身體不舒服，想晚幾天交。主管的表情變了。",
+                        foreshadow=ForeshadowType.VAGUE),
             EventChoice("resist", "寫出真心話",
-                        description="你寫下了你真正的想法。筆尖在紙上劃出沙沙聲。"),
+                        description="你寫下了你真正的想法。筆尖在紙上劃出沙沙聲。",
+                        flow=1, risk=1),
         ],
     ),
     GameEvent(
@@ -105,11 +128,14 @@ EVENTS: list[GameEvent] = [
         description="一位你信任的同事在午休時湊過來，壓低聲音問你：「你有沒有聽說最近有人被約談？」他看起來很焦慮，似乎需要一些確認或安撫。",
         choices=[
             EventChoice("comfort", "安撫同事", is_comply=True,
-                        description="你拍了拍他的肩：「放心，沒事的。」你不確定這是不是謊話。"),
+                        description="你拍了拍他的肩：「放心，沒事的。」你不確定這是不是謊話。",
+                        fear=-1),
             EventChoice("silence", "保持沉默",
-                        description="你假裝沒聽到，低頭繼續吃飯。筷子夾起的菜沒有味道。"),
+                        description="你假裝沒聽到，低頭繼續吃飯。筷子夾起的菜沒有味道。",
+                        foreshadow=ForeshadowType.SILENCE),
             EventChoice("info", "提供你知道的資訊",
-                        description="你壓低聲音告訴他你聽到的名字。他的眼睛裡閃過恐懼。"),
+                        description="你壓低聲音告訴他你聽到的名字。他的眼睛裡閃過恐懼。",
+                        risk=-1, message="🩸 你提供了資訊。道德代價。"),
         ],
     ),
     GameEvent(
@@ -118,11 +144,14 @@ EVENTS: list[GameEvent] = [
         description="你聽說有人私下組織了讀書會，討論一些「不太適當」的書籍。有人認為這只是一般的文學交流，但也有傳聞說上面已經在調查了。你認識其中幾個人。",
         choices=[
             EventChoice("avoid", "遠離那些人", is_comply=True,
-                        description="你開始繞路走，避開那些熟悉的面孔。"),
+                        description="你開始繞路走，避開那些熟悉的面孔。",
+                        risk=-1),
             EventChoice("warn", "私下提醒他們",
-                        description="你找到其中一個人，告訴他最好小心。他看你的眼神很複雜。"),
+                        description="你找到其中一個人，告訴他最好小心。他看你的眼神很複雜。",
+                        flow=1, risk=1),
             EventChoice("report", "向上面回報",
-                        description="你寫了一份報告。名字、時間、地點。你告訴自己這是義務。"),
+                        description="你寫了一份報告。名字、時間、地點。你告訴自己這是義務。",
+                        flow=-1, risk=-1, message="🩸 你舉報了他們。道德代價。"),
         ],
     ),
     GameEvent(
@@ -131,11 +160,14 @@ EVENTS: list[GameEvent] = [
         description="深夜，有人敲你的門。來的是兩個穿制服的人，態度客氣但堅定。他們請你「配合了解一些情況」，關於你曾經接觸過的一些人和事。",
         choices=[
             EventChoice("cooperate", "全力配合", is_comply=True,
-                        description="你把知道的都說了。他們客氣地道謝，然後離開了。"),
+                        description="你把知道的都說了。他們客氣地道謝，然後離開了。",
+                        fear=1),
             EventChoice("vague", "模糊應對",
-                        description="你說了很多，但什麼都沒說清楚。他們的筆一直在動。"),
+                        description="你說了很多，但什麼都沒說清楚。他們的筆一直在動。",
+                        foreshadow=ForeshadowType.VAGUE),
             EventChoice("refuse", "拒絕回答",
-                        description="你說你什麼都不知道。他們相視一笑，做了一個記號。"),
+                        description="你說你什麼都不知道。他們相視一笑，做了一個記號。",
+                        risk=2),
         ],
     ),
     GameEvent(
@@ -151,11 +183,14 @@ EVENTS: list[GameEvent] = [
         description="最後的命令下來了。上級要求所有人簽署一份聲明，表達對現行制度的全面支持。拒絕簽署的人將被「另行處理」。這是最後一次選擇的機會。",
         choices=[
             EventChoice("accept", "簽署聲明", is_comply=True,
-                        description="你的名字落在紙上。墨水乾得很快。"),
+                        description="你的名字落在紙上。墨水乾得很快。",
+                        fear=2, risk=-2, message="💀 你簽署了聲明。道德崩解。"),
             EventChoice("delay", "拖延敷衍",
-                        description="你說你需要考慮。他們說你有到下週的時間。"),
+                        description="你說你需要考慮。他們說你有到下週的時間。",
+                        message="你選擇了拖延敷衍。什麼也沒有發生。"),
             EventChoice("refuse", "公開拒絕簽署",
-                        description="你把紙推回去。房間裡的空氣凝固了。"),
+                        description="你把紙推回去。房間裡的空氣凝固了。",
+                        flow=1, risk=2),
         ],
     ),
 ]
@@ -173,20 +208,6 @@ MORAL_COST_CHOICES = {"info", "report"}
 MORAL_COLLAPSE_CHOICES = {"accept"}
 
 
-# ── 伏筆 ──────────────────────────────────────────────
-
-class ForeshadowType(str, enum.Enum):
-    SILENCE = "silence"   # 沉默
-    VAGUE = "vague"       # 模糊
-
-
-@dataclass
-class Foreshadow:
-    player_id: str
-    ftype: ForeshadowType
-    event_number: int
-
-
 # ── 玩家 ──────────────────────────────────────────────
 
 @dataclass
@@ -0,0 +1,262 @@
+"""
+靜默之島：選擇與代價 — 連線發送佇列
+
+每條 WebSocket 連線擁有一個有上限的發送佇列（Outbox），由專屬的 writer task
+依序寫入 socket。處理訊息的協程只負責排入佇列，不會被慢速連線卡住。
+以精簡格式（server.wire）連線的佇列改送 MessagePack，並記住這條連線已收到的字串表編號。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Optional, Union
+
+from fastapi import WebSocket
+
+from . import wire
+
+logger = logging.getLogger("silent-island")
+
+# 單次寫入期限（秒）：超過即視為慢速連線
+SEND_TIMEOUT = 3.0
+# 慢速連線處理策略："drop" 只丟棄該則訊息；"evict" 直接關閉連線（交由斷線流程清理）
+SLOW_CLIENT_POLICY = "drop"
+# 佇列深度達到此值即標記為落後（lagging）
+OUTBOX_HIGH_WATER = 32
+# 佇列深度上限：超過即判定連線已失去回應並斷線
+OUTBOX_MAX_DEPTH = 128
+# 狀態型訊息：佇列中尚未送出的舊版本會被新版本取代
+COALESCE_TYPES = frozenset({
+    "identity_confirmation_status",
+    "player_list",
+})
+# 1013 = Try Again Later
+CLOSE_CODE_OVERLOADED = 1013
+
+
+class EncodedMessage:
+    """預先序列化的訊息。同一份 payload 廣播給多人時只 json.dumps 一次（精簡格式也只編碼一次）。"""
+
+    __slots__ = ("data", "text", "_packed")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.text = json.dumps(data, ensure_ascii=False)
+        self._packed: Optional[tuple[bytes, frozenset[int]]] = None
+
+    @classmethod
+    def from_text(cls, msg_type: Optional[str], text: str) -> "EncodedMessage":
+        """已序列化的文字（例如從其他 worker 轉送來的訊息），只保留 type 供合併判斷"""
+        message = cls.__new__(cls)
+        message.data = {"type": msg_type}
+        message.text = text
+        message._packed = None
+        return message
+
+    @property
+    def type(self) -> Optional[str]:
+        return self.data.get("type")
+
+    @property
+    def packed(self) -> tuple[bytes, frozenset[int]]:
+        """MessagePack 編碼與用到的字串編號（第一次有精簡格式的收件者時才編碼）
+
+        從 JSON 文字解回再編碼：跨 worker 收到的訊息只有文字，而且內容與 JSON 版本完全相同。
+        """
+        if self._packed is None:
+            self._packed = wire.pack(json.loads(self.text))
+        return self._packed
+
+
+Payload = Union[dict, EncodedMessage]
+
+
+def encode(data: Payload) -> EncodedMessage:
+    """確保 payload 已序列化（已是 EncodedMessage 則原樣回傳）"""
+    if isinstance(data, EncodedMessage):
+        return data
+    return EncodedMessage(data)
+
+
+class Outbox:
+    """單一連線的發送佇列"""
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        max_depth: int = OUTBOX_MAX_DEPTH,
+        high_water: int = OUTBOX_HIGH_WATER,
+        send_timeout: float = SEND_TIMEOUT,
+        compact: bool = False,
+    ):
+        self.ws = ws
+        self.max_depth = max_depth
+        self.high_water = high_water
+        self.send_timeout = send_timeout
+        self._queue: deque[tuple[EncodedMessage, float]] = deque()  # (message, 排入時間)
+        self._wakeup = asyncio.Event()
+        self.closed = False
+        self.lagging = False
+        # 統計
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak_depth = 0
+        self.latency: Optional[float] = None  # 排入 → 寫出的延遲（秒，EWMA）
+        self.bytes_sent = 0
+        # 精簡格式：這條連線已收到定義的字串編號（None 表示 JSON 文字）
+        self.strings: Optional[set[int]] = set() if compact else None
+        self._task = asyncio.create_task(self._writer())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, message: EncodedMessage) -> bool:
+        """排入一則訊息。回傳是否成功排入（連線已關閉或溢位時為 False）。"""
+        if self.closed:
+            return False
+
+        if message.type in COALESCE_TYPES:
+            for i, (queued, _) in enumerate(self._queue):
+                if queued.type == message.type:
+                    del self._queue[i]
+                    self.coalesced += 1
+                    break
+
+        if len(self._queue) >= self.max_depth:
+            logger.warning(f"Outbox overflow ({self.max_depth}), disconnecting client")
+            self.dropped += len(self._queue) + 1
+            self.detach()
+            asyncio.create_task(self._close_socket(CLOSE_CODE_OVERLOADED))
+            return False
+
+        self._queue.append((message, time.perf_counter()))
+        self.peak_depth = max(self.peak_depth, len(self._queue))
+        if not self.lagging and len(self._queue) >= self.high_water:
+            self.lagging = True
+            logger.warning(f"Outbox above high-water mark ({len(self._queue)} queued)")
+        self._wakeup.set()
+        return True
+
+    async def _writer(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            message, queued_at = self._queue.popleft()
+            try:
+                await asyncio.wait_for(self._send(message), timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning(f"Send timed out after {self.send_timeout}s: type={message.type}")
+                if SLOW_CLIENT_POLICY == "evict":
+                    self.detach()
+                    await self._close_socket(CLOSE_CODE_OVERLOADED)
+                    return
+                continue
+            except Exception:
+                # socket 已斷線：剩下的訊息沒有送出的意義
+                self.closed = True
+                self._queue.clear()
+                return
+
+            self.sent += 1
+            elapsed = time.perf_counter() - queued_at
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            if self.lagging and len(self._queue) <= self.high_water // 2:
+                self.lagging = False
+
+    async def _send(self, message: EncodedMessage):
+        if self.strings is None:
+            await self.ws.send_text(message.text)
+            self.bytes_sent += len(message.text.encode("utf-8"))
+            return
+        data, refs = message.packed
+        missing = refs - self.strings
+        if missing:
+            definitions = wire.definitions(missing)
+            await self.ws.send_bytes(definitions)
+            self.strings |= missing
+            self.bytes_sent += len(definitions)
+        await self.ws.send_bytes(data)
+        self.bytes_sent += len(data)
+
+    async def close(self, code: int = 1000):
+        """停止 writer 並關閉連線"""
+        if self.closed:
+            return
+        self.detach()
+        await self._close_socket(code)
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
+
+    def detach(self):
+        """停止 writer 並丟棄未送出的訊息（不關閉 socket）"""
+        self.closed = True
+        self._queue.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "lagging": self.lagging,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "format": "json" if self.strings is None else "msgpack",
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+        }
+
+
+# WebSocket 本身不可 hash（Starlette 連線物件是 Mapping），以 id() 作為鍵。
+# 只有 websocket_endpoint 會 attach()，並在結束時呼叫 detach() 移除；其餘路徑一律以 get() 取得。
+_outboxes: dict[int, Outbox] = {}
+
+
+def attach(ws: WebSocket, compact: bool = False) -> Outbox:
+    """為連線建立發送佇列（compact：以精簡格式送出）"""
+    outbox = _outboxes.get(id(ws))
+    if outbox is None or outbox.ws is not ws:
+        outbox = Outbox(ws, compact=compact)
+        _outboxes[id(ws)] = outbox
+    return outbox
+
+
+def get(ws: WebSocket) -> Optional[Outbox]:
+    """取得連線的發送佇列（不存在回傳 None）"""
+    outbox = _outboxes.get(id(ws))
+    if outbox is not None and outbox.ws is ws:
+        return outbox
+    return None
+
+
+def put(ws: WebSocket, message: EncodedMessage) -> bool:
+    """排入連線的發送佇列；連線已結束（佇列已移除）時丟棄並回傳 False"""
+    outbox = get(ws)
+    return outbox.put(message) if outbox is not None else False
+
+
+async def close(ws: WebSocket, code: int = 1000):
+    """經由發送佇列關閉連線；連線已結束時不做任何事"""
+    outbox = get(ws)
+    if outbox is not None:
+        await outbox.close(code)
+
+
+def detach(ws: WebSocket):
+    """連線結束：停止 writer 並移除佇列"""
+    outbox = _outboxes.pop(id(ws), None)
+    if outbox is not None and outbox.ws is ws:
+        outbox.detach()
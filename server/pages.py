@@ -0,0 +1,103 @@
+"""
+靜默之島：選擇與代價 — HTML 頁面快取
+
+頁面在啟動時讀取一次，以編碼好的 bytes 留在記憶體中，
+附上 ETag / Last-Modified，客戶端重新驗證時回 304。
+開發時設定環境變數 SILENT_ISLAND_RELOAD_PAGES=1 會在檔案修改時間改變時重新載入。
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import logging
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+logger = logging.getLogger("silent-island")
+
+RELOAD_ON_CHANGE = os.environ.get("SILENT_ISLAND_RELOAD_PAGES") == "1"
+# 每次使用前都向伺服器重新驗證（命中時只需 304，不必重傳整頁）
+CACHE_CONTROL = "no-cache"
+HTML_MEDIA_TYPE = "text/html; charset=utf-8"
+
+
+class StaticPage:
+    """一個預先載入的 HTML 頁面"""
+
+    def __init__(self, path: Path, placeholder: Optional[str] = None):
+        self.path = path
+        self.placeholder = placeholder
+        self.body = b""
+        self.etag = ""
+        self.last_modified = ""
+        self.mtime: Optional[float] = None
+        # 以 placeholder 切開的片段，代入時只需串接 bytes
+        self._parts: list[bytes] = []
+        self.load()
+
+    @property
+    def exists(self) -> bool:
+        self._maybe_reload()
+        return self.mtime is not None
+
+    def load(self):
+        try:
+            stat = self.path.stat()
+            text = self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            self.mtime = None
+            self.body = b""
+            self._parts = []
+            return
+        self.mtime = stat.st_mtime
+        self.body = text.encode("utf-8")
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:16]}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self._parts = (
+            [p.encode("utf-8") for p in text.split(self.placeholder)] if self.placeholder else [self.body]
+        )
+
+    def _maybe_reload(self):
+        if not RELOAD_ON_CHANGE:
+            return
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.mtime:
+            logger.info(f"Reloading page {self.path.name}")
+            self.load()
+
+    def _not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+            return self.etag in tags or "*" in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.mtime) <= since
+        return False
+
+    def response(self, request: Request) -> Response:
+        """整頁或 304"""
+        self._maybe_reload()
+        headers = {"ETag": self.etag, "Last-Modified": self.last_modified, "Cache-Control": CACHE_CONTROL}
+        if self._not_modified(request):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type=HTML_MEDIA_TYPE, headers=headers)
+
+    def render(self, value: str) -> Response:
+        """代入 placeholder 後的頁面（內容因請求而異，不帶驗證標頭）"""
+        self._maybe_reload()
+        if len(self._parts) == 1:
+            return Response(self.body, media_type=HTML_MEDIA_TYPE)
+        return Response(html.escape(value).encode("utf-8").join(self._parts), media_type=HTML_MEDIA_TYPE)
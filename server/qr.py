@@ -0,0 +1,164 @@
+"""
+靜默之島：選擇與代價 — QR Code 產生與快取
+
+同一個加入網址的 QR Code 只產生一次：編碼好的 PNG / SVG bytes 放在 LRU 快取，
+鍵為 (base_url, room_code, 格式)；房間移除時一併清掉。
+SVG 直接由 QR 矩陣組成路徑，不經過 Pillow。
+產生圖片在有上限的執行緒池中進行，不佔用事件迴圈；同一張圖的並行請求只產生一次。
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import qrcode
+
+# 與原本 PNG 相同的外觀：黑底白碼、每格 10px、邊框 4 格
+BOX_SIZE = 10
+BORDER = 4
+FILL_COLOR = "white"
+BACK_COLOR = "black"
+
+# 快取上限（條目數）；一個房間通常只有 1–2 條（PNG / SVG）
+QR_CACHE_SIZE = 1024
+# 產生圖片的執行緒數上限（Pillow 編碼 PNG 時大多持有 GIL，多開無益）
+QR_RENDER_WORKERS = 2
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def join_url(base_url: str, room_code: str) -> str:
+    return f"{base_url}/join?room={room_code}"
+
+
+def _make_qr(data: str) -> qrcode.QRCode:
+    qr = qrcode.QRCode(version=1, box_size=BOX_SIZE, border=BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_png(data: str) -> bytes:
+    img = _make_qr(data).make_image(fill_color=FILL_COLOR, back_color=BACK_COLOR)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_svg(data: str) -> bytes:
+    """以矩陣直接輸出 SVG（每一段連續的深色格合併成一個矩形子路徑）"""
+    matrix = _make_qr(data).get_matrix()  # 已含邊框
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    px = size * BOX_SIZE
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{px}" height="{px}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="{BACK_COLOR}"/>'
+        f'<path d="{"".join(path)}" fill="{FILL_COLOR}"/></svg>'
+    )
+    return svg.encode("utf-8")
+
+
+RENDERERS = {"png": render_png, "svg": render_svg}
+
+
+class QRCache:
+    """(base_url, room_code, fmt) → 編碼好的圖片 bytes 的 LRU 快取"""
+
+    def __init__(self, max_entries: int = QR_CACHE_SIZE, workers: int = QR_RENDER_WORKERS):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str, str], bytes] = OrderedDict()
+        # 正在產生中的圖片：同一個鍵的後續請求等待同一個 Future
+        self._inflight: dict[tuple[str, str, str], asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qr-render")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def get(self, base_url: str, room_code: str, fmt: str) -> Optional[bytes]:
+        key = (base_url, room_code, fmt)
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, base_url: str, room_code: str, fmt: str, body: bytes):
+        key = (base_url, room_code, fmt)
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def render(self, base_url: str, room_code: str, fmt: str = "png") -> bytes:
+        """取快取，沒有就產生並放入"""
+        body = self.get(base_url, room_code, fmt)
+        if body is None:
+            body = RENDERERS[fmt](join_url(base_url, room_code))
+            self.put(base_url, room_code, fmt, body)
+        return body
+
+    async def render_async(self, base_url: str, room_code: str, fmt: str = "png") -> bytes:
+        """同 render，但在執行緒池中產生；同一張圖的並行請求共用一次產生"""
+        body = self.get(base_url, room_code, fmt)
+        if body is not None:
+            return body
+
+        key = (base_url, room_code, fmt)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, RENDERERS[fmt], join_url(base_url, room_code))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        # shield：某個請求被取消時不影響其他等待者
+        return await asyncio.shield(future)
+
+    def _finish(self, key: tuple[str, str, str], future: asyncio.Future):
+        """在事件迴圈中收尾：成功才寫入快取（失敗時下一次請求會重試）"""
+        if self._inflight.get(key) is not future:
+            return  # 產生期間房間已被移除
+        del self._inflight[key]
+        if not future.cancelled() and future.exception() is None:
+            self.put(*key, future.result())
+
+    def discard_room(self, room_code: str):
+        """房間移除時清掉該房間所有網址與格式的圖片"""
+        for key in [k for k in self._entries if k[1] == room_code]:
+            del self._entries[key]
+        for key in [k for k in self._inflight if k[1] == room_code]:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(len(b) for b in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "rendering": len(self._inflight),
+        }
+
+
+qr_cache = QRCache()
@@ -0,0 +1,110 @@
+"""
+靜默之島：選擇與代價 — 最小的 RESP（Redis 協定）非同步用戶端
+
+只實作共享房間狀態需要的指令（GET / SET / DEL / INCR…），
+可連到 Redis、相容 Redis 協定的服務，或本機替身 server.resp_server。
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Optional, Union
+from urllib.parse import urlparse
+
+Reply = Union[None, int, bytes, str, list]
+
+# 比對後刪除（釋放鎖）：值仍是自己的 token 才刪，整段在伺服器端原子執行
+COMPARE_AND_DELETE = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+
+class RespError(Exception):
+    """伺服器回傳的錯誤（-ERR ...）"""
+
+
+def encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Reply:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("RESP 連線已關閉")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        size = int(body)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise RespError(f"無法解析的回應：{line!r}")
+
+
+class RespClient:
+    """單一連線，指令依序送出；斷線時下一個指令自動重連"""
+
+    def __init__(self, url: str = "redis://localhost:6379/0"):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", self.db)
+
+    async def _roundtrip(self, *args) -> Reply:
+        self._writer.write(encode_command(*args))
+        await self._writer.drain()
+        return await read_reply(self._reader)
+
+    async def execute(self, *args, retry: bool = True) -> Reply:
+        """
+        送出指令並等待回應。連線中斷時重連並重試一次；
+        retry=False 用於不可重複執行的指令（例如 SET NX：第一次可能已生效，重試會回報失敗）。
+        """
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                await self._connect()
+            try:
+                return await self._roundtrip(*args)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self._writer = None
+                if not retry:
+                    raise
+                await self._connect()
+                return await self._roundtrip(*args)
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        """key 的值等於 value 時刪除（原子操作），回傳是否刪除"""
+        return bool(await self.execute("EVAL", COMPARE_AND_DELETE, 1, key, value))
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,201 @@
+"""
+靜默之島：選擇與代價 — 本機 RESP 替身伺服器
+
+開發與測試多 worker 部署時代替 Redis：單一程序、資料只在記憶體，
+只支援 server.resp 與 server.bus 用到的指令（含 PUBLISH / SUBSCRIBE）。正式環境請使用真正的 Redis。
+EVAL 不執行 Lua，只認得 server.resp 用到的腳本（COMPARE_AND_DELETE）。
+
+使用方法：
+  python -m server.resp_server --port 6379
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from .resp import COMPARE_AND_DELETE, read_reply
+
+logger = logging.getLogger("silent-island")
+
+
+def _simple(text: str) -> bytes:
+    return f"+{text}\r\n".encode()
+
+
+def _error(text: str) -> bytes:
+    return f"-ERR {text}\r\n".encode()
+
+
+def _int(value: int) -> bytes:
+    return f":{value}\r\n".encode()
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespStandIn:
+    """鍵值資料與到期時間（毫秒精度，讀取時才檢查到期）"""
+
+    def __init__(self):
+        self.data: dict[bytes, bytes] = {}
+        self.expires: dict[bytes, float] = {}
+        self.channels: dict[bytes, set[asyncio.StreamWriter]] = {}
+
+    def _alive(self, key: bytes) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return key in self.data
+
+    def _set_expiry(self, key: bytes, ms: Optional[int]):
+        if ms is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ms / 1000
+
+    def handle(self, args: list[bytes]) -> bytes:
+        command = args[0].upper().decode()
+        handler = getattr(self, f"cmd_{command.lower()}", None)
+        if handler is None:
+            return _error(f"unknown command '{command}'")
+        try:
+            return handler(*args[1:])
+        except TypeError:
+            return _error(f"wrong number of arguments for '{command}'")
+
+    def cmd_ping(self, *args):
+        return _bulk(args[0]) if args else _simple("PONG")
+
+    def cmd_select(self, db):
+        return _simple("OK")
+
+    def cmd_get(self, key):
+        return _bulk(self.data[key] if self._alive(key) else None)
+
+    def cmd_mget(self, *keys):
+        values = [self.data[k] if self._alive(k) else None for k in keys]
+        return b"*%d\r\n" % len(values) + b"".join(_bulk(v) for v in values)
+
+    def cmd_set(self, key, value, *options):
+        nx = xx = False
+        ms = None
+        opts = [o.upper() for o in options]
+        i = 0
+        while i < len(opts):
+            if opts[i] == b"NX":
+                nx = True
+            elif opts[i] == b"XX":
+                xx = True
+            elif opts[i] in (b"PX", b"EX"):
+                ms = int(options[i + 1]) * (1000 if opts[i] == b"EX" else 1)
+                i += 1
+            else:
+                return _error("syntax error")
+            i += 1
+        exists = self._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return _bulk(None)
+        self.data[key] = value
+        self._set_expiry(key, ms)
+        return _simple("OK")
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return _int(removed)
+
+    def cmd_eval(self, script, numkeys, *args):
+        if script.decode() != COMPARE_AND_DELETE or int(numkeys) != 1 or len(args) != 2:
+            return _error("only the compare-and-delete script is supported")
+        key, value = args
+        if self._alive(key) and self.data[key] == value:
+            return self.cmd_del(key)
+        return _int(0)
+
+    def cmd_exists(self, *keys):
+        return _int(sum(self._alive(k) for k in keys))
+
+    def cmd_incr(self, key):
+        value = int(self.data[key]) + 1 if self._alive(key) else 1
+        self.data[key] = str(value).encode()
+        return _int(value)
+
+    def cmd_pexpire(self, key, ms):
+        if not self._alive(key):
+            return _int(0)
+        self._set_expiry(key, int(ms))
+        return _int(1)
+
+    def cmd_keys(self, pattern):
+        # 只支援結尾的 *（前綴比對）
+        if pattern.endswith(b"*"):
+            keys = [k for k in list(self.data) if k.startswith(pattern[:-1]) and self._alive(k)]
+        else:
+            keys = [pattern] if self._alive(pattern) else []
+        return b"*%d\r\n" % len(keys) + b"".join(_bulk(k) for k in keys)
+
+    def cmd_publish(self, channel, message):
+        subscribers = self.channels.get(channel, ())
+        push = b"*3\r\n" + _bulk(b"message") + _bulk(channel) + _bulk(message)
+        for subscriber in subscribers:
+            subscriber.write(push)
+        return _int(len(subscribers))
+
+    def subscribe(self, writer: asyncio.StreamWriter, channels: list[bytes]) -> bytes:
+        replies = []
+        for channel in channels:
+            self.channels.setdefault(channel, set()).add(writer)
+            count = sum(writer in subs for subs in self.channels.values())
+            replies.append(b"*3\r\n" + _bulk(b"subscribe") + _bulk(channel) + _int(count))
+        return b"".join(replies)
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    args = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                if not isinstance(args, list) or not args:
+                    writer.write(_error("expected a command array"))
+                elif args[0].upper() == b"SUBSCRIBE":
+                    writer.write(self.subscribe(writer, args[1:]))
+                else:
+                    writer.write(self.handle(args))
+                await writer.drain()
+        finally:
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+
+async def serve(host: str, port: int):
+    stand_in = RespStandIn()
+    server = await asyncio.start_server(stand_in.serve_client, host, port)
+    logger.info(f"RESP stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="本機 RESP 替身伺服器（代替 Redis）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+靜默之島：選擇與代價 — 斷線續玩憑證
+
+手機休眠或切換網路時連線會中斷，但玩家仍在遊戲中（Player.connected = False）。
+加入房間時伺服器發一張續玩憑證；重新連線後送出 {"type": "resume", "token": …}，
+伺服器驗證後把新連線接回原本的玩家，不必重新加入（遊戲開始後也不能重新加入）。
+
+憑證格式：{房間碼}.{player_id}.{簽章}，簽章為 HMAC-SHA256 的前 16 bytes（base64url）。
+關主在建立房間時也拿到一張（player_id 位置為 HOST_ID），重新啟動或斷線後以它接回房間繼續主持。
+不需要在伺服器保存任何資料；房間結束或玩家不存在時憑證自然失效。
+
+以環境變數 SILENT_ISLAND_RESUME_SECRET 設定簽章金鑰。未設定時隨機產生，並在啟動時（persist_secret）
+存進會留下來的地方，讓重新啟動後、或其他 worker 都用同一把金鑰：
+- 共享狀態後端：存在共享儲存中（第一個啟動的 worker 寫入，其他 worker 讀取）
+- 快照：存在快照的 SQLite 檔案中（與房間一起在重新啟動後恢復）
+兩者都沒有時房間本來就只存在本程序記憶體，隨機金鑰即可。
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Optional
+
+# 簽章長度（bytes）
+SIGNATURE_BYTES = 16
+# 保存隨機金鑰時使用的名稱
+SECRET_NAME = "resume"
+# 關主憑證中代替 player_id 的名稱（player_id 為 8 位十六進位，不會相同）
+HOST_ID = "host"
+
+
+class ResumeTokens:
+    """簽發與驗證續玩憑證"""
+
+    def __init__(self, secret: bytes, configured: bool = False):
+        self.secret = secret
+        # 金鑰是否由環境變數指定（否則為隨機產生，需要 persist_secret 保存）
+        self.configured = configured
+
+    def _sign(self, room_code: str, player_id: str) -> str:
+        digest = hmac.new(self.secret, f"{room_code}.{player_id}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).rstrip(b"=").decode()
+
+    def issue(self, room_code: str, player_id: str) -> str:
+        return f"{room_code}.{player_id}.{self._sign(room_code, player_id)}"
+
+    def verify(self, token: str) -> Optional[tuple[str, str]]:
+        """簽章正確時回傳 (房間碼, player_id)，否則 None"""
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        room_code, player_id, signature = parts
+        if not hmac.compare_digest(signature, self._sign(room_code, player_id)):
+            return None
+        return room_code, player_id
+
+
+def tokens_from_env() -> ResumeTokens:
+    secret = os.environ.get("SILENT_ISLAND_RESUME_SECRET")
+    if secret:
+        return ResumeTokens(secret.encode(), configured=True)
+    return ResumeTokens(secrets.token_bytes(32))
+
+
+async def persist_secret(tokens: ResumeTokens, backend, snapshots=None):
+    """
+    未以環境變數指定金鑰時，改用保存在共享後端（backend.shared）或快照檔（snapshots）中的金鑰；
+    尚未保存過就存入本程序產生的這一把。
+    """
+    if tokens.configured:
+        return
+    if backend.shared:
+        tokens.secret = await backend.secret(SECRET_NAME, tokens.secret)
+    elif snapshots is not None:
+        tokens.secret = await snapshots.secret(SECRET_NAME, tokens.secret)
@@ -3,25 +3,207 @@
 """
 from __future__ import annotations
 
+import asyncio
+import heapq
+import os
 import random
 import string
-from typing import Optional
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
 
 from fastapi import WebSocket
 
+from . import state
+from .bus import RemoteSocket
 from .game_engine import GameEngine
-from .models import Player
+from .game_log import GameLog
+from .host_sync import HostSync
+from .models import GamePhase, Player
+
+# ── 房間生命週期 ──────────────────────────────────────
+
+# 各階段閒置多久（秒）後回收房間；未列出的階段（遊戲進行中）用 ROOM_TTL_DEFAULT
+ROOM_TTL: dict[GamePhase, float] = {
+    GamePhase.WAITING: 30 * 60,   # 大廳沒人開始
+    GamePhase.ENDED: 15 * 60,     # 結局畫面留一段時間給大家看
+}
+ROOM_TTL_DEFAULT = 60 * 60
+# 房間總數上限：達到上限時先回收過期房間，仍然滿則拒絕建立
+MAX_ROOMS = 2000
+# 共享後端：房間碼與其他 worker 衝突時最多重試次數
+CLAIM_ATTEMPTS = 8
+
+# ── 房間碼 ────────────────────────────────────────────
+
+# 預設 4 位數字（10,000 組）。大型活動可改用較長或含字母的房間碼，
+# 例如長度 5、字母表 "23456789ABCDEFGHJKMNPQRSTUVWXYZ"（去掉易混淆的 0/O、1/I/L）
+ROOM_CODE_LENGTH = int(os.environ.get("SILENT_ISLAND_ROOM_CODE_LENGTH", "4"))
+ROOM_CODE_ALPHABET = os.environ.get("SILENT_ISLAND_ROOM_CODE_ALPHABET", string.digits)
+
+
+class RoomCodeAllocator:
+    """
+    以「惰性 Fisher–Yates 洗牌」配置房間碼：把整個代碼空間視為一個虛擬陣列，
+    前 free 格是尚未使用的代碼索引，只記錄被換過位置的格子。
+    配置與釋放都是 O(1)，記憶體只與曾配置過的數量成正比（不需展開整個代碼空間）。
+    """
+
+    def __init__(
+        self,
+        rng: random.Random,
+        length: int = ROOM_CODE_LENGTH,
+        alphabet: str = ROOM_CODE_ALPHABET,
+    ):
+        if length < 1 or len(alphabet) < 2 or len(set(alphabet)) != len(alphabet):
+            raise ValueError(f"無效的房間碼設定：length={length}, alphabet={alphabet!r}")
+        self.rng = rng
+        self.length = length
+        self.alphabet = alphabet
+        self.capacity = len(alphabet) ** length
+        self.free = self.capacity
+        self._slots: dict[int, int] = {}   # 虛擬陣列中被換過的格子：位置 → 代碼索引
+        self._index = {ch: i for i, ch in enumerate(alphabet)}
+
+    @property
+    def in_use(self) -> int:
+        return self.capacity - self.free
+
+    def encode(self, index: int) -> str:
+        base = len(self.alphabet)
+        chars = []
+        for _ in range(self.length):
+            index, digit = divmod(index, base)
+            chars.append(self.alphabet[digit])
+        return "".join(reversed(chars))
+
+    def decode(self, code: str) -> Optional[int]:
+        if len(code) != self.length:
+            return None
+        index = 0
+        for ch in code:
+            digit = self._index.get(ch)
+            if digit is None:
+                return None
+            index = index * len(self.alphabet) + digit
+        return index
+
+    def normalize(self, code: str) -> str:
+        """使用者輸入的房間碼（字母表沒有小寫時不分大小寫）"""
+        code = code.strip()
+        return code.upper() if self.alphabet == self.alphabet.upper() else code
+
+    def allocate(self) -> Optional[str]:
+        """隨機取一個未使用的代碼；代碼用盡時回傳 None"""
+        if self.free == 0:
+            return None
+        pos = self.rng.randrange(self.free)
+        last = self.free - 1
+        index = self._slots.get(pos, pos)
+        # 把未使用區的最後一格搬到被取走的位置，未使用區縮小一格
+        moved = self._slots.pop(last, last)
+        if pos != last:
+            self._set(pos, moved)
+        self.free -= 1
+        return self.encode(index)
+
+    def release(self, code: str):
+        """歸還代碼（放回未使用區的尾端）。只能歸還由 allocate 配置、尚未歸還的代碼。"""
+        index = self.decode(code)
+        if index is None or self.free >= self.capacity:
+            return
+        self._set(self.free, index)
+        self.free += 1
+
+    def _set(self, pos: int, index: int):
+        if pos == index:
+            self._slots.pop(pos, None)
+        else:
+            self._slots[pos] = index
 
 
 class Room:
     """一個遊戲房間"""
 
-    def __init__(self, code: str):
+    def __init__(self, code: str, rng: Optional[random.Random] = None, now: float = 0.0):
         self.code = code
-        self.engine = GameEngine()
-        self.host_ws: Optional[WebSocket] = None
-        self.player_ws: dict[str, WebSocket] = {}  # player_id → WebSocket
+        self.engine = GameEngine(rng)
+        self.engine.log = GameLog()
+        # 共享後端時，連在其他 worker 的關主 / 玩家以 RemoteSocket 代表
+        self.host_ws: Optional[WebSocket | RemoteSocket] = None
+        self.player_ws: dict[str, WebSocket | RemoteSocket] = {}  # player_id → WebSocket
+        # 關主狀態的增量同步（序號與比對基準）
+        self.host_sync = HostSync()
+        # 是否壓縮送給本房間連線的訊息（CPU 吃緊時可逐房間關閉，見 server/compression.py）
+        self.compress = True
         self.started = False
+        self.last_activity = now
+        # 目前排在回收 heap 中的期限（只有與此相同的 heap 項目有效）
+        self.expires_at = 0.0
+        # 房間碼是否由本程序的配置器配置（共享後端時也可能是從儲存載入的房間）
+        self.owns_code = True
+        # 共享後端：本地副本的版本、最後寫回的內容，以及正在處理此房間的 task
+        self.version = 0
+        self.saved_blob: Optional[bytes] = None
+        self.lock = asyncio.Lock()
+        self.lock_owner: Optional[asyncio.Task] = None
+
+    @property
+    def phase(self) -> GamePhase:
+        return self.engine.state.phase
+
+    @property
+    def ttl(self) -> float:
+        return ROOM_TTL.get(self.phase, ROOM_TTL_DEFAULT)
+
+    def touch(self, now: float):
+        """記錄活動時間（收到訊息、連線變動時呼叫）"""
+        self.last_activity = now
+
+    @property
+    def sockets(self) -> list[WebSocket]:
+        """本程序的連線（不含其他 worker 上的 RemoteSocket）"""
+        sockets = ([self.host_ws] if self.host_ws else []) + list(self.player_ws.values())
+        return [ws for ws in sockets if not isinstance(ws, RemoteSocket)]
+
+    def connections(self, worker_id: str) -> dict[str, str]:
+        """收件者（"host" / player_id）→ 所在 worker；本程序的連線記為 worker_id"""
+        recipients = dict(self.player_ws)
+        if self.host_ws:
+            recipients["host"] = self.host_ws
+        return {
+            key: ws.worker if isinstance(ws, RemoteSocket) else worker_id
+            for key, ws in recipients.items()
+        }
+
+    def attach_remote(self, connections: dict[str, str], worker_id: str) -> list[WebSocket]:
+        """
+        依儲存中的連線位置更新 RemoteSocket：新增其他 worker 的連線、移除已離開的。
+        回傳被取代的本程序連線（玩家已在其他 worker 續玩）。
+        """
+        replaced = []
+        for key, worker in connections.items():
+            if worker == worker_id:
+                continue
+            current = self.host_ws if key == "host" else self.player_ws.get(key)
+            if isinstance(current, RemoteSocket) and current.worker == worker:
+                continue
+            # 本程序的連線建立時就已寫回儲存；儲存記錄在其他 worker 表示已被取代（玩家在那裡續玩）
+            if current is not None and not isinstance(current, RemoteSocket):
+                replaced.append(current)
+            remote = RemoteSocket(worker, self.code, key)
+            if key == "host":
+                self.host_ws = remote
+            else:
+                self.player_ws[key] = remote
+        if isinstance(self.host_ws, RemoteSocket) and connections.get("host") != self.host_ws.worker:
+            self.host_ws = None
+        for key, ws in list(self.player_ws.items()):
+            if isinstance(ws, RemoteSocket) and connections.get(key) != ws.worker:
+                del self.player_ws[key]
+        return replaced
 
     @property
     def player_count(self) -> int:
@@ -35,13 +217,13 @@ class Room:
             return None
 
         player = Player(name=name)
-        self.engine.players[player.id] = player
+        self.engine.add_player(player)
         return player
 
     def remove_player(self, player_id: str):
         """移除玩家"""
         if player_id in self.engine.players:
-            self.engine.players[player_id].connected = False
+            self.engine.disconnect(player_id)
         if player_id in self.player_ws:
             del self.player_ws[player_id]
 
@@ -60,27 +242,254 @@ class Room:
 class RoomManager:
     """管理所有房間"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        rng: Optional[random.Random] = None,
+        max_rooms: int = MAX_ROOMS,
+        clock: Callable[[], float] = time.monotonic,
+        code_length: int = ROOM_CODE_LENGTH,
+        code_alphabet: str = ROOM_CODE_ALPHABET,
+        backend=None,
+        worker_id: Optional[str] = None,
+    ):
         self.rooms: dict[str, Room] = {}
+        # 房間碼與各房間引擎的 RNG 都由此導出：每個房間各自一個 Random，互不干擾
+        self.rng = rng or random.Random()
+        self.codes = RoomCodeAllocator(self.rng, code_length, code_alphabet)
+        self.backend = backend or state.MemoryBackend()
+        # 本程序在共享後端中的名稱（記錄連線位置、跨程序匯流排的頻道）
+        self.worker_id = worker_id or os.environ.get("SILENT_ISLAND_WORKER_ID") or uuid.uuid4().hex[:12]
+        # 房間親和路由：只配置本 worker 擁有的房間碼
+        self.code_filter: Callable[[str], bool] = lambda code: True
+        self.max_rooms = max_rooms
+        self.clock = clock
+        # 房間移除時通知（例如清除該房間的 QR Code 快取）
+        self._remove_listeners: list[Callable[[str], None]] = []
+        # 每次 checkout 處理完成後通知：(房間, 處理前的階段)
+        self._change_listeners: list[Callable[[Room, GamePhase], None]] = []
+        # 共享後端：本程序的連線被其他 worker 上的新連線取代時通知（應關閉舊連線）
+        self._replace_listeners: list[Callable[[WebSocket], None]] = []
+        # 房間因閒置被回收時通知（關閉仍連著的連線）
+        self._reap_listeners: list[Callable[[Room], None]] = []
+        # 回收排程：(期限, 房間碼) 的 min-heap；活動不更新 heap，到期時才重新計算
+        self._expiry: list[tuple[float, str]] = []
+        self.evictions: Counter[str] = Counter()   # 階段 → 回收數
+        self.rejected = 0                          # 達上限而拒絕建立的次數
 
-    def create_room(self) -> Room:
-        """建立新房間，產生唯一 4 位數房間碼"""
-        while True:
-            code = "".join(random.choices(string.digits, k=4))
-            if code not in self.rooms:
-                break
+    def create_room(self) -> Optional[Room]:
+        """建立新房間並配置唯一房間碼。房間數達上限或房間碼用盡時回傳 None。"""
+        if len(self.rooms) >= self.max_rooms or self.codes.free == 0:
+            self.reap()
+        code = self._allocate_code() if len(self.rooms) < self.max_rooms else None
+        if code is None:
+            self.rejected += 1
+            return None
 
-        room = Room(code)
+        now = self.clock()
+        room = Room(code, random.Random(self.rng.getrandbits(64)), now=now)
         self.rooms[code] = room
+        self._schedule(room, now + room.ttl)
         return room
 
+    def _allocate_code(self) -> Optional[str]:
+        """配置房間碼；不屬於本 worker 的代碼先跳過，配置完再歸還"""
+        skipped = []
+        code = self.codes.allocate()
+        # 從快照恢復的房間不經配置器，代碼仍在未使用區：遇到時跳過
+        while code is not None and (not self.code_filter(code) or code in self.rooms):
+            skipped.append(code)
+            code = self.codes.allocate()
+        for other in skipped:
+            self.codes.release(other)
+        return code
+
+    def touch(self, room: Room):
+        room.touch(self.clock())
+
+    def _schedule(self, room: Room, deadline: float):
+        room.expires_at = deadline
+        heapq.heappush(self._expiry, (deadline, room.code))
+
+    def reap(self) -> list[Room]:
+        """回收所有已閒置超過該階段 TTL 的房間，回傳被移除的房間；每個房間都會通知 on_reap 監聽者（關閉連線）"""
+        now = self.clock()
+        reaped = []
+        while self._expiry and self._expiry[0][0] <= now:
+            deadline, code = heapq.heappop(self._expiry)
+            room = self.rooms.get(code)
+            if room is None or room.expires_at != deadline:
+                continue  # 房間已移除或已重新排程
+            expires_at = room.last_activity + room.ttl
+            if expires_at > now:
+                self._schedule(room, expires_at)
+                continue
+            self.evictions[room.phase.value] += 1
+            self.remove_room(code)
+            reaped.append(room)
+            for callback in self._reap_listeners:
+                callback(room)
+        return reaped
+
+    # ── 共享狀態（多 worker）─────────────────────────
+
+    async def create(self) -> Optional[Room]:
+        """建立房間；共享後端時同時在儲存中佔用房間碼（與其他 worker 衝突則換一個）"""
+        for _ in range(CLAIM_ATTEMPTS):
+            room = self.create_room()
+            if room is None or not self.backend.shared:
+                return room
+            blob = self._dumps(room)
+            if await self.backend.claim(room.code, blob, self._ttl_ms(room)):
+                room.saved_blob = blob
+                return room
+            self.remove_room(room.code)
+        self.rejected += 1
+        return None
+
+    async def find(self, code: str) -> Optional[Room]:
+        """依房間碼取得房間；共享後端時從儲存載入最新狀態（本程序沒有副本就建立一個）"""
+        code = self.codes.normalize(code)
+        room = self.rooms.get(code)
+        if not self.backend.shared:
+            return room
+        loaded = await self.backend.load(code)
+        if loaded is None:
+            if room is not None:
+                self.remove_room(code)  # 已在其他 worker 結束或到期
+            return None
+        if room is None:
+            room = self._adopt(code)
+        self._apply(room, *loaded)
+        return room
+
+    @asynccontextmanager
+    async def checkout(self, room: Room):
+        """
+        處理一則會讀寫房間狀態的訊息。共享後端時：取得房間鎖 → 版本有變就重新載入 →
+        處理 → 狀態有變就寫回並遞增版本。同一個 task 內可重入；本程序後端只通知變更監聽者。
+        """
+        if room.lock_owner is asyncio.current_task():
+            yield room
+            return
+        phase = room.phase
+        if not self.backend.shared:
+            room.lock_owner = asyncio.current_task()
+            try:
+                yield room
+            finally:
+                room.lock_owner = None
+            self._notify_change(room, phase)
+            return
+        async with room.lock, self.backend.lock(room.code):
+            room.lock_owner = asyncio.current_task()
+            try:
+                remote = await self.backend.version(room.code)
+                if remote is not None and remote != room.version:
+                    loaded = await self.backend.load(room.code)
+                    if loaded is not None:
+                        self._apply(room, *loaded)
+                yield room
+                blob = self._dumps(room)
+                if blob != room.saved_blob:
+                    room.version += 1
+                    await self.backend.save(room.code, room.version, blob, self._ttl_ms(room))
+                    room.saved_blob = blob
+            except BaseException:
+                # 本地副本可能只改了一半：下次強制重新載入（saved_blob 也清掉，_apply 才會真的覆寫）
+                room.version = -1
+                room.saved_blob = None
+                raise
+            finally:
+                room.lock_owner = None
+        self._notify_change(room, phase)
+
+    def _adopt(self, code: str) -> Room:
+        """為非本程序配置房間碼的房間（其他 worker 建立、或從快照恢復）建立本地副本"""
+        now = self.clock()
+        room = Room(code, random.Random(), now=now)
+        room.owns_code = False
+        self.rooms[code] = room
+        self._schedule(room, now + room.ttl)
+        return room
+
+    def _dumps(self, room: Room) -> bytes:
+        return state.dumps(room, room.connections(self.worker_id))
+
+    def _apply(self, room: Room, version: int, blob: bytes):
+        if blob != room.saved_blob:
+            data = state.loads(blob)
+            state.restore_room(room, data)
+            for ws in room.attach_remote(data.get("connections", {}), self.worker_id):
+                for callback in self._replace_listeners:
+                    callback(ws)
+            room.saved_blob = blob
+        room.version = version
+
+    @staticmethod
+    def _ttl_ms(room: Room) -> int:
+        return int(room.ttl * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "rooms": len(self.rooms),
+            "max_rooms": self.max_rooms,
+            "codes_free": self.codes.free,
+            "codes_capacity": self.codes.capacity,
+            "by_phase": dict(Counter(room.phase.value for room in self.rooms.values())),
+            "evictions": dict(self.evictions),
+            "rejected": self.rejected,
+        }
+
     def get_room(self, code: str) -> Optional[Room]:
-        return self.rooms.get(code)
+        return self.rooms.get(self.codes.normalize(code))
+
+    def restore(self, data: dict) -> Optional[Room]:
+        """由快照重建房間（重新啟動後）；房間碼已在使用時略過"""
+        code = data["code"]
+        if code in self.rooms:
+            return None
+        room = self._adopt(code)
+        state.restore_room(room, data)
+        # 重新啟動後沒有任何連線留下：所有人視為斷線（與連線中斷相同，記入指令紀錄），
+        # 回來的玩家以 resume 經 engine.reconnect 接回；關主重新連上時送完整快照
+        room.host_ws = None
+        room.player_ws.clear()
+        for player in room.engine.players.values():
+            if player.connected:
+                room.engine.disconnect(player.id)
+        room.host_sync.reset()
+        return room
+
+    def on_change(self, callback: Callable[[Room, GamePhase], None]):
+        """註冊房間處理完成後的回呼（參數為房間與處理前的階段）"""
+        self._change_listeners.append(callback)
+
+    def _notify_change(self, room: Room, phase: GamePhase):
+        for callback in self._change_listeners:
+            callback(room, phase)
+
+    def on_replace(self, callback: Callable[[WebSocket], None]):
+        """註冊本程序連線被取代時的回呼（參數為舊連線）"""
+        self._replace_listeners.append(callback)
+
+    def on_reap(self, callback: Callable[[Room], None]):
+        """註冊房間被回收時的回呼（定期回收與建立房間時因達上限而回收都會呼叫）"""
+        self._reap_listeners.append(callback)
+
+    def on_remove(self, callback: Callable[[str], None]):
+        """註冊房間移除時的回呼（參數為房間碼）"""
+        self._remove_listeners.append(callback)
 
     def remove_room(self, code: str):
+        """移除本程序的房間（共享後端時只是丟掉本地副本，儲存中的狀態由 TTL 到期）"""
         if code in self.rooms:
-            del self.rooms[code]
+            room = self.rooms.pop(code)
+            if room.owns_code:
+                self.codes.release(code)
+            for callback in self._remove_listeners:
+                callback(code)
 
 
-# 全域單例
-room_manager = RoomManager()
+# 全域單例（狀態後端由 SILENT_ISLAND_STATE_BACKEND 決定）
+room_manager = RoomManager(backend=state.backend_from_env())
@@ -0,0 +1,437 @@
+"""
+靜默之島：選擇與代價 — 無頭平衡模擬器
+
+直接驅動 GameEngine（不經 WebSocket）大量模擬整場遊戲，
+統計社會結局分佈、被帶走比例與各角色最終風險分佈，用來調整結局門檻、
+伏筆擲幣與角色被動。
+
+吞吐量：逐場驅動 GameEngine 單核心約 3 千場/秒，時間大多花在 settle_round
+（即使略過敘事與歷史紀錄也只快約兩成）。因此 CLI 預設（--engine auto）在有 numpy 時
+改用 server.batch_engine 的向量化引擎，單核心約 13–20 萬場/秒；兩者規則相同，
+由 batch_engine --check 逐場交叉檢查。沒有 numpy 時退回純量引擎。
+
+使用方法：
+  python -m server.simulate --games 100000
+  python -m server.simulate --games 50000 --players 7 --strategy role --ability role --json
+  python -m server.simulate --games 1000000 --workers 32 --seed 42
+  python -m server.simulate --games 20000 --engine scalar --seed 42
+
+多程序執行時，場次先切成固定大小的批次，每批的種子由主種子導出；
+同一個主種子在任何 worker 數下都得到完全相同的統計。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from .game_engine import SETTLEMENT_RULES, GameEngine
+from .models import EVENTS, GamePhase, Player
+
+# 投票策略
+STRATEGIES = ("random", "comply", "resist", "evade", "role")
+# 能力使用策略
+ABILITY_POLICIES = ("never", "early", "late", "random", "role")
+
+# 需要指定目標的能力
+TARGETED_ROLES = frozenset({"D", "G"})
+# random 能力策略：每回合使用能力的機率
+ABILITY_RANDOM_P = 0.25
+# role 策略：B / C 在風險很低時抵抗的機率
+ROLE_RESIST_P = 0.3
+# 每批場數：批次切分與 worker 數無關，結果才能重現
+BATCH_SIZE = 5000
+# 模擬引擎：batch 為 server.batch_engine 的 NumPy 向量化引擎，scalar 為逐場驅動 GameEngine；
+# auto 在可匯入 numpy 時用 batch，否則退回 scalar
+ENGINES = ("auto", "batch", "scalar")
+
+
+# ── 選項分類 ──────────────────────────────────────────
+
+def _choice_by_category() -> dict[int, dict[str, str]]:
+    """event_number → {"comply"/"evade"/"resist": choice_key}
+
+    同類有多個選項時取沒有道德代價的那個；某類不存在時退回服從類選項（is_comply）。
+    """
+    table: dict[int, dict[str, str]] = {}
+    for event in EVENTS:
+        if event.is_auto_settle:
+            continue
+        rules = SETTLEMENT_RULES[event.number]
+        fallback = next(c.key for c in event.choices if c.is_comply)
+        keys = {}
+        for category in ("comply", "evade", "resist"):
+            candidates = [c.key for c in event.choices if rules[c.key].category == category]
+            candidates.sort(key=lambda k: rules[k].moral_cost or rules[k].moral_collapse)
+            keys[category] = candidates[0] if candidates else fallback
+        table[event.number] = keys
+    return table
+
+
+CHOICE_BY_CATEGORY = _choice_by_category()
+
+
+# ── 設定與結果 ────────────────────────────────────────
+
+@dataclass
+class SimulationConfig:
+    players: tuple[int, ...] = (6, 7, 8)  # 每場隨機抽一個人數
+    strategy: str = "random"
+    ability: str = "random"
+
+    def __post_init__(self):
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"未知投票策略: {self.strategy}")
+        if self.ability not in ABILITY_POLICIES:
+            raise ValueError(f"未知能力策略: {self.ability}")
+        if not self.players or any(n < 6 or n > 8 for n in self.players):
+            raise ValueError(f"玩家人數必須在 6-8 之間: {self.players}")
+
+
+@dataclass
+class SimulationResult:
+    games: int = 0
+    endings: Counter = field(default_factory=Counter)            # 社會結局 key → 場數
+    personal_endings: Counter = field(default_factory=Counter)   # 個人結局 type → 人次
+    players_by_role: Counter = field(default_factory=Counter)    # role → 人次
+    taken_by_role: Counter = field(default_factory=Counter)      # role → 被帶走人次
+    risk_by_role: dict[str, Counter] = field(default_factory=dict)  # role → 最終風險 → 人次
+    elapsed: float = 0.0
+
+    def merge(self, other: SimulationResult) -> SimulationResult:
+        """合併另一批模擬結果（就地修改並回傳自身）"""
+        self.games += other.games
+        self.endings.update(other.endings)
+        self.personal_endings.update(other.personal_endings)
+        self.players_by_role.update(other.players_by_role)
+        self.taken_by_role.update(other.taken_by_role)
+        for role, hist in other.risk_by_role.items():
+            self.risk_by_role.setdefault(role, Counter()).update(hist)
+        self.elapsed += other.elapsed
+        return self
+
+    def to_dict(self) -> dict:
+        total_players = sum(self.players_by_role.values())
+        return {
+            "games": self.games,
+            "endings": {k: self.endings[k] / self.games for k in sorted(self.endings)} if self.games else {},
+            "personal_endings": {
+                k: v / total_players for k, v in sorted(self.personal_endings.items())
+            } if total_players else {},
+            "taken_away_rate": sum(self.taken_by_role.values()) / total_players if total_players else 0.0,
+            "taken_away_rate_by_role": {
+                role: self.taken_by_role[role] / n for role, n in sorted(self.players_by_role.items())
+            },
+            "risk_histogram_by_role": {
+                role: dict(sorted(hist.items())) for role, hist in sorted(self.risk_by_role.items())
+            },
+            "games_per_second": round(self.games / self.elapsed) if self.elapsed else None,
+        }
+
+
+# ── 投票策略 ──────────────────────────────────────────
+
+def _role_aware_category(engine: GameEngine, player: Player, rng: random.Random) -> str:
+    """依角色與目前局勢選擇選項類別"""
+    fear = engine.state.social_fear
+    if player.risk >= 6:
+        return "comply"
+    if player.role_id in ("B", "C"):
+        # 抵抗會多一點風險：只在風險很低時偶爾抵抗
+        return "resist" if player.risk <= 1 and rng.random() < ROLE_RESIST_P else rng.choice(("comply", "evade"))
+    if player.role_id == "D" and fear >= 3:
+        return rng.choice(("comply", "evade"))
+    if player.role_id == "A" and not player.ability_used:
+        # 能力可讓迴避不產生伏筆
+        return "evade"
+    if player.role_id == "F":
+        return "comply"
+    return rng.choice(("comply", "evade", "resist"))
+
+
+def _pick_category(strategy: str, engine: GameEngine, player: Player, rng: random.Random) -> str:
+    if strategy == "random":
+        return rng.choice(("comply", "evade", "resist"))
+    if strategy == "role":
+        return _role_aware_category(engine, player, rng)
+    return strategy
+
+
+# ── 能力策略 ──────────────────────────────────────────
+
+def _wants_ability(
+    policy: str, engine: GameEngine, player: Player, category: Optional[str], rng: random.Random
+) -> bool:
+    event_num = engine.state.current_event
+    if policy == "never":
+        return False
+    if policy == "early":
+        return True
+    if policy == "late":
+        return event_num == 6
+    if policy == "random":
+        return rng.random() < ABILITY_RANDOM_P
+
+    # role：只在能力有實際效果時使用
+    role = player.role_id
+    if role == "A":
+        return category == "evade" and event_num in (1, 4)
+    if role == "C":
+        return category == "resist"
+    if role in ("B", "E"):
+        return engine.state.social_fear >= 2 or event_num == 6
+    if role == "F":
+        return event_num == 6
+    if role in TARGETED_ROLES:
+        return event_num >= 3
+    return False
+
+
+def _ability_target(engine: GameEngine, player_id: str) -> Optional[str]:
+    """D / G 的目標：風險最高、尚未被帶走的其他玩家"""
+    best = None
+    for pid, p in engine.players.items():
+        if pid == player_id or p.taken_away:
+            continue
+        if best is None or p.risk > engine.players[best].risk:
+            best = pid
+    return best
+
+
+# ── 模擬 ──────────────────────────────────────────────
+
+def play_game(engine: GameEngine, config: SimulationConfig, rng: random.Random):
+    """跑完一場遊戲（engine 已有玩家）。回傳 determine_ending() 的結果。"""
+    engine.assign_roles()
+
+    for event in EVENTS:
+        engine.get_next_event()
+        if event.is_auto_settle:
+            engine.settle_foreshadows()
+            continue
+
+        keys = CHOICE_BY_CATEGORY[event.number]
+        planned: dict[str, str] = {}
+        for pid, player in engine.players.items():
+            if player.taken_away:
+                continue
+            category = _pick_category(config.strategy, engine, player, rng)
+            planned[pid] = category
+            if not player.ability_used and _wants_ability(config.ability, engine, player, category, rng):
+                target = _ability_target(engine, pid) if player.role_id in TARGETED_ROLES else None
+                engine.use_ability(pid, target)
+
+        engine.set_phase(GamePhase.VOTING)
+        for pid, category in planned.items():
+            # D 角色被限制時投票失敗，交由超時自動迴避
+            engine.submit_vote(pid, keys[category])
+        engine.auto_evade_timeout_players()
+        engine.settle_round()
+
+    return engine.determine_ending()
+
+
+def simulate(
+    games: int,
+    config: Optional[SimulationConfig] = None,
+    seed: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> SimulationResult:
+    """模擬多場遊戲並回傳統計"""
+    config = config or SimulationConfig()
+    rng = random.Random(seed)
+
+    result = SimulationResult()
+    start = time.perf_counter()
+
+    for i in range(games):
+        engine = GameEngine(rng)
+        n = rng.choice(config.players)
+        for j in range(n):
+            player = Player(id=f"p{j}", name=f"p{j}")
+            engine.players[player.id] = player
+
+        ending = play_game(engine, config, rng)
+
+        result.endings[ending["social_ending"]["key"]] += 1
+        for pe in ending["personal_endings"]:
+            role = pe["role_id"]
+            result.personal_endings[pe["ending_type"]] += 1
+            result.players_by_role[role] += 1
+            if pe["taken_away"]:
+                result.taken_by_role[role] += 1
+            result.risk_by_role.setdefault(role, Counter())[pe["risk"]] += 1
+
+        if progress and (i + 1) % 10000 == 0:
+            progress(i + 1)
+
+    result.games = games
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def batch_plan(games: int, seed: int, batch_size: int = BATCH_SIZE) -> list[tuple[int, int]]:
+    """把場次切成 [(場數, 批次種子), ...]。只取決於 games / seed / batch_size。"""
+    rng = random.Random(seed)
+    plan = []
+    remaining = games
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        plan.append((n, rng.getrandbits(64)))
+        remaining -= n
+    return plan
+
+
+def _run_batch(args: tuple[int, SimulationConfig, int]) -> SimulationResult:
+    games, config, seed = args
+    return simulate(games, config, seed=seed)
+
+
+def resolve_engine(engine: str = "auto") -> str:
+    """把 auto 解析成 batch（numpy 可用）或 scalar"""
+    if engine != "auto":
+        return engine
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return "scalar"
+    return "batch"
+
+
+def simulate_sharded(
+    games: int,
+    config: Optional[SimulationConfig] = None,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+    engine: str = "auto",
+) -> SimulationResult:
+    """把場次分批交給程序池模擬並合併統計。結果只取決於 seed，與 workers 無關。
+
+    engine 為 batch 時改由 server.batch_engine 執行（批次大小固定為其 CHUNK_GAMES）；
+    兩種引擎的統計分佈相同（batch_engine --check 逐場對照），但同一個種子的逐場結果不同。
+    """
+    config = config or SimulationConfig()
+    if resolve_engine(engine) == "batch":
+        from .batch_engine import simulate_batch_sharded
+
+        return simulate_batch_sharded(
+            games, config.players, config.strategy, config.ability, seed=seed, workers=workers, progress=progress,
+        )
+    jobs = [(n, config, batch_seed) for n, batch_seed in batch_plan(games, seed, batch_size)]
+    return run_pool(_run_batch, jobs, workers, progress)
+
+
+def run_pool(
+    run: Callable[[tuple], SimulationResult],
+    jobs: list[tuple],
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> SimulationResult:
+    """在程序池執行各批次（run 必須是模組層級函式）並依序合併統計；server.batch_engine 也用它跨核心執行"""
+    workers = workers or os.cpu_count() or 1
+    result = SimulationResult()
+    start = time.perf_counter()
+
+    if workers == 1 or len(jobs) <= 1:
+        batches = map(run, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+        batches = pool.map(run, jobs)
+
+    try:
+        for batch in batches:
+            result.merge(batch)
+            if progress:
+                progress(result.games)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    # 各批次的 elapsed 是 CPU 時間總和；回報牆鐘時間
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+# ── 輸出 ──────────────────────────────────────────────
+
+def format_report(result: SimulationResult) -> str:
+    data = result.to_dict()
+    lines = [f"模擬 {data['games']} 場（{data['games_per_second']} 場/秒）", "", "社會結局："]
+    for key, rate in data["endings"].items():
+        lines.append(f"  {key}  {rate:7.2%}")
+    lines += ["", "個人結局："]
+    for key, rate in data["personal_endings"].items():
+        lines.append(f"  {key:<15}{rate:7.2%}")
+    lines += ["", f"被帶走比例：{data['taken_away_rate']:.2%}"]
+    for role, rate in data["taken_away_rate_by_role"].items():
+        lines.append(f"  {role}  {rate:7.2%}")
+    lines += ["", "各角色最終風險分佈："]
+    for role, hist in data["risk_histogram_by_role"].items():
+        total = sum(hist.values())
+        buckets = "  ".join(f"{risk}:{count / total:.1%}" for risk, count in hist.items())
+        lines.append(f"  {role}  {buckets}")
+    return "\n".join(lines)
+
+
+def parse_players(value: str) -> tuple[int, ...]:
+    """--players 參數：6、6-8、6,8"""
+    if "-" in value:
+        lo, hi = value.split("-", 1)
+        return tuple(range(int(lo), int(hi) + 1))
+    return tuple(int(v) for v in value.split(","))
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="靜默之島 無頭平衡模擬器")
+    parser.add_argument("--games", type=int, default=100000, help="模擬場數")
+    parser.add_argument("--players", type=parse_players, default=(6, 7, 8), help="玩家人數，例如 6、6-8、6,8")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="random", help="投票策略")
+    parser.add_argument("--ability", choices=ABILITY_POLICIES, default="random", help="能力使用策略")
+    parser.add_argument("--seed", type=int, default=None, help="主隨機種子（未指定則隨機產生並輸出）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="程序數")
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="auto",
+        help="batch：NumPy 向量化（單核心約 13–20 萬場/秒）；scalar：逐場 GameEngine（約 3 千場/秒）",
+    )
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args(argv)
+
+    try:
+        config = SimulationConfig(players=args.players, strategy=args.strategy, ability=args.ability)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.seed is None:
+        args.seed = random.SystemRandom().getrandbits(32)
+    if args.workers < 1:
+        parser.error("--workers 必須 ≥ 1")
+    args.engine = resolve_engine(args.engine)
+    if args.engine == "batch":
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            parser.error("--engine batch 需要 numpy：pip install -r requirements-dev.txt")
+
+    result = simulate_sharded(
+        args.games, config, seed=args.seed, workers=args.workers, engine=args.engine,
+        progress=lambda n: print(f"  …{n} 場", file=sys.stderr),
+    )
+
+    if args.json:
+        print(json.dumps({"config": vars(args), **result.to_dict()}, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(result))
+        print(f"\n主種子：{args.seed}（workers={args.workers}，engine={args.engine}）")
+
+
+if __name__ == "__main__":
+    main()
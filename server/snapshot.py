@@ -0,0 +1,251 @@
+"""
+靜默之島：選擇與代價 — 房間狀態快照（重新啟動後恢復）
+
+預設房間只存在記憶體，部署或當機會讓進行中的遊戲消失。
+啟用快照後，房間狀態寫入 SQLite 檔案，下次啟動時恢復：
+- 房間處理完訊息只標記為「待寫入」，定期（SNAPSHOT_INTERVAL）寫一次；階段轉換時立即寫
+- 每次只序列化待寫入的房間，內容沒變的不寫；壓縮與寫檔在背景執行緒，不佔用事件迴圈
+- 房間被移除時一併刪除快照
+
+格式：每個房間一列，遊戲狀態為 zlib 壓縮的 JSON（state.room_to_dict），
+RNG 內部狀態另存為 624+1 個 32 位元整數的原始位元組（比 JSON 數字小得多）。
+
+以環境變數 SILENT_ISLAND_SNAPSHOT 指定檔案路徑（未設定時不啟用）。
+共享狀態後端（SILENT_ISLAND_STATE_BACKEND=redis://…）時狀態已在共享儲存中，不需要快照。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+from . import state
+from .models import GamePhase
+
+logger = logging.getLogger("silent-island")
+
+# 定期寫入的間隔（秒）
+SNAPSHOT_INTERVAL = 10.0
+# 每批序列化的房間數：批與批之間讓出事件迴圈（每房間約 0.1ms）
+SNAPSHOT_BATCH = 100
+# 壓縮等級（1–9；狀態很小，較高等級幾乎不增加成本）
+COMPRESS_LEVEL = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    code     TEXT PRIMARY KEY,
+    state    BLOB NOT NULL,
+    rng      BLOB NOT NULL,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS secrets (
+    name  TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+)
+"""
+
+
+# ── 編碼 ──────────────────────────────────────────────
+
+def encode_room(data: dict[str, Any]) -> tuple[bytes, bytes]:
+    """state.room_to_dict 的結果 → (狀態 JSON, RNG 位元組)；壓縮另外進行"""
+    version, internal, gauss = data["rng"]
+    body = dict(data, rng=[version, None, gauss])
+    text = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return text, array("I", internal).tobytes()
+
+
+def decode_room(blob: bytes, rng: bytes) -> dict[str, Any]:
+    data = json.loads(zlib.decompress(blob))
+    internal = array("I")
+    internal.frombytes(rng)
+    data["rng"][1] = internal.tolist()
+    return data
+
+
+# ── 儲存 ──────────────────────────────────────────────
+
+class SnapshotStore:
+    """SQLite 檔案；除了啟動時 restore 讀取一次，只由 Snapshotter 的單一寫入執行緒使用"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # WAL + NORMAL：每次提交不 fsync 整個檔案，當機最多遺失最後一次提交
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+
+    def write(self, rows: list[tuple[str, bytes, bytes]], deleted: list[str]):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO rooms (code, state, rng, saved_at) VALUES (?, ?, ?, ?)",
+                [(code, blob, rng, now) for code, blob, rng in rows],
+            )
+            self.db.executemany("DELETE FROM rooms WHERE code = ?", [(code,) for code in deleted])
+
+    def secret(self, name: str, candidate: bytes) -> bytes:
+        """取得保存的金鑰（重新啟動後沿用）；還沒有就存入 candidate"""
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO secrets (name, value) VALUES (?, ?)", (name, candidate))
+        return self.db.execute("SELECT value FROM secrets WHERE name = ?", (name,)).fetchone()[0]
+
+    def load_all(self) -> list[tuple[str, bytes, bytes]]:
+        return self.db.execute("SELECT code, state, rng FROM rooms").fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+class Snapshotter:
+    """追蹤有變動的房間並定期寫入快照；階段轉換時提早寫"""
+
+    def __init__(self, store: SnapshotStore, room_manager, interval: float = SNAPSHOT_INTERVAL):
+        self.store = store
+        self.room_manager = room_manager
+        self.interval = interval
+        self._dirty: set[str] = set()
+        self._deleted: set[str] = set()
+        # 上次寫入內容的雜湊，相同就不再寫
+        self._written: dict[str, int] = {}
+        self._wake = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+        self._task: Optional[asyncio.Task] = None
+        # 統計
+        self.flushes = 0
+        self.rooms_written = 0
+        self.bytes_written = 0
+        self.last_flush_ms = 0.0
+
+    # RoomManager 回呼
+    def changed(self, room, phase_before: GamePhase):
+        self._dirty.add(room.code)
+        self._deleted.discard(room.code)
+        if room.phase != phase_before:
+            self._wake.set()
+
+    def removed(self, code: str):
+        self._dirty.discard(code)
+        if self._written.pop(code, None) is not None:
+            self._deleted.add(code)
+
+    async def secret(self, name: str, candidate: bytes) -> bytes:
+        """保存在快照檔中的金鑰（見 resume.persist_secret），經由寫入執行緒存取"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.store.secret, name, candidate)
+
+    def restore(self) -> int:
+        """啟動時恢復所有快照中的房間，回傳恢復數"""
+        restored = 0
+        for code, blob, rng in self.store.load_all():
+            try:
+                data = decode_room(blob, rng)
+                room = self.room_manager.restore(data)
+            except Exception as e:
+                logger.warning(f"Snapshot of room {code} could not be restored: {e}")
+                self._deleted.add(code)
+                continue
+            if room is not None:
+                self._written[code] = hash(encode_room(data))
+                restored += 1
+        return restored
+
+    def start(self):
+        self.room_manager.on_change(self.changed)
+        self.room_manager.on_remove(self.removed)
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Snapshot failed: {e}", exc_info=True)
+
+    async def flush(self):
+        """
+        寫入所有待寫入的房間。事件迴圈上只做序列化（必須在這裡做：狀態隨時在變），
+        每 SNAPSHOT_BATCH 個房間一批，壓縮與寫檔交給寫入執行緒；成本與變動的房間數成正比。
+        """
+        dirty, self._dirty = list(self._dirty), set()
+        deleted, self._deleted = list(self._deleted), set()
+        started = time.perf_counter()
+        wrote = False
+        for start in range(0, max(len(dirty), 1), SNAPSHOT_BATCH):
+            pending, keys = [], {}
+            for code in dirty[start:start + SNAPSHOT_BATCH]:
+                room = self.room_manager.rooms.get(code)
+                if room is None:
+                    continue
+                encoded = encode_room(state.room_to_dict(room))
+                key = hash(encoded)
+                if self._written.get(code) != key:
+                    keys[code] = key
+                    pending.append((code, *encoded))
+            if not pending and not deleted:
+                continue
+            try:
+                self.bytes_written += await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._write, pending, deleted,
+                )
+            except Exception:
+                # 寫入失敗：這一批與之後的房間下次再寫（_written 只記錄確實寫入的內容）
+                self._dirty.update(dirty[start:])
+                self._deleted.update(code for code in deleted if code not in self.room_manager.rooms)
+                raise
+            self._written.update(keys)
+            self.rooms_written += len(pending)
+            deleted = []
+            wrote = True
+        if wrote:
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _write(self, pending: list[tuple[str, bytes, bytes]], deleted: list[str]) -> int:
+        rows = [(code, zlib.compress(text, COMPRESS_LEVEL), rng) for code, text, rng in pending]
+        self.store.write(rows, deleted)
+        return sum(len(blob) + len(rng) for _, blob, rng in rows)
+
+    async def close(self):
+        """停止定期寫入並寫入最後一次快照"""
+        if self._task is not None:
+            self._task.cancel()
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        self.store.close()
+
+    def stats(self) -> dict:
+        return {
+            "path": self.store.path,
+            "tracked": len(self._written),
+            "pending": len(self._dirty),
+            "flushes": self.flushes,
+            "rooms_written": self.rooms_written,
+            "bytes_written": self.bytes_written,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+def snapshotter_from_env(room_manager) -> Optional[Snapshotter]:
+    path = os.environ.get("SILENT_ISLAND_SNAPSHOT")
+    if not path:
+        return None
+    if room_manager.backend.shared:
+        logger.warning("SILENT_ISLAND_SNAPSHOT ignored: room state is already in the shared backend")
+        return None
+    return Snapshotter(SnapshotStore(path), room_manager)
@@ -0,0 +1,239 @@
+"""
+靜默之島：選擇與代價 — 房間狀態儲存後端
+
+RoomManager 透過後端決定房間狀態放在哪裡：
+- MemoryBackend：只在本程序記憶體（預設，單一 worker）
+- SharedBackend：存在 Redis 相容的共享儲存，多個 worker 都能服務同一個房間。
+  每則訊息處理前取得房間鎖、版本有變就重新載入，處理後寫回。
+
+以環境變數 SILENT_ISLAND_STATE_BACKEND 選擇：
+  memory（預設）或 redis://host:6379/0
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import fields
+from typing import Any, Optional
+
+from .game_log import GameLog
+from .host_sync import HostSync
+from .models import Foreshadow, ForeshadowType, GamePhase, GameState, Player
+from .resp import RespClient
+
+logger = logging.getLogger("silent-island")
+
+# 序列化格式版本（欄位有不相容變動時遞增）
+STATE_FORMAT = 1
+
+# 房間鎖：持有上限（毫秒，worker 當掉時自動釋放）與等待上限（秒）
+LOCK_TTL_MS = 10_000
+LOCK_WAIT = 15.0
+LOCK_RETRY = 0.01
+
+
+# ── 序列化 ────────────────────────────────────────────
+
+def player_to_dict(player: Player) -> dict[str, Any]:
+    data = {f.name: getattr(player, f.name) for f in fields(Player)}
+    data["foreshadows"] = [[fs.ftype.value, fs.event_number] for fs in player.foreshadows]
+    data["votes"] = [[event, choice] for event, choice in player.votes.items()]
+    return data
+
+
+def player_from_dict(data: dict[str, Any]) -> Player:
+    data = dict(data)
+    player = Player(**{k: v for k, v in data.items() if k not in ("foreshadows", "votes")})
+    player.foreshadows = [Foreshadow(player.id, ForeshadowType(ftype), event) for ftype, event in data["foreshadows"]]
+    player.votes = {event: choice for event, choice in data["votes"]}
+    return player
+
+
+def state_to_dict(state: GameState) -> dict[str, Any]:
+    data = {f.name: getattr(state, f.name) for f in fields(GameState)}
+    data["phase"] = state.phase.value
+    return data
+
+
+def state_from_dict(data: dict[str, Any]) -> GameState:
+    state = GameState(**data)
+    state.phase = GamePhase(state.phase)
+    return state
+
+
+def room_to_dict(room) -> dict[str, Any]:
+    """房間的遊戲狀態（不含連線）"""
+    version, internal, gauss = room.engine.rng.getstate()
+    return {
+        "format": STATE_FORMAT,
+        "code": room.code,
+        "started": room.started,
+        "state": state_to_dict(room.engine.state),
+        "players": [player_to_dict(p) for p in room.engine.players.values()],
+        "rng": [version, list(internal), gauss],
+        "log": base64.b64encode(bytes(room.engine.log)).decode() if room.engine.log is not None else None,
+        "host_sync": room.host_sync.to_list(),
+        "compress": room.compress,
+    }
+
+
+def restore_room(room, data: dict[str, Any]):
+    """以序列化的狀態覆寫房間（保留本程序的連線）"""
+    if data.get("format") != STATE_FORMAT:
+        raise ValueError(f"不支援的房間狀態格式：{data.get('format')}")
+    room.started = data["started"]
+    room.engine.state = state_from_dict(data["state"])
+    room.engine.players = {p["id"]: player_from_dict(p) for p in data["players"]}
+    version, internal, gauss = data["rng"]
+    room.engine.rng.setstate((version, tuple(internal), gauss))
+    log = data.get("log")
+    room.engine.log = GameLog(base64.b64decode(log)) if log else None
+    room.host_sync = HostSync.from_list(data.get("host_sync"))
+    room.compress = data.get("compress", True)
+
+
+def dumps(room, connections: Optional[dict[str, str]] = None) -> bytes:
+    """序列化房間；connections 為收件者（"host" / player_id）→ 所在 worker"""
+    data = room_to_dict(room)
+    if connections is not None:
+        data["connections"] = connections
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(blob: bytes) -> dict[str, Any]:
+    return json.loads(blob)
+
+
+# ── 後端 ──────────────────────────────────────────────
+
+class MemoryBackend:
+    """單一程序：房間只存在本程序記憶體，不需要同步"""
+
+    shared = False
+
+    async def close(self):
+        pass
+
+
+class LockTimeout(Exception):
+    """等不到房間鎖（另一個 worker 持有過久）"""
+
+
+class SharedBackend:
+    """
+    以 Redis 相容儲存共享房間狀態。鍵：
+      {prefix}room:{code}   序列化的房間狀態
+      {prefix}ver:{code}    版本號（每次寫回遞增；比對用，避免每次都讀整個狀態）
+      {prefix}lock:{code}   房間鎖（SET NX PX）
+      {prefix}secret:{name} 各 worker 共用的金鑰（不會到期）
+    房間鍵的到期時間跟著該階段的 TTL，每次寫回時更新。
+    """
+
+    shared = True
+
+    def __init__(self, client: RespClient, prefix: str = "si:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, kind: str, code: str) -> str:
+        return f"{self.prefix}{kind}:{code}"
+
+    async def claim(self, code: str, blob: bytes, ttl_ms: int) -> bool:
+        """新房間：房間碼未被其他 worker 使用時寫入並回傳 True"""
+        ok = await self.client.execute("SET", self._key("room", code), blob, "NX", "PX", ttl_ms)
+        if ok is None:
+            return False
+        await self.client.execute("SET", self._key("ver", code), 0, "PX", ttl_ms)
+        return True
+
+    async def version(self, code: str) -> Optional[int]:
+        value = await self.client.execute("GET", self._key("ver", code))
+        return int(value) if value is not None else None
+
+    async def load(self, code: str) -> Optional[tuple[int, bytes]]:
+        """(版本, 狀態)；房間不存在時回傳 None"""
+        version, blob = await self.client.execute("MGET", self._key("ver", code), self._key("room", code))
+        if version is None or blob is None:
+            return None
+        return int(version), blob
+
+    async def save(self, code: str, version: int, blob: bytes, ttl_ms: int):
+        await self.client.execute("SET", self._key("room", code), blob, "PX", ttl_ms)
+        await self.client.execute("SET", self._key("ver", code), version, "PX", ttl_ms)
+
+    async def delete(self, code: str):
+        await self.client.execute("DEL", self._key("room", code), self._key("ver", code))
+
+    @asynccontextmanager
+    async def lock(self, code: str):
+        key = self._key("lock", code)
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LOCK_WAIT
+        delay = LOCK_RETRY
+        while not await self._acquire(key, token):
+            if loop.time() >= deadline:
+                raise LockTimeout(code)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        try:
+            yield
+        finally:
+            # 只釋放自己的鎖（逾時後可能已被別人取得）；比對與刪除在伺服器端原子執行
+            await self.client.delete_if_equal(key, token)
+
+    async def _acquire(self, key: str, token: str) -> bool:
+        try:
+            return await self.client.execute("SET", key, token, "NX", "PX", LOCK_TTL_MS, retry=False) is not None
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # 連線在回應前中斷：SET 可能已生效，以目前的值判斷是否已取得
+            return await self.client.execute("GET", key) == token.encode()
+
+    async def secret(self, name: str, candidate: bytes) -> bytes:
+        """取得共用金鑰；還沒有就存入 candidate（同時啟動的 worker 以 SET NX 決定誰的留下）"""
+        key = self._key("secret", name)
+        await self.client.execute("SET", key, candidate, "NX")
+        return await self.client.execute("GET", key)
+
+    async def close(self):
+        await self.client.close()
+
+
+def server_workers(argv: Optional[list[str]] = None) -> int:
+    """
+    啟動本程序的 uvicorn / gunicorn 命令列設定的 worker 數（--workers、-w，或兩者都讀的 WEB_CONCURRENCY）。
+    uvicorn 以 spawn 啟動 worker，子程序的 sys.argv 與上層相同，所以在 worker 內也讀得到。
+    不是以這兩個命令啟動（例如 python -m server.main、python -m server.affinity）時為 1。
+    """
+    argv = sys.argv if argv is None else argv
+    if not argv or not any(name in argv[0] for name in ("uvicorn", "gunicorn")):
+        return 1
+    for i, arg in enumerate(argv):
+        if arg in ("--workers", "-w") and i + 1 < len(argv):
+            return int(argv[i + 1])
+        if arg.startswith("--workers="):
+            return int(arg.partition("=")[2])
+        if arg.startswith("-w") and arg[2:].isdigit():
+            return int(arg[2:])
+    return int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+
+def backend_from_env():
+    url = os.environ.get("SILENT_ISLAND_STATE_BACKEND", "memory")
+    if url == "memory":
+        # 多個 worker 各自一份記憶體：房間會分散在不同程序，玩家隨機加入失敗
+        # （房間親和路由 SILENT_ISLAND_WORKERS 例外：房間只由擁有者處理）
+        workers = server_workers()
+        if workers > 1 and not os.environ.get("SILENT_ISLAND_WORKERS"):
+            raise ValueError(f"以 {workers} 個 worker 啟動需要共享狀態後端（SILENT_ISLAND_STATE_BACKEND=redis://…）")
+        return MemoryBackend()
+    if url.startswith("redis://"):
+        logger.info(f"Using shared room state backend at {url}")
+        return SharedBackend(RespClient(url))
+    raise ValueError(f"未知的 SILENT_ISLAND_STATE_BACKEND：{url}")
@@ -0,0 +1,192 @@
+"""
+靜默之島：選擇與代價 — 精簡傳輸格式（MessagePack + 字串表）
+
+預設 /ws 的訊息是 UTF-8 JSON 文字，每回合重複送出很長的中文敘事（NARRATIVE_RESULTS、
+FORESHADOW_NARRATIVES、WAITING_ATMOSPHERE…）。客戶端以 WebSocket 子協定
+"silent-island.msgpack" 要求時，伺服器改送二進位 MessagePack：
+- 遊戲資料中的固定文字（models 裡的敘事、事件、角色、結局…）編成字串表，訊息中只送編號
+  （MessagePack ext 型別 1，內容為大端序的編號）
+- 每條連線第一次用到某個編號時，先送一則 {"type": "strings", "table": [[編號, 文字], …]}；
+  同一連線之後只送編號（每段文字每個連線只送一次）
+- 客戶端送往伺服器的訊息仍是 JSON 文字
+
+只實作伺服器需要的編碼（不需要額外套件）；解碼器見 client/js/wire.js 與 client-react/lib/wire.ts。
+"""
+from __future__ import annotations
+
+import dataclasses
+import struct
+from typing import Any, Iterable
+
+from . import models
+
+SUBPROTOCOL = "silent-island.msgpack"
+# 字串表的 ext 型別
+EXT_STRING = 1
+# 短於此長度（UTF-8 bytes）的文字直接內嵌：編號不會比較短
+MIN_TABLE_BYTES = 12
+
+
+# ── 字串表 ────────────────────────────────────────────
+
+def _collect(value: Any, out: list[str]):
+    if isinstance(value, str):
+        if len(value.encode("utf-8")) >= MIN_TABLE_BYTES:
+            out.append(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect(item, out)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _collect(item, out)
+    elif dataclasses.is_dataclass(value):
+        for field in dataclasses.fields(value):
+            _collect(getattr(value, field.name), out)
+
+
+def _build_table(sources: Iterable[Any]) -> list[str]:
+    strings: list[str] = []
+    for source in sources:
+        _collect(source, strings)
+    # 依出現順序去重：同一份程式碼的每個 worker 得到相同的編號
+    return list(dict.fromkeys(strings))
+
+
+STRINGS: list[str] = _build_table([
+    models.ROLE_INFO,
+    models.EVENTS,
+    models.ENDINGS,
+    models.TAKEN_AWAY_TEXT,
+    models.MORAL_COST_TEXT,
+    models.MORAL_COLLAPSE_TEXT,
+    models.SURVIVOR_TEXT,
+    models.ORDINARY_TEXT,
+    models.CLOSURE_TEXT,
+    models.REFLECTION_TEXT,
+    models.NARRATIVE_RESULTS,
+    models.SOCIAL_CONTEXT_NARRATIVES,
+    models.HOST_GUIDANCE,
+    models.FORESHADOW_NARRATIVES,
+    models.RISK_WARNING_NARRATIVES,
+    models.WAITING_ATMOSPHERE,
+])
+STRING_IDS: dict[str, int] = {text: i for i, text in enumerate(STRINGS)}
+
+
+# ── MessagePack 編碼 ──────────────────────────────────
+
+def _pack(obj: Any, out: bytearray, refs: set[int]):
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif obj >= 0:
+            if obj < 1 << 8:
+                out += b"\xcc" + struct.pack(">B", obj)
+            elif obj < 1 << 16:
+                out += b"\xcd" + struct.pack(">H", obj)
+            elif obj < 1 << 32:
+                out += b"\xce" + struct.pack(">I", obj)
+            else:
+                out += b"\xcf" + struct.pack(">Q", obj)
+        elif obj >= -(1 << 7):
+            out += b"\xd0" + struct.pack(">b", obj)
+        elif obj >= -(1 << 15):
+            out += b"\xd1" + struct.pack(">h", obj)
+        elif obj >= -(1 << 31):
+            out += b"\xd2" + struct.pack(">i", obj)
+        else:
+            out += b"\xd3" + struct.pack(">q", obj)
+    elif isinstance(obj, float):
+        out += b"\xcb" + struct.pack(">d", obj)
+    elif isinstance(obj, str):
+        index = STRING_IDS.get(obj)
+        if index is not None:
+            refs.add(index)
+            if index < 1 << 8:
+                out += struct.pack(">BbB", 0xD4, EXT_STRING, index)
+            else:
+                out += struct.pack(">BbH", 0xD5, EXT_STRING, index)
+        else:
+            _pack_raw_str(obj, out)
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 16:
+            out.append(0x80 | size)
+        elif size < 1 << 16:
+            out += struct.pack(">BH", 0xDE, size)
+        else:
+            out += struct.pack(">BI", 0xDF, size)
+        for key, value in obj.items():
+            # 與 JSON 相同：非字串的鍵（例如事件編號）轉成字串
+            _pack(key if isinstance(key, str) else _json_key(key), out, refs)
+            _pack(value, out, refs)
+    elif isinstance(obj, (list, tuple)):
+        _pack_array_header(len(obj), out)
+        for item in obj:
+            _pack(item, out, refs)
+    else:
+        raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+
+def _json_key(key: Any) -> str:
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    return str(key)
+
+
+def pack(obj: Any) -> tuple[bytes, frozenset[int]]:
+    """編碼一則訊息，回傳 (位元組, 用到的字串編號)"""
+    out = bytearray()
+    refs: set[int] = set()
+    _pack(obj, out, refs)
+    return bytes(out), frozenset(refs)
+
+
+def definitions(ids: Iterable[int]) -> bytes:
+    """字串表定義訊息（連線第一次用到這些編號前送出）"""
+    out = bytearray(b"\x82")
+    for text in ("type", "strings", "table"):
+        _pack_raw_str(text, out)
+    table = sorted(ids)
+    _pack_array_header(len(table), out)
+    for index in table:
+        _pack_array_header(2, out)
+        _pack(index, out, set())
+        _pack_raw_str(STRINGS[index], out)
+    return bytes(out)
+
+
+def _pack_array_header(size: int, out: bytearray):
+    if size < 16:
+        out.append(0x90 | size)
+    elif size < 1 << 16:
+        out += struct.pack(">BH", 0xDC, size)
+    else:
+        out += struct.pack(">BI", 0xDD, size)
+
+
+def _pack_raw_str(text: str, out: bytearray):
+    """不查字串表的文字（定義本身不能再寫成編號）"""
+    data = text.encode("utf-8")
+    size = len(data)
+    if size < 32:
+        out.append(0xA0 | size)
+    elif size < 1 << 8:
+        out += struct.pack(">BB", 0xD9, size)
+    elif size < 1 << 16:
+        out += struct.pack(">BH", 0xDA, size)
+    else:
+        out += struct.pack(">BI", 0xDB, size)
+    out += data
@@ -0,0 +1,35 @@
+"""測試共用的替身物件"""
+import asyncio
+import json
+
+
+class FakeSocket:
+    """代替 WebSocket：記錄送出的內容；gate 未開啟前 send 會卡住（模擬慢速連線）"""
+
+    def __init__(self, blocked: bool = False):
+        self.sent: list = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    def messages(self) -> list[dict]:
+        """已送出的 JSON 訊息"""
+        return [json.loads(text) for text in self.sent if isinstance(text, str)]
+
+
+async def settle(rounds: int = 20):
+    """讓 writer task 把佇列中的訊息送完"""
+    for _ in range(rounds):
+        await asyncio.sleep(0)
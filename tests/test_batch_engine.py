@@ -0,0 +1,54 @@
+"""向量化批次引擎（server.batch_engine）：逐場對照 GameEngine、批次重播、CLI 自我檢查"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from server import batch_engine, simulate  # noqa: E402
+from server.batch_engine import ABILITY_POLICIES, STRATEGIES, cross_check  # noqa: E402
+from server.game_log import record_games, replay  # noqa: E402
+from server.simulate import SimulationConfig  # noqa: E402
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("ability", ABILITY_POLICIES)
+def test_cross_check_matches_game_engine(strategy, ability):
+    for players in (6, 7, 8):
+        assert cross_check(60, players, strategy, ability, seed=players) == []
+
+
+def test_replay_logs_matches_engine_replay():
+    logs = record_games(200, seed=5)
+    engines = [replay(log) for log in logs]
+    seen = 0
+    for indices, batch in batch_engine.replay_logs(logs):
+        for k, i in enumerate(indices.tolist()):
+            engine = engines[i]
+            assert int(batch.fear[k]) == engine.state.social_fear
+            assert int(batch.flow[k]) == engine.state.thought_flow
+            assert batch.risk[k].tolist() == [p.risk for p in engine.players.values()]
+            seen += 1
+    assert seen == len(logs)
+
+
+def test_sharded_results_do_not_depend_on_workers():
+    one = batch_engine.simulate_batch_sharded(3000, seed=11, workers=1)
+    two = batch_engine.simulate_batch_sharded(3000, seed=11, workers=2)
+    assert one.to_dict()["endings"] == two.to_dict()["endings"]
+    assert one.risk_by_role == two.risk_by_role
+
+
+def test_simulate_uses_batch_engine_when_numpy_is_available():
+    assert simulate.resolve_engine("auto") == "batch"
+    config = SimulationConfig(strategy="role", ability="role")
+    batch = simulate.simulate_sharded(20000, config, seed=1, workers=1)
+    scalar = simulate.simulate_sharded(3000, config, seed=1, workers=1, engine="scalar")
+    assert batch.games == 20000 and scalar.games == 3000
+    # 規則相同：兩種引擎的被帶走比例接近
+    assert batch.to_dict()["taken_away_rate"] == pytest.approx(scalar.to_dict()["taken_away_rate"], abs=0.03)
+
+
+def test_cli_self_check(capsys):
+    batch_engine.main(["--games", "5000", "--workers", "1", "--seed", "1", "--check", "100"])
+    captured = capsys.readouterr()
+    assert "0 場不一致" in captured.err
+    assert "模擬 5000 場" in captured.out
@@ -0,0 +1,122 @@
+"""訊息分派（server.dispatch）：未知類型、身分檢查、schema 型別與預設值"""
+import asyncio
+
+import pytest
+
+from server import outbound
+from server.dispatch import Dispatcher, Session
+from server.room import Room
+
+from .fakes import FakeSocket, settle
+
+
+def make_dispatcher(calls: list) -> Dispatcher:
+    dispatcher = Dispatcher()
+
+    @dispatcher.on("echo", schema={"text": (str, ""), "count": (int, 1)})
+    async def echo(session, msg):
+        calls.append(("echo", msg))
+
+    @dispatcher.on("host_only", role="host", denied_message="只有關主可以這樣做")
+    async def host_only(session, msg):
+        calls.append(("host_only", msg))
+
+    @dispatcher.on("player_only", role="player")
+    async def player_only(session, msg):
+        calls.append(("player_only", msg))
+
+    @dispatcher.on("timer", schema={"seconds": ((int, float), 120)})
+    async def timer(session, msg):
+        calls.append(("timer", msg))
+
+    return dispatcher
+
+
+def run(session_factory, *messages):
+    """依序分派 messages，回傳 (處理器呼叫, 回覆給連線的錯誤訊息)"""
+    async def scenario():
+        ws = FakeSocket()
+        outbound.attach(ws)
+        calls: list = []
+        dispatcher = make_dispatcher(calls)
+        session = session_factory(ws)
+        for message in messages:
+            await dispatcher.dispatch(session, message)
+        await settle()
+        outbound.detach(ws)
+        return calls, [m["message"] for m in ws.messages() if m["type"] == "error"], dispatcher
+
+    return asyncio.run(scenario())
+
+
+def anonymous(ws):
+    return Session(ws)
+
+
+def host(ws):
+    return Session(ws, role="host", room=Room("1234"))
+
+
+def player(ws):
+    return Session(ws, role="player", room=Room("1234"), player_id="p1")
+
+
+def test_schema_defaults_and_types():
+    calls, errors, _ = run(anonymous, {"type": "echo", "text": "hi"}, {"type": "echo", "count": None})
+    assert calls == [("echo", {"text": "hi", "count": 1}), ("echo", {"text": "", "count": 1})]
+    assert errors == []
+
+
+@pytest.mark.parametrize("message", [
+    {"type": "echo", "text": 5},
+    {"type": "echo", "count": "3"},
+    {"type": "echo", "count": True},          # bool 不算 int
+    {"type": "timer", "seconds": "30"},
+])
+def test_schema_rejects_wrong_types(message):
+    calls, errors, _ = run(anonymous, message)
+    assert calls == []
+    assert errors == ["無效的訊息格式"]
+
+
+def test_schema_accepts_type_tuples():
+    calls, _, _ = run(anonymous, {"type": "timer", "seconds": 2.5}, {"type": "timer"})
+    assert calls == [("timer", {"seconds": 2.5}), ("timer", {"seconds": 120})]
+
+
+@pytest.mark.parametrize("message", [{"type": "nope"}, {"type": 3}, {}])
+def test_unknown_type(message):
+    calls, errors, _ = run(anonymous, message)
+    assert calls == []
+    assert len(errors) == 1 and errors[0].startswith("未知訊息類型")
+
+
+def test_role_checks():
+    calls, errors, _ = run(anonymous, {"type": "host_only"}, {"type": "player_only"})
+    assert calls == []
+    # 有 denied_message 的回覆錯誤，沒有的靜默忽略
+    assert errors == ["只有關主可以這樣做"]
+
+    calls, errors, _ = run(player, {"type": "host_only"}, {"type": "player_only"})
+    assert calls == [("player_only", {})]
+    assert errors == ["只有關主可以這樣做"]
+
+    calls, errors, _ = run(host, {"type": "host_only"}, {"type": "player_only"})
+    assert calls == [("host_only", {})]
+    assert errors == []
+
+
+def test_player_role_requires_player_id():
+    calls, _, _ = run(lambda ws: Session(ws, role="player", room=Room("1234")), {"type": "player_only"})
+    assert calls == []
+
+
+def test_duplicate_registration_is_rejected():
+    dispatcher = make_dispatcher([])
+    with pytest.raises(ValueError):
+        dispatcher.on("echo")(lambda session, msg: None)
+
+
+def test_handler_stats_count_calls():
+    _, _, dispatcher = run(anonymous, {"type": "echo"}, {"type": "echo"}, {"type": "echo", "text": 1})
+    assert dispatcher.stats()["echo"]["calls"] == 2
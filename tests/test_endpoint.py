@@ -0,0 +1,101 @@
+"""/ws 端點（server.main）：斷線清理與續玩（含關主）"""
+import pytest
+
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.websockets import WebSocketDisconnect  # noqa: E402
+
+from server.main import CLOSE_CODE_REPLACED, app  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def receive(ws, msg_type: str) -> dict:
+    """略過其他訊息，直到收到 msg_type"""
+    for _ in range(50):
+        msg = ws.receive_json()
+        if msg["type"] == msg_type:
+            return msg
+    raise AssertionError(f"沒有收到 {msg_type}")
+
+
+def create_room(host) -> dict:
+    host.send_json({"type": "create_room"})
+    return receive(host, "room_created")
+
+
+def join(player, code: str, name: str = "小明") -> dict:
+    player.send_json({"type": "join_room", "room_code": code, "player_name": name})
+    return receive(player, "joined")
+
+
+def test_player_disconnect_and_resume(client):
+    with client.websocket_connect("/ws") as host:
+        room = create_room(host)
+        with client.websocket_connect("/ws") as player:
+            joined = join(player, room["room_code"])
+        left = receive(host, "player_disconnected")
+        assert left["player_id"] == joined["player_id"]
+        assert left["players"][0]["connected"] is False
+
+        with client.websocket_connect("/ws") as player:
+            player.send_json({"type": "resume", "token": joined["resume_token"]})
+            resumed = receive(player, "resumed")
+            assert resumed["player_id"] == joined["player_id"]
+            assert receive(host, "player_reconnected")["player_id"] == joined["player_id"]
+
+
+def test_replaced_connection_does_not_detach_new_one(client):
+    with client.websocket_connect("/ws") as host:
+        room = create_room(host)
+        with client.websocket_connect("/ws") as old:
+            joined = join(old, room["room_code"])
+            with client.websocket_connect("/ws") as new:
+                new.send_json({"type": "resume", "token": joined["resume_token"]})
+                receive(new, "resumed")
+                with pytest.raises(WebSocketDisconnect) as closed:
+                    receive(old, "never")
+                assert closed.value.code == CLOSE_CODE_REPLACED
+
+                # 舊連線的斷線處理不能把已續玩的玩家標記為離線
+                with client.websocket_connect("/ws") as other:
+                    join(other, room["room_code"], "小華")
+                    seen = []
+                    while not seen or seen[-1]["type"] != "player_joined" or seen[-1]["player_name"] != "小華":
+                        seen.append(host.receive_json())
+                    assert "player_disconnected" not in [m["type"] for m in seen]
+                    assert seen[-1]["players"][0] == {"id": joined["player_id"], "name": "小明", "connected": True}
+
+
+def test_host_disconnect_and_resume(client):
+    with client.websocket_connect("/ws") as player:
+        with client.websocket_connect("/ws") as host:
+            room = create_room(host)
+            join(player, room["room_code"])
+        receive(player, "host_disconnected")
+
+        with client.websocket_connect("/ws") as host:
+            host.send_json({"type": "resume", "token": room["resume_token"]})
+            resumed = receive(host, "host_resumed")
+            assert resumed["room_code"] == room["room_code"]
+            assert [p["name"] for p in resumed["players"]] == ["小明"]
+            assert "host_view" in resumed
+            receive(player, "host_reconnected")
+
+            # 接回後可以繼續主持
+            host.send_json({"type": "start_game"})
+            receive(host, "error")          # 人數不足，但已被認得是關主
+
+
+def test_forged_token_is_rejected(client):
+    with client.websocket_connect("/ws") as host:
+        room = create_room(host)
+        code = room["room_code"]
+        with client.websocket_connect("/ws") as other:
+            other.send_json({"type": "resume", "token": f"{code}.host.forged"})
+            assert receive(other, "resume_failed")["message"]
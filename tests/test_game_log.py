@@ -0,0 +1,106 @@
+"""指令紀錄與重播（server.game_log）"""
+import random
+
+import pytest
+
+from server import game_log
+from server.game_engine import GameEngine
+from server.game_log import GameLog, ReplayMismatch, get_varint, put_varint, records, replay
+from server.models import EVENTS, GamePhase, Player
+from server.simulate import SimulationConfig, play_game
+
+
+def snapshot(engine: GameEngine):
+    """比對用：全域狀態與每位玩家的可觀察欄位"""
+    players = [
+        (p.id, p.name, p.role_id, p.risk, p.connected, p.taken_away, p.ability_used, dict(p.votes),
+         [(fs.ftype, fs.event_number) for fs in p.foreshadows])
+        for p in engine.players.values()
+    ]
+    return vars(engine.state).copy(), players
+
+
+def played_game(seed: int, strategy: str = "role", ability: str = "role") -> GameEngine:
+    rng = random.Random(seed)
+    engine = GameEngine(rng)
+    engine.log = GameLog()
+    for j in range(rng.choice((6, 7, 8))):
+        engine.add_player(Player(id=f"p{j}", name=f"玩家{j}"))
+    play_game(engine, SimulationConfig(strategy=strategy, ability=ability), rng)
+    return engine
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 1 << 21, (1 << 63) - 1])
+def test_varint_roundtrip(value):
+    buf = bytearray()
+    put_varint(buf, value)
+    assert get_varint(bytes(buf) + b"\xff", 0) == (value, len(buf))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_replay_rebuilds_engine_state(seed):
+    engine = played_game(seed, *(("role", "role"), ("random", "random"), ("resist", "early"))[seed % 3])
+    rebuilt = replay(bytes(engine.log))
+    assert snapshot(rebuilt) == snapshot(engine)
+
+
+def test_records_decode_known_ops():
+    log = GameLog()
+    log.join("p0", "小明")
+    log.next_event()
+    log.phase(GamePhase.VOTING)
+    log.vote("p0", EVENTS[0].choices[1].key)
+    log.foreshadows({"p0": [True, False, True]})
+    assert list(records(bytes(log))) == [
+        (game_log.OP_JOIN, ("p0", "小明")),
+        (game_log.OP_NEXT_EVENT, ()),
+        (game_log.OP_PHASE, (list(GamePhase).index(GamePhase.VOTING),)),
+        (game_log.OP_VOTE, (0, 1)),
+        (game_log.OP_FORESHADOWS, ((True, False, True),)),
+    ]
+    assert log.records == 5
+
+
+def test_resume_continues_the_same_log():
+    engine = played_game(1)
+    data = bytes(engine.log)
+    rebuilt = replay(data, resume=True)
+    assert bytes(rebuilt.log) == data
+    assert rebuilt.log.records == sum(1 for _ in records(data))
+    assert rebuilt.log.players == engine.log.players
+
+    # 接續記錄的內容與原本的引擎記下的相同
+    engine.count_note("p0")
+    rebuilt.count_note("p0")
+    assert bytes(rebuilt.log) == bytes(engine.log)
+
+
+def test_strict_replay_detects_changed_outcomes():
+    log = GameLog()
+    ids = [f"p{i}" for i in range(6)]
+    for pid in ids:
+        log.join(pid, pid)
+    log.roles(dict(zip(ids, "ABCDEE")))
+    log.next_event()
+    log.phase(GamePhase.VOTING)
+    for pid in ids[:5]:
+        log.vote(pid, EVENTS[0].choices[0].key)
+    log.auto_evade([])          # 與規則不符：p5 沒有投票，應被自動迴避
+    log.settle()
+
+    with pytest.raises(ReplayMismatch):
+        replay(bytes(log))
+    engine = replay(bytes(log), strict=False)
+    assert engine.players["p5"].votes
+
+
+def test_unknown_op_is_rejected():
+    with pytest.raises(ValueError):
+        list(records(bytes([game_log.LOG_FORMAT, 0xEE])))
+
+
+def test_cli_self_check(capsys):
+    pytest.importorskip("numpy")
+    game_log.main(["--games", "300", "--seed", "3"])
+    out = capsys.readouterr().out
+    assert "✅ 批次與逐筆重播結果一致" in out
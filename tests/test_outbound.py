@@ -0,0 +1,109 @@
+"""連線發送佇列（server.outbound）：高水位、狀態訊息合併、溢位斷線、精簡格式"""
+import asyncio
+
+from server import outbound, wire
+from server.outbound import CLOSE_CODE_OVERLOADED, EncodedMessage, Outbox
+
+from .fakes import FakeSocket, settle
+
+
+def msg(msg_type: str, **data) -> EncodedMessage:
+    return EncodedMessage({"type": msg_type, **data})
+
+
+def test_high_water_marks_lagging_until_drained():
+    async def scenario():
+        ws = FakeSocket(blocked=True)
+        box = Outbox(ws, max_depth=16, high_water=4)
+        for i in range(4):
+            assert box.put(msg("tick", n=i))
+        assert box.lagging
+        assert box.peak_depth == 4
+
+        ws.gate.set()
+        await settle()
+        assert box.depth == 0
+        assert not box.lagging
+        assert box.sent == 4
+        box.detach()
+
+    asyncio.run(scenario())
+
+
+def test_state_messages_coalesce_to_latest():
+    async def scenario():
+        ws = FakeSocket(blocked=True)
+        box = Outbox(ws)
+        box.put(msg("player_list", players=[1]))
+        box.put(msg("tick"))
+        box.put(msg("player_list", players=[1, 2]))
+        assert box.depth == 2
+        assert box.coalesced == 1
+
+        ws.gate.set()
+        await settle()
+        assert ws.sent == [msg("tick").text, msg("player_list", players=[1, 2]).text]
+        box.detach()
+
+    asyncio.run(scenario())
+
+
+def test_non_state_messages_are_not_coalesced():
+    async def scenario():
+        box = Outbox(FakeSocket(blocked=True))
+        box.put(msg("tick", n=1))
+        box.put(msg("tick", n=2))
+        assert box.depth == 2
+        assert box.coalesced == 0
+        box.detach()
+
+    asyncio.run(scenario())
+
+
+def test_overflow_disconnects_with_overloaded_code():
+    async def scenario():
+        ws = FakeSocket(blocked=True)
+        box = Outbox(ws, max_depth=3, high_water=2)
+        assert all(box.put(msg("tick", n=i)) for i in range(3))
+        assert not box.put(msg("tick", n=3))
+        assert box.closed
+        assert box.depth == 0
+        assert box.dropped == 4
+        await asyncio.sleep(0)
+        assert ws.closed_with == CLOSE_CODE_OVERLOADED
+        assert not box.put(msg("tick"))
+
+    asyncio.run(scenario())
+
+
+def test_compact_connection_sends_string_definitions_once():
+    async def scenario():
+        ws = FakeSocket()
+        box = Outbox(ws, compact=True)
+        text = wire.STRINGS[0]
+        box.put(msg("narrative", text=text))
+        box.put(msg("narrative", text=text))
+        await settle()
+
+        data, refs = msg("narrative", text=text).packed
+        assert refs == {0}
+        assert ws.sent == [wire.definitions(refs), data, data]
+        assert box.stats()["format"] == "msgpack"
+        box.detach()
+
+    asyncio.run(scenario())
+
+
+def test_module_helpers_ignore_detached_connections():
+    async def scenario():
+        ws = FakeSocket()
+        box = outbound.attach(ws)
+        assert outbound.get(ws) is box
+        assert outbound.attach(ws) is box
+        outbound.detach(ws)
+        assert outbound.get(ws) is None
+        assert not outbound.put(ws, msg("tick"))
+        await outbound.close(ws)
+        assert ws.closed_with is None
+
+    asyncio.run(scenario())
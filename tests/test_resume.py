@@ -0,0 +1,72 @@
+"""斷線續玩憑證（server.resume）"""
+import asyncio
+import random
+
+import pytest
+
+from server import resume, state
+from server.resume import HOST_ID, ResumeTokens
+from server.room import RoomManager
+from server.snapshot import Snapshotter, SnapshotStore
+
+
+def test_issue_and_verify_roundtrip():
+    tokens = ResumeTokens(b"secret")
+    token = tokens.issue("1234", "ab12cd34")
+    assert token.startswith("1234.ab12cd34.")
+    assert tokens.verify(token) == ("1234", "ab12cd34")
+    assert tokens.verify(tokens.issue("1234", HOST_ID)) == ("1234", HOST_ID)
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda t: t[:-1] + ("A" if t[-1] != "A" else "B"),   # 簽章被改
+    lambda t: t.replace("1234", "1235", 1),               # 房間碼被改
+    lambda t: t.replace("ab12cd34", HOST_ID),             # 冒充關主
+    lambda t: t + ".extra",
+    lambda t: "garbage",
+    lambda t: "",
+])
+def test_tampered_tokens_are_rejected(mutate):
+    tokens = ResumeTokens(b"secret")
+    assert tokens.verify(mutate(tokens.issue("1234", "ab12cd34"))) is None
+
+
+def test_tokens_from_another_secret_are_rejected():
+    token = ResumeTokens(b"one").issue("1234", "ab12cd34")
+    assert ResumeTokens(b"two").verify(token) is None
+
+
+def test_tokens_from_env(monkeypatch):
+    monkeypatch.setenv("SILENT_ISLAND_RESUME_SECRET", "configured")
+    tokens = resume.tokens_from_env()
+    assert tokens.configured and tokens.secret == b"configured"
+    monkeypatch.delenv("SILENT_ISLAND_RESUME_SECRET")
+    assert not resume.tokens_from_env().configured
+
+
+def test_persist_secret_survives_restart_via_snapshot(tmp_path):
+    path = str(tmp_path / "rooms.db")
+
+    async def start() -> bytes:
+        tokens = resume.tokens_from_env()
+        manager = RoomManager(random.Random())
+        snapshots = Snapshotter(SnapshotStore(path), manager)
+        await resume.persist_secret(tokens, manager.backend, snapshots)
+        await snapshots.close()
+        return tokens.secret
+
+    first = asyncio.run(start())
+    assert asyncio.run(start()) == first
+
+
+def test_persist_secret_keeps_configured_and_memory_only_secrets():
+    async def scenario():
+        configured = ResumeTokens(b"fixed", configured=True)
+        await resume.persist_secret(configured, state.MemoryBackend(), None)
+        assert configured.secret == b"fixed"
+
+        random_secret = ResumeTokens(b"random")
+        await resume.persist_secret(random_secret, state.MemoryBackend(), None)
+        assert random_secret.secret == b"random"
+
+    asyncio.run(scenario())
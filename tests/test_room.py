@@ -0,0 +1,131 @@
+"""房間碼配置器與閒置回收（server.room）"""
+import random
+
+import pytest
+
+from server.models import GamePhase
+from server.room import ROOM_TTL, ROOM_TTL_DEFAULT, RoomCodeAllocator, RoomManager
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# ── 房間碼配置器 ──────────────────────────────────────
+
+def test_allocator_hands_out_every_code_once():
+    codes = RoomCodeAllocator(random.Random(1), length=3, alphabet="0123456789")
+    seen = {codes.allocate() for _ in range(codes.capacity)}
+    assert len(seen) == 1000
+    assert all(len(code) == 3 and code.isdigit() for code in seen)
+    assert codes.free == 0
+    assert codes.allocate() is None
+
+
+def test_allocator_release_returns_code_to_pool():
+    codes = RoomCodeAllocator(random.Random(2), length=2, alphabet="AB")
+    allocated = [codes.allocate() for _ in range(4)]
+    assert sorted(allocated) == ["AA", "AB", "BA", "BB"]
+    codes.release("BA")
+    assert codes.in_use == 3
+    assert codes.allocate() == "BA"
+    assert codes.allocate() is None
+
+
+def test_allocator_only_remembers_swapped_slots():
+    codes = RoomCodeAllocator(random.Random(3), length=6, alphabet="0123456789")
+    for _ in range(100):
+        codes.allocate()
+    assert len(codes._slots) <= 100
+
+
+def test_allocator_encode_decode_and_normalize():
+    codes = RoomCodeAllocator(random.Random(), length=5, alphabet="23456789ABCDEFGHJKMNPQRSTUVWXYZ")
+    for index in (0, 1, 12345, codes.capacity - 1):
+        assert codes.decode(codes.encode(index)) == index
+    assert codes.decode("ABC") is None      # 長度不符
+    assert codes.decode("A0BCD") is None    # 不在字母表
+    assert codes.normalize(" ab2cd ") == "AB2CD"
+
+
+@pytest.mark.parametrize("length, alphabet", [(0, "0123"), (4, "0"), (4, "0012")])
+def test_allocator_rejects_invalid_settings(length, alphabet):
+    with pytest.raises(ValueError):
+        RoomCodeAllocator(random.Random(), length=length, alphabet=alphabet)
+
+
+# ── 閒置回收 ──────────────────────────────────────────
+
+def test_reap_removes_idle_rooms_per_phase_ttl():
+    clock = Clock()
+    manager = RoomManager(random.Random(4), clock=clock)
+    reaped_rooms, removed = [], []
+    manager.on_reap(reaped_rooms.append)
+    manager.on_remove(removed.append)
+
+    waiting = manager.create_room()
+    playing = manager.create_room()
+    playing.engine.state.phase = GamePhase.VOTING
+
+    clock.now += ROOM_TTL[GamePhase.WAITING] + 1
+    assert manager.reap() == [waiting]
+    assert reaped_rooms == [waiting]
+    assert removed == [waiting.code]
+    assert waiting.code not in manager.rooms
+    assert manager.evictions == {"waiting": 1}
+    # 房間碼歸還給配置器
+    assert manager.codes.in_use == 1
+
+    clock.now += ROOM_TTL_DEFAULT
+    assert manager.reap() == [playing]
+    assert manager.rooms == {}
+
+
+def test_activity_postpones_reaping():
+    clock = Clock()
+    manager = RoomManager(random.Random(5), clock=clock)
+    room = manager.create_room()
+    ttl = ROOM_TTL[GamePhase.WAITING]
+
+    clock.now += ttl - 10
+    manager.touch(room)
+    clock.now += 20
+    assert manager.reap() == []       # 到期時重新計算並延後
+    clock.now += ttl
+    assert manager.reap() == [room]
+
+
+def test_create_room_reaps_before_rejecting():
+    clock = Clock()
+    manager = RoomManager(random.Random(6), clock=clock, max_rooms=2)
+    manager.create_room()
+    second = manager.create_room()
+    assert manager.create_room() is None
+    assert manager.rejected == 1
+
+    clock.now += ROOM_TTL[GamePhase.WAITING] + 1
+    manager.touch(second)
+    room = manager.create_room()
+    assert room is not None
+    assert manager.evictions == {"waiting": 1}
+    assert set(manager.rooms) == {second.code, room.code}
+
+
+def test_create_room_rejects_when_codes_run_out():
+    manager = RoomManager(random.Random(7), code_length=1, code_alphabet="01")
+    assert {manager.create_room().code, manager.create_room().code} == {"0", "1"}
+    assert manager.create_room() is None
+    assert manager.stats()["rejected"] == 1
+
+
+def test_code_filter_skips_foreign_codes():
+    manager = RoomManager(random.Random(8), code_length=2, code_alphabet="0123456789")
+    manager.code_filter = lambda code: code.endswith("7")
+    codes = {manager.create_room().code for _ in range(10)}
+    assert codes == {f"{d}7" for d in range(10)}
+    # 跳過的代碼已歸還
+    assert manager.codes.in_use == 10
@@ -0,0 +1,187 @@
+"""共享狀態後端（server.state.SharedBackend）：以本機 RESP 替身測試房間鎖與版本同步"""
+import asyncio
+import random
+from contextlib import asynccontextmanager
+
+import pytest
+
+from server import state
+from server.resp import RespClient, RespError, encode_command
+from server.resp_server import RespStandIn
+from server.room import RoomManager
+from server.state import LockTimeout, SharedBackend
+
+
+@asynccontextmanager
+async def stand_in():
+    """在隨機埠啟動 RESP 替身，回傳連到它的 URL"""
+    server = await asyncio.start_server(RespStandIn().serve_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        yield f"redis://127.0.0.1:{port}/0"
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def with_backends(count: int):
+    """以 count 個各自連線的 SharedBackend 執行測試協程"""
+    def decorator(scenario):
+        def test():
+            async def main():
+                async with stand_in() as url:
+                    backends = [SharedBackend(RespClient(url)) for _ in range(count)]
+                    try:
+                        await scenario(*backends)
+                    finally:
+                        for backend in backends:
+                            await backend.close()
+            asyncio.run(main())
+        test.__name__ = scenario.__name__
+        return test
+    return decorator
+
+
+def test_encode_command():
+    assert encode_command("SET", "k", b"v", 5) == b"*4\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\nv\r\n$1\r\n5\r\n"
+
+
+@with_backends(1)
+async def test_resp_errors_are_raised(backend):
+    with pytest.raises(RespError):
+        await backend.client.execute("NOSUCHCOMMAND")
+
+
+@with_backends(2)
+async def test_claim_is_exclusive(a, b):
+    assert await a.claim("1234", b"room-a", 60_000)
+    assert not await b.claim("1234", b"room-b", 60_000)
+    assert await b.load("1234") == (0, b"room-a")
+    assert await b.version("1234") == 0
+    assert await b.version("9999") is None
+
+
+@with_backends(1)
+async def test_save_bumps_version_and_delete_removes(backend):
+    await backend.claim("1234", b"v0", 60_000)
+    await backend.save("1234", 1, b"v1", 60_000)
+    assert await backend.load("1234") == (1, b"v1")
+    await backend.delete("1234")
+    assert await backend.load("1234") is None
+
+
+@with_backends(2)
+async def test_lock_is_mutually_exclusive(a, b):
+    order = []
+
+    async def worker(backend, name):
+        async with backend.lock("1234"):
+            order.append(f"{name}+")
+            await asyncio.sleep(0.05)
+            order.append(f"{name}-")
+
+    await asyncio.gather(worker(a, "a"), worker(b, "b"))
+    assert order in (["a+", "a-", "b+", "b-"], ["b+", "b-", "a+", "a-"])
+
+
+@with_backends(2)
+async def test_expired_lock_release_keeps_new_owner(a, b):
+    original = state.LOCK_TTL_MS
+    state.LOCK_TTL_MS = 200
+    try:
+        b_holds, release_b = asyncio.Event(), asyncio.Event()
+
+        async def hold(backend):
+            async with backend.lock("1234"):
+                b_holds.set()
+                await release_b.wait()
+
+        async with a.lock("1234"):
+            await asyncio.sleep(0.25)                # a 持有超過 TTL：鎖已到期
+            task = asyncio.create_task(hold(b))      # 另一個 worker 取得鎖
+            await b_holds.wait()
+        # a 離開時只能刪除自己的 token，b 仍持有鎖
+        assert await a.client.execute("GET", "si:lock:1234") is not None
+        release_b.set()
+        await task
+        assert await a.client.execute("GET", "si:lock:1234") is None
+    finally:
+        state.LOCK_TTL_MS = original
+
+
+@with_backends(2)
+async def test_lock_wait_times_out(a, b):
+    original = state.LOCK_WAIT
+    state.LOCK_WAIT = 0.1
+    try:
+        async with a.lock("1234"):
+            with pytest.raises(LockTimeout):
+                async with b.lock("1234"):
+                    pass
+    finally:
+        state.LOCK_WAIT = original
+
+
+@with_backends(2)
+async def test_secret_first_writer_wins(a, b):
+    assert await a.secret("resume", b"first") == b"first"
+    assert await b.secret("resume", b"second") == b"first"
+
+
+@with_backends(2)
+async def test_checkout_reloads_when_version_changes(a, b):
+    worker_a = RoomManager(random.Random(1), backend=a, worker_id="a")
+    worker_b = RoomManager(random.Random(2), backend=b, worker_id="b")
+
+    room_a = await worker_a.create()
+    room_b = await worker_b.find(room_a.code)
+    assert room_b is not None and not room_b.owns_code
+
+    async with worker_b.checkout(room_b):
+        player = room_b.add_player("小明")
+    assert room_b.version == 1
+    assert await b.version(room_a.code) == 1
+
+    # worker a 的副本仍是版本 0：checkout 時發現版本不同而重新載入
+    assert room_a.player_count == 0
+    async with worker_a.checkout(room_a):
+        assert list(room_a.engine.players) == [player.id]
+        room_a.started = True
+    assert room_a.version == 2
+
+    # 沒有變更時不寫回、不遞增版本
+    async with worker_b.checkout(room_b):
+        assert room_b.started
+    assert room_b.version == 2
+
+
+@with_backends(2)
+async def test_checkout_serializes_workers(a, b):
+    worker_a = RoomManager(random.Random(3), backend=a, worker_id="a")
+    worker_b = RoomManager(random.Random(4), backend=b, worker_id="b")
+    room_a = await worker_a.create()
+    room_b = await worker_b.find(room_a.code)
+
+    async def join(manager, room, name):
+        async with manager.checkout(room):
+            room.add_player(name)
+            await asyncio.sleep(0.02)
+
+    await asyncio.gather(*(join(worker_a, room_a, f"a{i}") for i in range(3)),
+                         *(join(worker_b, room_b, f"b{i}") for i in range(3)))
+    final = await worker_a.find(room_a.code)
+    assert sorted(p.name for p in final.engine.players.values()) == ["a0", "a1", "a2", "b0", "b1", "b2"]
+    assert final.version == 6
+
+
+@with_backends(1)
+async def test_failed_checkout_forces_reload(backend):
+    manager = RoomManager(random.Random(5), backend=backend, worker_id="a")
+    room = await manager.create()
+    with pytest.raises(RuntimeError):
+        async with manager.checkout(room):
+            room.add_player("半途")
+            raise RuntimeError("handler failed")
+    assert room.version == -1
+    async with manager.checkout(room):
+        assert room.player_count == 0       # 重新載入，丟掉只改了一半的狀態
@@ -0,0 +1,144 @@
+"""房間狀態快照（server.snapshot）：寫入、重新啟動後恢復、寫入失敗重試"""
+import asyncio
+import random
+import zlib
+
+import pytest
+
+from server import state
+from server.models import EVENTS, GamePhase
+from server.room import RoomManager
+from server.snapshot import Snapshotter, SnapshotStore, decode_room, encode_room
+
+
+def play_one_round(room):
+    for i in range(6):
+        room.add_player(f"玩家{i}")
+    room.engine.assign_roles()
+    room.started = True
+    room.engine.get_next_event()
+    room.engine.set_phase(GamePhase.VOTING)
+    for player_id in room.engine.players:
+        room.engine.submit_vote(player_id, EVENTS[0].choices[0].key)
+    room.engine.settle_round()
+
+
+def start(path, seed=1):
+    manager = RoomManager(random.Random(seed))
+    snapshots = Snapshotter(SnapshotStore(path), manager, interval=3600)
+    manager.on_change(snapshots.changed)
+    manager.on_remove(snapshots.removed)
+    return manager, snapshots
+
+
+def test_encode_decode_room_roundtrip():
+    manager = RoomManager(random.Random(1))
+    room = manager.create_room()
+    play_one_round(room)
+    data = state.room_to_dict(room)
+    text, rng = encode_room(data)
+    assert decode_room(zlib.compress(text), rng) == data
+
+
+def test_rooms_survive_restart(tmp_path):
+    path = str(tmp_path / "rooms.db")
+
+    async def first_run():
+        manager, snapshots = start(path)
+        room = manager.create_room()
+        async with manager.checkout(room):
+            play_one_round(room)
+        await snapshots.flush()
+        assert snapshots.stats()["rooms_written"] == 1
+        expected = state.room_to_dict(room)
+        await snapshots.close()
+        return room.code, expected
+
+    async def second_run():
+        manager, snapshots = start(path, seed=2)
+        assert snapshots.restore() == 1
+        room = manager.rooms[code]
+        restored = state.room_to_dict(room)
+        await snapshots.close()
+        return room, restored
+
+    code, expected = asyncio.run(first_run())
+    room, restored = asyncio.run(second_run())
+
+    # 重新啟動後所有人視為斷線（記入指令紀錄），其餘狀態與 RNG 完全相同
+    assert all(not p.connected for p in room.engine.players.values())
+    assert restored["state"] == expected["state"]
+    assert restored["rng"] == expected["rng"]
+    assert restored["started"] and not room.owns_code
+    for before, after in zip(expected["players"], restored["players"]):
+        assert dict(before, connected=False) == after
+    assert room.host_ws is None and room.player_ws == {}
+
+
+def test_unchanged_rooms_are_not_rewritten(tmp_path):
+    async def scenario():
+        manager, snapshots = start(str(tmp_path / "rooms.db"))
+        room = manager.create_room()
+        async with manager.checkout(room):
+            room.add_player("小明")
+        await snapshots.flush()
+        async with manager.checkout(room):
+            pass
+        await snapshots.flush()
+        assert snapshots.rooms_written == 1
+        await snapshots.close()
+
+    asyncio.run(scenario())
+
+
+def test_removed_rooms_are_deleted(tmp_path):
+    path = str(tmp_path / "rooms.db")
+
+    async def scenario():
+        manager, snapshots = start(path)
+        room = manager.create_room()
+        async with manager.checkout(room):
+            room.add_player("小明")
+        await snapshots.flush()
+        manager.remove_room(room.code)
+        await snapshots.flush()
+        await snapshots.close()
+
+    asyncio.run(scenario())
+    assert SnapshotStore(path).load_all() == []
+
+
+def test_failed_write_is_retried(tmp_path):
+    async def scenario():
+        manager, snapshots = start(str(tmp_path / "rooms.db"))
+        room = manager.create_room()
+        async with manager.checkout(room):
+            room.add_player("小明")
+
+        def disk_full(rows, deleted):
+            raise OSError("disk full")
+
+        write, snapshots.store.write = snapshots.store.write, disk_full
+        with pytest.raises(OSError):
+            await snapshots.flush()
+        # 寫入失敗不記為已寫入，房間仍待寫入
+        assert snapshots.stats()["tracked"] == 0
+        assert snapshots.stats()["pending"] == 1
+
+        snapshots.store.write = write
+        await snapshots.flush()
+        assert snapshots.stats()["tracked"] == 1
+        assert [code for code, _, _ in snapshots.store.load_all()] == [room.code]
+        await snapshots.close()
+
+    asyncio.run(scenario())
+
+
+def test_secret_is_stored_once(tmp_path):
+    async def scenario():
+        _, snapshots = start(str(tmp_path / "rooms.db"))
+        assert await snapshots.secret("resume", b"first") == b"first"
+        assert await snapshots.secret("resume", b"second") == b"first"
+        await snapshots.close()
+
+    asyncio.run(scenario())
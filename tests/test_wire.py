@@ -0,0 +1,96 @@
+"""精簡傳輸格式編碼器（server.wire）"""
+import struct
+
+import pytest
+
+from server import wire
+from server.wire import EXT_STRING, STRING_IDS, STRINGS
+
+
+def packed(obj) -> bytes:
+    return wire.pack(obj)[0]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, b"\xc0"),
+    (True, b"\xc3"),
+    (False, b"\xc2"),
+    (0, b"\x00"),
+    (127, b"\x7f"),
+    (-1, b"\xff"),
+    (-32, b"\xe0"),
+    (128, b"\xcc\x80"),
+    (256, b"\xcd\x01\x00"),
+    (1 << 16, b"\xce\x00\x01\x00\x00"),
+    (1 << 32, b"\xcf" + struct.pack(">Q", 1 << 32)),
+    (-33, b"\xd0\xdf"),
+    (-200, b"\xd1" + struct.pack(">h", -200)),
+    (-(1 << 20), b"\xd2" + struct.pack(">i", -(1 << 20))),
+    (-(1 << 40), b"\xd3" + struct.pack(">q", -(1 << 40))),
+    (1.5, b"\xcb" + struct.pack(">d", 1.5)),
+    ("ok", b"\xa2ok"),
+    ("", b"\xa0"),
+    ([1, 2], b"\x92\x01\x02"),
+    ((), b"\x90"),
+    ({"a": 1}, b"\x81\xa1a\x01"),
+])
+def test_msgpack_scalars_and_containers(value, expected):
+    assert packed(value) == expected
+
+
+def test_long_strings_use_wider_headers():
+    text = "x" * 40
+    assert packed(text) == b"\xd9\x28" + text.encode()
+    text = "y" * 300
+    assert packed(text) == b"\xda\x01\x2c" + text.encode()
+
+
+def test_large_containers_use_wider_headers():
+    assert packed(list(range(16)))[:3] == b"\xdc\x00\x10"
+    assert packed({str(i): i for i in range(16)})[:3] == b"\xde\x00\x10"
+
+
+def test_non_string_keys_follow_json():
+    assert packed({1: "a", None: "c"}) == packed({"1": "a", "null": "c"})
+    assert packed({True: "b"}) == packed({"true": "b"})
+
+
+def test_unsupported_types_raise():
+    with pytest.raises(TypeError):
+        wire.pack({"x": object()})
+
+
+def test_table_strings_become_ext_references(monkeypatch):
+    text = STRINGS[0]
+    data, refs = wire.pack({"text": text})
+    assert refs == {0}
+    assert data == b"\x81\xa4text" + struct.pack(">BbB", 0xD4, EXT_STRING, 0)
+
+    # 編號 ≥ 256 時改用兩位元組
+    monkeypatch.setitem(STRING_IDS, "一段假裝排在很後面的文字", 300)
+    data, refs = wire.pack(["一段假裝排在很後面的文字"])
+    assert refs == {300}
+    assert data == b"\x91" + struct.pack(">BbH", 0xD5, EXT_STRING, 300)
+
+
+def test_short_or_unknown_strings_stay_inline():
+    assert all(len(text.encode()) >= wire.MIN_TABLE_BYTES for text in STRINGS)
+    assert wire.pack("不在字串表裡的一段文字")[1] == frozenset()
+
+
+def test_string_table_is_unique_and_stable():
+    assert len(STRINGS) == len(set(STRINGS)) == len(STRING_IDS)
+    assert wire._build_table([["重複的一段很長的文字", "重複的一段很長的文字", "另一段很長的文字內容"]]) == [
+        "重複的一段很長的文字", "另一段很長的文字內容",
+    ]
+
+
+def test_definitions_message():
+    text = STRINGS[3]
+    body = text.encode()
+    header = bytes([0xA0 | len(body)]) if len(body) < 32 else (
+        b"\xd9" + bytes([len(body)]) if len(body) < 256 else b"\xda" + struct.pack(">H", len(body))
+    )
+    assert wire.definitions([3]) == b"\x82\xa4type\xa7strings\xa5table\x91\x92\x03" + header + body
+    # 定義訊息本身不能再引用字串表
+    assert wire.definitions([]) == b"\x82\xa4type\xa7strings\xa5table\x90"